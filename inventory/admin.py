@@ -1,5 +1,6 @@
-from django.contrib import admin
-from .models import MasterItem, POHeader, POItem, ReceivedPOItem, Sale, JSTStockSnapshot, POReceiptBatch
+from django.contrib import admin, messages
+from .models import MasterItem, POHeader, POItem, ReceivedPOItem, Sale, JSTStockSnapshot, POReceiptBatch, CurrencyRate, RepricingLog, LeadTimeStat
+from utils.repricing import RepricingService
 
 # Customize Admin Site
 admin.site.site_header = "JST System Administration"
@@ -57,3 +58,31 @@ class JSTStockSnapshotAdmin(admin.ModelAdmin):
 class POReceiptBatchAdmin(admin.ModelAdmin):
     list_display = ('header', 'batch_no', 'bill_date', 'received_date', 'total_cbm', 'total_weight')
     list_filter = ('received_date',)
+
+@admin.register(CurrencyRate)
+class CurrencyRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'effective_date', 'rate', 'note')
+    list_filter = ('currency',)
+    date_hierarchy = 'effective_date'
+    actions = ['reprice_open_pos']
+
+    @admin.action(description="Reprice open imported POs at this rate")
+    def reprice_open_pos(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, "Select exactly one rate.", messages.ERROR)
+            return
+        currency_rate = queryset.get()
+        log = RepricingService.reprice(currency_rate.rate, currency_rate=currency_rate, triggered_by=request.user.username)
+        self.message_user(request, f"{log.po_count} PO(s) / {log.item_count} line(s) repriced at {log.rate}.", messages.SUCCESS)
+
+@admin.register(RepricingLog)
+class RepricingLogAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'rate', 'po_count', 'item_count', 'baht_before', 'baht_after', 'include_complete', 'triggered_by')
+    readonly_fields = [field.name for field in RepricingLog._meta.fields]
+
+@admin.register(LeadTimeStat)
+class LeadTimeStatAdmin(admin.ModelAdmin):
+    list_display = ('scope', 'key', 'shipping_type', 'first_count', 'first_p50', 'first_p90', 'first_last', 'full_count', 'full_p50', 'full_p90', 'updated_at')
+    list_filter = ('scope', 'shipping_type')
+    search_fields = ('key',)
+    readonly_fields = [field.name for field in LeadTimeStat._meta.fields]
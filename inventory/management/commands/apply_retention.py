@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from utils.retention import RetentionService
+
+STEPS = ('snapshots', 'files', 'logs')
+
+
+class Command(BaseCommand):
+    help = 'Downsample old stock snapshots, compress/delete processed import files, truncate old error logs (cron, e.g. nightly).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', default=','.join(STEPS), help=f"Comma-separated steps: {', '.join(STEPS)}")
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would change')
+
+    def handle(self, *args, **options):
+        steps = [s.strip() for s in options['only'].split(',') if s.strip()]
+        unknown = set(steps) - set(STEPS)
+        if unknown:
+            raise CommandError(f"Unknown step(s): {', '.join(sorted(unknown))}")
+
+        dry_run = options['dry_run']
+        prefix = "[dry run] would have " if dry_run else ""
+        if 'snapshots' in steps:
+            deleted = RetentionService.downsample_snapshots(dry_run=dry_run)
+            self.stdout.write(f"{prefix}deleted {deleted} stock snapshots (downsampled)")
+        if 'files' in steps:
+            files = RetentionService.clean_import_files(dry_run=dry_run)
+            self.stdout.write(
+                f"{prefix}compressed {files['compressed']}, deleted {files['deleted']} import files, "
+                f"{files['partial_deleted']} abandoned partial uploads"
+            )
+        if 'logs' in steps:
+            truncated = RetentionService.truncate_error_logs(dry_run=dry_run)
+            self.stdout.write(f"{prefix}truncated {truncated} import error logs")
+        self.stdout.write(self.style.SUCCESS("Retention done."))
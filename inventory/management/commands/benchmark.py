@@ -0,0 +1,67 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from utils.benchmarking import BenchmarkRunner, compare_results, load_results, save_results
+import os
+
+
+class Command(BaseCommand):
+    help = 'Benchmark importers, services and report views (wall time, queries, peak memory) and compare against a baseline.'
+
+    def add_arguments(self, parser):
+        default_dir = os.path.join(settings.BASE_DIR, 'benchmarks')
+        parser.add_argument('--scales', type=str, default='0.1,1',
+                            help="Comma separated data scales; 'current' = data already in the database (default 0.1,1)")
+        parser.add_argument('--cases', type=str, help='Comma separated case names or groups (import, service, view)')
+        parser.add_argument('--repeat', type=int, default=3, help='Runs per case, the median is reported (imports run once)')
+        parser.add_argument('--no-memory', action='store_true', help='Skip the tracemalloc pass')
+        parser.add_argument('--output', type=str, default=os.path.join(default_dir, 'results.json'))
+        parser.add_argument('--baseline', type=str, default=os.path.join(default_dir, 'baseline.json'))
+        parser.add_argument('--max-regression', type=float, default=0.2, help='Allowed slowdown vs baseline (0.2 = 20%%)')
+        parser.add_argument('--save-baseline', action='store_true', help='Store this run as the new baseline')
+        parser.add_argument('--list', action='store_true', help='List the available cases')
+
+    def handle(self, *args, **kwargs):
+        runner = BenchmarkRunner(
+            repeat=kwargs['repeat'],
+            memory=not kwargs['no_memory'],
+            work_dir=os.path.dirname(os.path.abspath(kwargs['output'])),
+            log=self.stdout.write,
+        )
+
+        if kwargs['list']:
+            for case in runner.cases:
+                self.stdout.write(f"{case.group:8} {case.name}")
+            return
+
+        scales = []
+        for value in kwargs['scales'].split(','):
+            value = value.strip()
+            try:
+                scales.append(None if value == 'current' else float(value))
+            except ValueError:
+                raise CommandError(f"Invalid scale {value}")
+
+        case_names = [c.strip() for c in kwargs['cases'].split(',')] if kwargs['cases'] else None
+        try:
+            data = runner.run(scales, case_names)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        save_results(data, kwargs['output'])
+        self.stdout.write(self.style.SUCCESS(f"Results written to {kwargs['output']}"))
+
+        if kwargs['save_baseline']:
+            save_results(data, kwargs['baseline'])
+            self.stdout.write(self.style.SUCCESS(f"Baseline saved to {kwargs['baseline']}"))
+            return
+
+        if not os.path.exists(kwargs['baseline']):
+            self.stdout.write(self.style.WARNING("No baseline yet, run with --save-baseline to create one."))
+            return
+
+        regressions = compare_results(data, load_results(kwargs['baseline']), kwargs['max_regression'])
+        if regressions:
+            for line in regressions:
+                self.stdout.write(self.style.ERROR(f"REGRESSION {line}"))
+            raise CommandError(f"{len(regressions)} metric(s) regressed more than {kwargs['max_regression']:.0%} vs baseline")
+        self.stdout.write(self.style.SUCCESS("No regressions vs baseline"))
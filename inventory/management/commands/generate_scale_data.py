@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from inventory.models import MasterItem
+from utils.scale_data import ScaleDataGenerator, SKU_PREFIX
+import time
+
+
+class Command(BaseCommand):
+    help = 'Generate a reproducible synthetic dataset (scale 1.0 = 1k SKUs, 400 POs, 100k sales) and optional importer files.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=1.0, help='Scale factor (10 = ~1M sales)')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed')
+        parser.add_argument('--years', type=int, default=3, help='Years of sales history')
+        parser.add_argument('--snapshot-days', type=int, default=90, help='Days of daily JST snapshots')
+        parser.add_argument('--end-date', type=str, help='Last day of generated data (YYYY-MM-DD, default today). Fix it for identical reruns.')
+        parser.add_argument('--clear', action='store_true', help='Delete previously generated data first')
+        parser.add_argument('--export-dir', type=str, help='Also write Shopee/Lazada/JST style import files here')
+        parser.add_argument('--export-rows', type=int, default=50_000, help='Sales rows per exported file')
+        parser.add_argument('--export-format', choices=['xlsx', 'csv'], default='xlsx')
+        parser.add_argument('--export-only', action='store_true', help='Only write the files, no database changes')
+
+    def handle(self, *args, **kwargs):
+        end_date = None
+        if kwargs['end_date']:
+            end_date = parse_date(kwargs['end_date'])
+            if not end_date:
+                raise CommandError(f"Invalid --end-date {kwargs['end_date']}")
+
+        generator = ScaleDataGenerator(
+            scale=kwargs['scale'],
+            seed=kwargs['seed'],
+            years=kwargs['years'],
+            snapshot_days=kwargs['snapshot_days'],
+            end_date=end_date,
+            log=self.stdout.write,
+        )
+        start = time.perf_counter()
+
+        if not kwargs['export_only']:
+            if kwargs['clear']:
+                self.stdout.write("Clearing previously generated data...")
+                ScaleDataGenerator.clear()
+            elif MasterItem.objects.filter(product_code__startswith=SKU_PREFIX).exists():
+                raise CommandError("Generated data already exists, use --clear to replace it.")
+
+            counts = generator.generate()
+            summary = ", ".join(f"{k}={v}" for k, v in counts.items())
+            self.stdout.write(self.style.SUCCESS(f"Generated {summary} in {time.perf_counter() - start:.1f}s"))
+
+        if kwargs['export_dir']:
+            paths = generator.export_files(kwargs['export_dir'], rows=kwargs['export_rows'], fmt=kwargs['export_format'])
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(paths)} files to {kwargs['export_dir']}"))
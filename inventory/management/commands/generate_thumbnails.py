@@ -0,0 +1,54 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand
+from django.core.files.storage import default_storage
+from inventory.models import MasterItem, SupplierInfo
+from utils.thumbnails import ThumbnailService, render_thumbnails
+import os
+
+
+class Command(BaseCommand):
+    help = 'Backfill thumbnails for MasterItem and SupplierInfo images using a process pool.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Number of worker processes')
+        parser.add_argument('--force', action='store_true', help='Regenerate even if the thumbnail is up to date')
+
+    def handle(self, *args, **kwargs):
+        workers = kwargs['workers']
+        force = kwargs['force']
+
+        names = set(MasterItem.objects.exclude(image='').exclude(image__isnull=True).values_list('image', flat=True))
+        for field in ('product_image', 'qr_code', 'other_image'):
+            names.update(
+                SupplierInfo.objects.exclude(**{field: ''}).exclude(**{f'{field}__isnull': True}).values_list(field, flat=True)
+            )
+
+        # Work out what is missing in the parent so workers only touch Pillow + disk
+        jobs = []
+        missing = 0
+        for name in sorted(names):
+            try:
+                targets = ThumbnailService.targets_for(name, force=force)
+            except FileNotFoundError:
+                missing += 1
+                continue
+            if targets:
+                jobs.append((default_storage.path(name), targets))
+
+        self.stdout.write(f"{len(names)} images, {len(jobs)} need thumbnails, {missing} originals missing on disk.")
+        if not jobs:
+            return
+
+        fmt = ThumbnailService.get_format()
+        written = 0
+        failed = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(render_thumbnails, src, targets, fmt): src for src, targets in jobs}
+            for future in as_completed(futures):
+                try:
+                    written += future.result()
+                except Exception as e:
+                    failed += 1
+                    self.stdout.write(self.style.WARNING(f"{futures[future]}: {e}"))
+
+        self.stdout.write(self.style.SUCCESS(f"Done. {written} thumbnails written, {failed} images failed."))
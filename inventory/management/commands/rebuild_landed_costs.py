@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from inventory.models import POHeader
+
+BATCH_SIZE = 200
+
+
+class Command(BaseCommand):
+    help = 'Recompute stored POItem landed costs (shipping, unit cost THB, unit cost incl. VAT).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--po', help='Only this PO number')
+
+    def handle(self, *args, **options):
+        headers = POHeader.objects.order_by('id')
+        if options['po']:
+            headers = headers.filter(po_number=options['po'])
+        header_ids = list(headers.values_list('id', flat=True))
+
+        updated = 0
+        for i in range(0, len(header_ids), BATCH_SIZE):
+            batch = POHeader.objects.filter(id__in=header_ids[i:i + BATCH_SIZE]).prefetch_related('items')
+            for header in batch:
+                updated += header.recompute_landed_costs(list(header.items.all()))
+
+        self.stdout.write(self.style.SUCCESS(f"{len(header_ids)} PO(s) checked, {updated} line(s) updated."))
@@ -0,0 +1,24 @@
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from inventory.models import LeadTimeStat
+from utils.leadtimes import LeadTimeService
+import time
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the lead-time statistics (per SKU, supplier and shipping type) from PO receipts. Cron, nightly.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--today', help='Reference date of the two-year window (YYYY-MM-DD, default today)')
+
+    def handle(self, *args, **options):
+        try:
+            today = date.fromisoformat(options['today']) if options['today'] else None
+        except ValueError:
+            raise CommandError(f"Invalid date: {options['today']}")
+
+        started = time.perf_counter()
+        rows = LeadTimeService.rebuild(today)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rows} lead-time row(s) in {time.perf_counter() - started:.1f}s"))
+        for stat in LeadTimeStat.objects.filter(scope=LeadTimeStat.SCOPE_SHIPPING).order_by('shipping_type'):
+            self.stdout.write(f"  {stat}")
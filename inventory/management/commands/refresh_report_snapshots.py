@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from utils.reports import ReportSnapshotService
+
+
+class Command(BaseCommand):
+    help = 'Recompute the default stock report / sales summary snapshots (e.g. from cron after midnight).'
+
+    def handle(self, *args, **kwargs):
+        ReportSnapshotService.refresh_all()
+        self.stdout.write(self.style.SUCCESS("Report snapshots refreshed."))
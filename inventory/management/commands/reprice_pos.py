@@ -0,0 +1,43 @@
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from django.core.management.base import BaseCommand, CommandError
+from inventory.models import CurrencyRate
+from utils.repricing import RepricingService
+
+
+class Command(BaseCommand):
+    help = 'Reprice open imported POs (Total Baht + landed costs) at the CurrencyRate in effect, or at --rate.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rate', help='Exchange rate to apply instead of the CurrencyRate table')
+        parser.add_argument('--date', help='Use the CurrencyRate in effect on this date (YYYY-MM-DD, default today)')
+        parser.add_argument('--currency', default='CNY')
+        parser.add_argument('--include-complete', action='store_true', help='Reprice Completed POs too')
+
+    def handle(self, *args, **options):
+        currency_rate = None
+        if options['rate']:
+            try:
+                rate = Decimal(options['rate'])
+            except InvalidOperation:
+                raise CommandError(f"Invalid rate: {options['rate']}")
+        else:
+            try:
+                on_date = date.fromisoformat(options['date']) if options['date'] else None
+            except ValueError:
+                raise CommandError(f"Invalid date: {options['date']}")
+            currency_rate = CurrencyRate.rate_on(on_date, options['currency'])
+            if currency_rate is None:
+                raise CommandError(f"No {options['currency']} rate in effect on {on_date or date.today()}")
+            rate = currency_rate.rate
+        if rate <= 0:
+            raise CommandError('Rate must be positive')
+
+        log = RepricingService.reprice(
+            rate, include_complete=options['include_complete'], currency_rate=currency_rate,
+            triggered_by='manage.py reprice_pos',
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"{log.po_count} PO(s) / {log.item_count} line(s) repriced at {log.rate}: "
+            f"{log.baht_before:,.2f} -> {log.baht_after:,.2f} THB"
+        ))
@@ -0,0 +1,58 @@
+import signal
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from utils.outbox import OutboxService, LoginActivityService
+
+
+class Command(BaseCommand):
+    help = 'Send queued e-mails (OTP) and flush login activity in batches. Runs until stopped, or once with --once.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='One send + flush pass, then exit (cron / debugging)')
+        parser.add_argument('--interval', type=float, default=None, help='Seconds between send passes (default OUTBOX_POLL_INTERVAL)')
+        parser.add_argument('--batch', type=int, default=50, help='Max e-mails per pass')
+
+    def handle(self, *args, **options):
+        interval = options['interval'] or getattr(settings, 'OUTBOX_POLL_INTERVAL', 2)
+        flush_interval = getattr(settings, 'LOGIN_ACTIVITY_FLUSH_INTERVAL', 60)
+
+        if options['once']:
+            sent, failed = OutboxService.send_pending(options['batch'])
+            flushed = self.flush()
+            self.stdout.write(f"Sent {sent}, failed {failed}, login activity flushed {flushed}")
+            return
+
+        # systemctl stop -> finish the current pass, then exit
+        self.running = True
+        def stop(signum, frame):
+            self.running = False
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        self.stdout.write(f"Outbox worker started (every {interval}s, flush every {flush_interval}s)")
+        last_flush = 0
+        while self.running:
+            close_old_connections()
+            try:
+                sent, failed = OutboxService.send_pending(options['batch'])
+                if sent or failed:
+                    self.stdout.write(f"Sent {sent}, failed {failed}")
+            except Exception as e:
+                self.stderr.write(f"Send pass failed: {e}")
+
+            if time.monotonic() - last_flush >= flush_interval:
+                self.flush()
+                last_flush = time.monotonic()
+
+            time.sleep(interval)
+        self.stdout.write("Outbox worker stopped")
+
+    def flush(self):
+        try:
+            return LoginActivityService.flush()
+        except Exception as e:
+            # Sheet API down: rows stay unsynced for the next flush
+            self.stderr.write(f"Login activity flush failed: {e}")
+            return 0
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from utils.partitions import SalePartitionService
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly Sale partitions (Postgres). Run from cron, e.g. daily.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ahead', type=int, default=3, help='Months to create after the current one')
+        parser.add_argument('--list', action='store_true', help='Show partitions and estimated row counts')
+
+    def handle(self, *args, **options):
+        if not SalePartitionService.is_partitioned():
+            raise CommandError("inventory_sale is not partitioned on this database (Postgres only, migration 0019)")
+
+        created = SalePartitionService.ensure_ahead(options['ahead'])
+        for name in created:
+            self.stdout.write(f"Created {name}")
+
+        if options['list']:
+            for name, rows in SalePartitionService.existing_partitions().items():
+                self.stdout.write(f"  {name:<32}{rows:>12,} rows (est.)")
+
+        self.stdout.write(self.style.SUCCESS(f"{len(created)} partition(s) created."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from utils.replenishment import ReplenishmentService
+import time
+
+
+class Command(BaseCommand):
+    help = 'List reorder suggestions for the whole catalogue; --draft creates draft POs (one per supplier) from them.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--draft', action='store_true', help='Create draft POs for every suggestion')
+        parser.add_argument('--limit', type=int, default=20, help='Suggestions to print')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        suggestions = ReplenishmentService.suggestions()
+        for row in suggestions[:options['limit']]:
+            self.stdout.write(
+                f"{row['sku']:<20} stock {row['current_stock']:>6} +{row['incoming'] + row['drafted']:<6} "
+                f"{row['daily_demand']:>7.2f}/day  lead {row['lead_days']:>5.1f}d  -> order {row['qty']}"
+            )
+        self.stdout.write(f"{len(suggestions)} SKU(s) to reorder ({time.perf_counter() - started:.2f}s)")
+
+        if options['draft']:
+            headers = ReplenishmentService.create_drafts(suggestions)
+            self.stdout.write(self.style.SUCCESS(
+                f"{len(headers)} draft PO(s) created: {', '.join(h.po_number for h in headers) or '-'}"
+            ))
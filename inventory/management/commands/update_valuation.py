@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from utils.valuation import ValuationService
+
+
+class Command(BaseCommand):
+    help = 'Revalue SKUs whose receipts/sales changed (FIFO + moving average, sale COGS). Cron, e.g. every 15 minutes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Recompute the full history of every SKU')
+        parser.add_argument('--sku', action='append', help='With --rebuild: only this SKU (repeatable)')
+        parser.add_argument('--limit', type=int, help='Revalue at most this many dirty SKUs')
+
+    def handle(self, *args, **options):
+        if options['rebuild']:
+            valued = ValuationService.rebuild(options['sku'])
+            self.stdout.write(f"Rebuilt {valued} SKU valuation(s)")
+        else:
+            valued = ValuationService.process_dirty(options['limit'])
+            self.stdout.write(f"Revalued {valued} dirty SKU(s)")
+
+        totals = ValuationService.totals()
+        self.stdout.write(self.style.SUCCESS(
+            f"Stock value: FIFO {totals['stock_value_fifo'] or 0:,.2f} THB, "
+            f"moving avg {totals['stock_value_avg'] or 0:,.2f} THB over {totals['skus']} SKUs "
+            f"({totals['dirty']} still dirty)"
+        ))
@@ -0,0 +1,270 @@
+from contextlib import ExitStack
+from datetime import datetime
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from utils.db_routing import STICKY_COOKIE, replica_configured, sticky_seconds
+from utils.metrics import MetricsService
+from utils.query_tracking import QueryTracker
+import json
+import logging
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger('inventory.performance')
+
+# Per-thread state of the request being measured (template hook reads it)
+_local = threading.local()
+_template_hook_installed = False
+
+
+def _install_template_hook():
+    """
+    Wraps Template.render once per process to time template rendering.
+    Nested renders ({% include %}) are counted once via a depth counter.
+    SQL run while rendering (lazy querysets) is subtracted so it is
+    reported under db, not tpl.
+    """
+    global _template_hook_installed
+    if _template_hook_installed:
+        return
+    from django.template.base import Template
+
+    original_render = Template.render
+
+    def timed_render(self, context):
+        stats = getattr(_local, 'stats', None)
+        if stats is None:
+            return original_render(self, context)
+
+        stats['tpl_depth'] += 1
+        if stats['tpl_depth'] > 1:
+            try:
+                return original_render(self, context)
+            finally:
+                stats['tpl_depth'] -= 1
+
+        start = time.perf_counter()
+        db_before = stats['tracker'].duration
+        try:
+            return original_render(self, context)
+        finally:
+            stats['tpl_depth'] -= 1
+            elapsed = time.perf_counter() - start
+            stats['tpl'] += elapsed - (stats['tracker'].duration - db_before)
+
+    Template.render = timed_render
+    _template_hook_installed = True
+
+
+class MetricsMiddleware:
+    """
+    Request count / latency / query-count histograms per view for /metrics.
+    Sits just before PerformanceMiddleware and reuses its numbers when
+    available (request.perf_metrics), otherwise only times the request.
+    """
+
+    def __init__(self, get_response):
+        if not MetricsService.enabled():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+
+        perf = getattr(request, 'perf_metrics', None)
+        duration = perf['total_ms'] / 1000 if perf else time.perf_counter() - start
+        match = getattr(request, 'resolver_match', None)
+        # URL names only, raw paths would explode the label cardinality
+        view = match.view_name if match else 'unmatched'
+
+        MetricsService.inc('jst_http_requests_total', view=view, method=request.method, status=response.status_code)
+        MetricsService.observe('jst_http_request_duration_seconds', duration, view=view)
+        if perf:
+            MetricsService.observe('jst_http_db_queries', perf['queries'], view=view)
+        return response
+
+
+class PerformanceMiddleware:
+    """
+    Per-request timings: DB query count/time, template time, remaining
+    Python time and (optionally) peak allocation.
+
+    - Sent back as a Server-Timing header (visible in browser devtools)
+    - Requests slower than PERF_SLOW_REQUEST_MS are logged as one JSON line
+      to the 'inventory.performance' logger, with the most repeated SQL
+      shapes so N+1 loops stand out.
+
+    With PERF_MONITORING_ENABLED = False Django drops the middleware at
+    startup (MiddlewareNotUsed), so there is no per-request cost at all.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERF_MONITORING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.slow_ms = getattr(settings, 'PERF_SLOW_REQUEST_MS', 1000)
+        self.server_timing = getattr(settings, 'PERF_SERVER_TIMING', True)
+        # tracemalloc slows Python down noticeably, only on demand
+        self.trace_memory = getattr(settings, 'PERF_TRACEMALLOC', False)
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _install_template_hook()
+
+    def __call__(self, request):
+        tracker = QueryTracker()
+        stats = {'tracker': tracker, 'tpl': 0.0, 'tpl_depth': 0}
+        _local.stats = stats
+
+        if self.trace_memory:
+            # Peak is process-wide; accurate with gunicorn sync workers (1 request at a time)
+            tracemalloc.reset_peak()
+            mem_start = tracemalloc.get_traced_memory()[0]
+
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(tracker))
+                response = self.get_response(request)
+        finally:
+            _local.stats = None
+        total = time.perf_counter() - start
+
+        metrics = {
+            'total_ms': round(total * 1000, 2),
+            'db_ms': round(tracker.duration * 1000, 2),
+            'tpl_ms': round(stats['tpl'] * 1000, 2),
+            'app_ms': round(max(total - tracker.duration - stats['tpl'], 0) * 1000, 2),
+            'queries': tracker.count,
+        }
+        if self.trace_memory:
+            metrics['peak_alloc_kb'] = round((tracemalloc.get_traced_memory()[1] - mem_start) / 1024, 1)
+
+        # Other middleware (metrics, profiling) can pick these up
+        request.perf_metrics = metrics
+
+        if self.server_timing:
+            response['Server-Timing'] = self.server_timing_header(metrics)
+
+        if metrics['total_ms'] >= self.slow_ms:
+            self.log_slow_request(request, response, metrics, tracker)
+
+        return response
+
+    @staticmethod
+    def server_timing_header(metrics):
+        parts = [
+            f'db;dur={metrics["db_ms"]};desc="{metrics["queries"]} queries"',
+            f'tpl;dur={metrics["tpl_ms"]};desc="templates"',
+            f'app;dur={metrics["app_ms"]};desc="python"',
+            f'total;dur={metrics["total_ms"]}',
+        ]
+        if 'peak_alloc_kb' in metrics:
+            parts.append(f'mem;desc="peak {metrics["peak_alloc_kb"]} KB"')
+        return ", ".join(parts)
+
+    @staticmethod
+    def log_slow_request(request, response, metrics, tracker):
+        match = getattr(request, 'resolver_match', None)
+        entry = {
+            'event': 'slow_request',
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            'user': getattr(getattr(request, 'user', None), 'pk', None),
+            **metrics,
+            'repeated_sql': tracker.top_repeated(),
+        }
+        logger.warning(json.dumps(entry, ensure_ascii=False, default=str))
+
+
+class ProfilingMiddleware:
+    """
+    Opt-in profiling of a single request, staff only:
+        /stock/?status=low&_profile=1        (cProfile)
+        /stock/?status=low&_profile=sample   (sampling, collapsed stacks)
+    or header X-Profile: 1 / sample.
+
+    Captures the profile plus every SQL statement and stores them in the
+    ProfileStore ring buffer; browse them at /profiles/. Other requests
+    only pay for one dict lookup in process_view.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        mode = request.GET.get('_profile') or request.META.get('HTTP_X_PROFILE')
+        if not mode:
+            return None
+        if not (request.user.is_authenticated and request.user.is_staff):
+            return None
+        if not view_func.__module__.startswith('inventory.'):
+            return None
+
+        from utils.profiling import ProfileStore, start_profiler, stop_profiler, elapsed_ms
+
+        tracker = QueryTracker(keep_queries=True)
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for conn in connections.all():
+                stack.enter_context(conn.execute_wrapper(tracker))
+            profiler, sampler = start_profiler(mode)
+            try:
+                response = view_func(request, *view_args, **view_kwargs)
+                # Lazy template responses must render inside the profile
+                if hasattr(response, 'render') and callable(response.render):
+                    response = response.render()
+            finally:
+                stop_profiler(profiler, sampler)
+
+        match = request.resolver_match
+        try:
+            profile_id = ProfileStore.save({
+                'mode': 'sample' if sampler else 'cprofile',
+                'method': request.method,
+                'path': request.get_full_path(),
+                'view': match.view_name if match else view_func.__name__,
+                'user': request.user.get_username(),
+                'status': response.status_code,
+                'duration_ms': elapsed_ms(start),
+                'db_ms': round(tracker.duration * 1000, 2),
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+            }, tracker.queries, profiler=profiler, sampler=sampler)
+            response['X-Profile-Id'] = profile_id
+        except Exception as e:
+            logger.error(f"Saving profile failed: {e}")
+        return response
+
+
+class ReplicaStickyMiddleware:
+    """
+    After a write request (POST/PUT/PATCH/DELETE) the browser gets a short
+    cookie that keeps its @read_replica pages on the primary for
+    REPLICA_STICKY_SECONDS, so a report opened right after saving never
+    shows data the replica has not replayed yet.
+    """
+
+    def __init__(self, get_response):
+        if not replica_configured():
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 500:
+            seconds = sticky_seconds()
+            response.set_cookie(
+                STICKY_COOKIE, str(time.time() + seconds), max_age=seconds,
+                httponly=True, samesite='Lax',
+            )
+        return response
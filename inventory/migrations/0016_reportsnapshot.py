@@ -0,0 +1,25 @@
+# Generated by Django 6.0.1 on 2026-10-19 17:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0015_poitem_carton_qty'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report', models.CharField(max_length=50, unique=True)),
+                ('data_version', models.CharField(max_length=200)),
+                ('report_date', models.DateField()),
+                ('payload', models.BinaryField()),
+                ('size_bytes', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,188 @@
+# Generated by Django 6.0.1 on 2026-10-19 11:05
+
+from datetime import date
+
+from django.db import migrations, models
+
+# Sale -> monthly RANGE partitions on date (Postgres 13+ only).
+#
+# A partitioned table can only have PRIMARY KEY / UNIQUE constraints that
+# include the partition key, so:
+#   - the primary key becomes (id, date); id still comes from a sequence and
+#     stays unique, Django keeps using it as the pk
+#   - (order_id, sku) uniqueness moves to inventory_sale_key, kept in sync by
+#     BEFORE triggers; a duplicate still raises IntegrityError, so
+#     get_or_create in the importer behaves as before
+# Other databases only get the two composite indexes.
+
+SALE_INDEXES = [
+    models.Index(fields=['sku', 'date'], name='sale_sku_date_idx'),
+    models.Index(fields=['date', 'sku'], name='sale_date_sku_idx'),
+]
+
+LEGACY = 'inventory_sale_unpartitioned'
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+def partition_sale(apps, schema_editor):
+    Sale = apps.get_model('inventory', 'Sale')
+    if schema_editor.connection.vendor != 'postgresql':
+        for index in SALE_INDEXES:
+            schema_editor.add_index(Sale, index)
+        return
+
+    # MasterItem's pk is product_code (varchar), not an integer id
+    sku_type = Sale._meta.get_field('sku').db_parameters(schema_editor.connection)['type']
+    sku_target = Sale._meta.get_field('sku').target_field.column
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE inventory_sale RENAME TO {LEGACY}")
+        # Columns + NOT NULL only; constraints/indexes are added after the copy
+        cursor.execute(f"CREATE TABLE inventory_sale (LIKE {LEGACY}) PARTITION BY RANGE (date)")
+
+        # Identity columns are not allowed on partitioned tables before PG 17
+        cursor.execute("CREATE SEQUENCE inventory_sale_new_id_seq")
+        cursor.execute(f"SELECT setval('inventory_sale_new_id_seq', COALESCE((SELECT MAX(id) FROM {LEGACY}), 0) + 1, false)")
+        cursor.execute("ALTER TABLE inventory_sale ALTER COLUMN id SET DEFAULT nextval('inventory_sale_new_id_seq')")
+        cursor.execute("ALTER SEQUENCE inventory_sale_new_id_seq OWNED BY inventory_sale.id")
+
+        # One partition per month of existing data, plus 3 months ahead
+        cursor.execute(f"SELECT MIN(date), MAX(date) FROM {LEGACY}")
+        first, last = cursor.fetchone()
+        today = date.today()
+        month = month_start(min(first or today, today))
+        end = month_start(max(last or today, today))
+        for _ in range(3):
+            end = next_month(end)
+        while month <= end:
+            cursor.execute(
+                f"CREATE TABLE inventory_sale_y{month.year}m{month.month:02d} PARTITION OF inventory_sale "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            )
+            month = next_month(month)
+
+        cursor.execute(f"INSERT INTO inventory_sale SELECT * FROM {LEGACY}")
+        cursor.execute(f"""
+            CREATE TABLE inventory_sale_key (
+                order_id varchar(100) NOT NULL,
+                sku_id {sku_type} NOT NULL,
+                PRIMARY KEY (order_id, sku_id)
+            )
+        """)
+        cursor.execute(f"INSERT INTO inventory_sale_key (order_id, sku_id) SELECT order_id, sku_id FROM {LEGACY}")
+        cursor.execute(f"DROP TABLE {LEGACY}")
+        cursor.execute("ALTER SEQUENCE inventory_sale_new_id_seq RENAME TO inventory_sale_id_seq")
+
+        # Created on the parent = created on every partition (current and future)
+        cursor.execute("ALTER TABLE inventory_sale ADD CONSTRAINT inventory_sale_pkey PRIMARY KEY (id, date)")
+        for index in SALE_INDEXES:
+            schema_editor.execute(index.create_sql(Sale, schema_editor))
+        # Importer lookups by (order_id, sku) without a date: one probe per partition
+        cursor.execute("CREATE INDEX sale_order_sku_idx ON inventory_sale (order_id, sku_id)")
+
+        cursor.execute("""
+            CREATE FUNCTION inventory_sale_key_sync() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    INSERT INTO inventory_sale_key (order_id, sku_id) VALUES (NEW.order_id, NEW.sku_id);
+                    RETURN NEW;
+                ELSIF TG_OP = 'DELETE' THEN
+                    DELETE FROM inventory_sale_key WHERE order_id = OLD.order_id AND sku_id = OLD.sku_id;
+                    RETURN OLD;
+                END IF;
+                -- UPDATE of the key: a move to another month is a DELETE + INSERT
+                -- (both fire their own triggers), only same-partition updates land here
+                IF date_trunc('month', OLD.date) = date_trunc('month', NEW.date) THEN
+                    UPDATE inventory_sale_key SET order_id = NEW.order_id, sku_id = NEW.sku_id
+                    WHERE order_id = OLD.order_id AND sku_id = OLD.sku_id;
+                END IF;
+                RETURN NEW;
+            END
+            $$
+        """)
+        cursor.execute("""
+            CREATE FUNCTION inventory_sale_key_truncate() RETURNS trigger LANGUAGE plpgsql AS $$
+            BEGIN
+                TRUNCATE inventory_sale_key;
+                RETURN NULL;
+            END
+            $$
+        """)
+        cursor.execute("""
+            CREATE TRIGGER inventory_sale_key_insert BEFORE INSERT ON inventory_sale
+            FOR EACH ROW EXECUTE FUNCTION inventory_sale_key_sync()
+        """)
+        cursor.execute("""
+            CREATE TRIGGER inventory_sale_key_delete BEFORE DELETE ON inventory_sale
+            FOR EACH ROW EXECUTE FUNCTION inventory_sale_key_sync()
+        """)
+        cursor.execute("""
+            CREATE TRIGGER inventory_sale_key_update BEFORE UPDATE OF order_id, sku_id ON inventory_sale
+            FOR EACH ROW WHEN (OLD.order_id IS DISTINCT FROM NEW.order_id OR OLD.sku_id IS DISTINCT FROM NEW.sku_id)
+            EXECUTE FUNCTION inventory_sale_key_sync()
+        """)
+        cursor.execute("""
+            CREATE TRIGGER inventory_sale_key_truncate AFTER TRUNCATE ON inventory_sale
+            FOR EACH STATEMENT EXECUTE FUNCTION inventory_sale_key_truncate()
+        """)
+
+        # Last: the FK check reads the copied rows once
+        cursor.execute(f"""
+            ALTER TABLE inventory_sale ADD CONSTRAINT inventory_sale_sku_id_fk_inventory_masteritem_{sku_target}
+            FOREIGN KEY (sku_id) REFERENCES inventory_masteritem ({sku_target}) DEFERRABLE INITIALLY DEFERRED
+        """)
+
+
+def unpartition_sale(apps, schema_editor):
+    Sale = apps.get_model('inventory', 'Sale')
+    if schema_editor.connection.vendor != 'postgresql':
+        for index in SALE_INDEXES:
+            schema_editor.remove_index(Sale, index)
+        return
+
+    sku_target = Sale._meta.get_field('sku').target_field.column
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("ALTER TABLE inventory_sale RENAME TO inventory_sale_partitioned")
+        cursor.execute("ALTER SEQUENCE inventory_sale_id_seq RENAME TO inventory_sale_partitioned_id_seq")
+        cursor.execute("CREATE TABLE inventory_sale (LIKE inventory_sale_partitioned)")
+        cursor.execute("INSERT INTO inventory_sale SELECT * FROM inventory_sale_partitioned")
+        cursor.execute("DROP TABLE inventory_sale_partitioned")
+        cursor.execute("DROP TABLE inventory_sale_key")
+        cursor.execute("DROP FUNCTION inventory_sale_key_sync()")
+        cursor.execute("DROP FUNCTION inventory_sale_key_truncate()")
+
+        cursor.execute("ALTER TABLE inventory_sale ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+        cursor.execute("SELECT setval(pg_get_serial_sequence('inventory_sale', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM inventory_sale")
+        cursor.execute("ALTER TABLE inventory_sale ADD CONSTRAINT inventory_sale_pkey PRIMARY KEY (id)")
+        cursor.execute("ALTER TABLE inventory_sale ADD CONSTRAINT inventory_sale_order_id_sku_id_uniq UNIQUE (order_id, sku_id)")
+        cursor.execute("CREATE INDEX inventory_sale_sku_id ON inventory_sale (sku_id)")
+        cursor.execute(f"""
+            ALTER TABLE inventory_sale ADD CONSTRAINT inventory_sale_sku_id_fk_inventory_masteritem_{sku_target}
+            FOREIGN KEY (sku_id) REFERENCES inventory_masteritem ({sku_target}) DEFERRABLE INITIALLY DEFERRED
+        """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0018_outboxmessage_loginactivity'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AddIndex(model_name='sale', index=index) for index in SALE_INDEXES
+            ],
+            database_operations=[
+                migrations.RunPython(partition_sale, unpartition_sale),
+            ],
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 6.0.1 on 2026-10-19 13:20
+
+from decimal import Decimal
+
+from django.db import migrations, models
+
+# Same formulas as POItem.compute_landed_costs (historical models have no methods)
+BATCH_SIZE = 500
+
+
+def fill_landed_costs(apps, schema_editor):
+    POHeader = apps.get_model('inventory', 'POHeader')
+    POItem = apps.get_model('inventory', 'POItem')
+    header_ids = list(POHeader.objects.order_by('id').values_list('id', flat=True))
+    for i in range(0, len(header_ids), BATCH_SIZE):
+        items = list(POItem.objects.filter(header_id__in=header_ids[i:i + BATCH_SIZE]).select_related('header'))
+        for item in items:
+            header = item.header
+            shipping = (Decimal(item.total_received_cbm or 0) * Decimal(header.shipping_rate_thb_cbm or 0)).quantize(Decimal('0.01'))
+            item.total_shipping_cost = shipping
+            item.unit_cost_thb = Decimal(0)
+            item.unit_cost_incl_vat = None
+            if item.qty_ordered > 0:
+                qty = Decimal(item.qty_ordered)
+                item.unit_cost_thb = ((Decimal(item.price_baht or 0) + shipping) / qty).quantize(Decimal('0.0001'))
+                if header.order_type == 'DOMESTIC' and item.unit_price is not None:
+                    vat = Decimal(header.vat_rate or 0) / 100
+                    item.unit_cost_incl_vat = (Decimal(item.unit_price) * (1 + vat) + shipping / qty).quantize(Decimal('0.0001'))
+        POItem.objects.bulk_update(items, ['total_shipping_cost', 'unit_cost_thb', 'unit_cost_incl_vat'], batch_size=BATCH_SIZE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0019_sale_partitioning'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='poitem',
+            name='total_shipping_cost',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='ค่าขนส่ง (THB)'),
+        ),
+        migrations.AddField(
+            model_name='poitem',
+            name='unit_cost_incl_vat',
+            field=models.DecimalField(blank=True, decimal_places=4, max_digits=14, null=True, verbose_name='ต้นทุนต่อชิ้นรวม VAT (Domestic)'),
+        ),
+        migrations.AddField(
+            model_name='poitem',
+            name='unit_cost_thb',
+            field=models.DecimalField(decimal_places=4, default=0, max_digits=14, verbose_name='ต้นทุนต่อชิ้น (THB)'),
+        ),
+        migrations.RunPython(fill_landed_costs, migrations.RunPython.noop),
+    ]
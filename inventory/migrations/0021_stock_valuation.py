@@ -0,0 +1,68 @@
+# Generated by Django 6.0.1 on 2026-10-19 14:10
+
+import datetime
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def mark_all_dirty(apps, schema_editor):
+    # Never-valued rows get a full valuation on the next
+    # `manage.py update_valuation` (cron), no long work inside the migration
+    MasterItem = apps.get_model('inventory', 'MasterItem')
+    SkuValuation = apps.get_model('inventory', 'SkuValuation')
+    SkuValuation.objects.bulk_create(
+        [SkuValuation(sku_id=pk, dirty_from=datetime.date(2000, 1, 1)) for pk in MasterItem.objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0020_poitem_landed_costs'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkuValuation',
+            fields=[
+                ('sku', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='valuation', serialize=False, to='inventory.masteritem')),
+                ('on_hand', models.BigIntegerField(default=0)),
+                ('avg_cost', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('stock_value_fifo', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('stock_value_avg', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('dirty_from', models.DateField(blank=True, db_index=True, null=True)),
+                ('valued_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='cogs_avg',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True, verbose_name='COGS (Moving Avg)'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='cogs_fifo',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True, verbose_name='COGS (FIFO)'),
+        ),
+        migrations.CreateModel(
+            name='CostLayer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('qty', models.IntegerField()),
+                ('unit_cost', models.DecimalField(decimal_places=4, max_digits=14)),
+                ('cum_qty_before', models.BigIntegerField(default=0)),
+                ('on_hand_after', models.BigIntegerField(default=0)),
+                ('avg_cost_after', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('receipt', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='cost_layer', to='inventory.receivedpoitem')),
+                ('sku', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cost_layers', to='inventory.masteritem')),
+            ],
+            options={
+                'ordering': ['sku', 'date', 'receipt_id'],
+                'indexes': [models.Index(fields=['sku', 'date'], name='costlayer_sku_date_idx')],
+            },
+        ),
+        migrations.RunPython(mark_all_dirty, migrations.RunPython.noop),
+    ]
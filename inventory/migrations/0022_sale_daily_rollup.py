@@ -0,0 +1,51 @@
+# Generated by Django 6.0.1 on 2026-10-19 18:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    # Sales as of now; later changes go through the valuation (SaleRollupService)
+    schema_editor.execute("""
+        INSERT INTO inventory_saledailyrollup
+            (date, sku_id, platform, shop_name, orders, qty, total_price, net_price, fees, cogs_fifo, cogs_avg, uncosted)
+        SELECT date, sku_id, platform, COALESCE(shop_name, ''), COUNT(*), COALESCE(SUM(qty), 0),
+               COALESCE(SUM(total_price), 0), COALESCE(SUM(net_price), 0),
+               COALESCE(SUM(payment_fee + commission_fee + service_fee + shipping_fee + voucher_amount), 0),
+               COALESCE(SUM(cogs_fifo), 0), COALESCE(SUM(cogs_avg), 0), COUNT(*) - COUNT(cogs_fifo)
+        FROM inventory_sale
+        GROUP BY date, sku_id, platform, COALESCE(shop_name, '')
+    """)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0021_stock_valuation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SaleDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('platform', models.CharField(max_length=50)),
+                ('shop_name', models.CharField(blank=True, default='', max_length=100)),
+                ('orders', models.IntegerField(default=0)),
+                ('qty', models.BigIntegerField(default=0)),
+                ('total_price', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('net_price', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('fees', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('cogs_fifo', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('cogs_avg', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('uncosted', models.IntegerField(default=0)),
+                ('sku', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='inventory.masteritem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['sku', 'date'], name='rollup_sku_date_idx')],
+                'unique_together': {('date', 'sku', 'platform', 'shop_name')},
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
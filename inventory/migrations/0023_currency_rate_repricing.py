@@ -0,0 +1,45 @@
+# Generated by Django 6.0.1 on 2026-10-19 19:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0022_sale_daily_rollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CurrencyRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(default='CNY', max_length=3, verbose_name='สกุลเงิน')),
+                ('effective_date', models.DateField(verbose_name='มีผลตั้งแต่วันที่')),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=10, verbose_name='เรทเงิน (THB)')),
+                ('note', models.CharField(blank=True, default='', max_length=255, verbose_name='หมายเหตุ')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['currency', '-effective_date'],
+                'unique_together': {('currency', 'effective_date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='RepricingLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('rate', models.DecimalField(decimal_places=4, max_digits=10)),
+                ('include_complete', models.BooleanField(default=False)),
+                ('triggered_by', models.CharField(blank=True, default='', max_length=150)),
+                ('po_count', models.IntegerField(default=0)),
+                ('item_count', models.IntegerField(default=0)),
+                ('baht_before', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('baht_after', models.DecimalField(decimal_places=2, default=0, max_digits=16)),
+                ('changes', models.JSONField(default=list)),
+                ('currency_rate', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='repricings', to='inventory.currencyrate')),
+            ],
+        ),
+    ]
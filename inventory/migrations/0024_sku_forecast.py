@@ -0,0 +1,28 @@
+# Generated by Django 6.0.1 on 2026-10-19 21:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0023_currency_rate_repricing'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SkuForecast',
+            fields=[
+                ('sku', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='forecast', serialize=False, to='inventory.masteritem')),
+                ('method', models.CharField(choices=[('seasonal', 'Exponential smoothing + weekday pattern'), ('croston', 'Croston / SBA (intermittent demand)'), ('none', 'No sales in the history')], default='none', max_length=20)),
+                ('daily_demand', models.FloatField(default=0, verbose_name='คาดการณ์ขาย/วัน')),
+                ('horizon_demand', models.FloatField(default=0)),
+                ('variance', models.FloatField(default=0)),
+                ('days_of_cover', models.FloatField(blank=True, null=True, verbose_name='พอขาย (วัน)')),
+                ('history_days', models.IntegerField(default=0)),
+                ('sale_days', models.IntegerField(default=0)),
+                ('computed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
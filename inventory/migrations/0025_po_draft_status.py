@@ -0,0 +1,18 @@
+# Generated by Django 6.0.1 on 2026-10-19 23:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0024_sku_forecast'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='poheader',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Waiting for Shipment (สินค้ารอจัดส่ง)'), ('Arriving Soon', 'Arriving Soon (สินค้าใกล้ถึง)'), ('Overdue', 'Overdue (เลยกำหนดจัดส่ง)'), ('Incomplete', 'Incomplete (สินค้าไม่ครบ)'), ('Complete', 'Complete (เรียบร้อย)'), ('Draft', 'Draft (ร่างจากระบบแนะนำสั่งซื้อ)')], default='Pending', max_length=50, verbose_name='สถานะ'),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 6.0.1 on 2026-10-19 16:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0025_po_draft_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LeadTimeStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('sku', 'SKU'), ('supplier', 'Supplier'), ('shipping', 'Shipping type')], max_length=20)),
+                ('key', models.CharField(blank=True, default='', max_length=255)),
+                ('shipping_type', models.CharField(blank=True, default='', max_length=20)),
+                ('first_count', models.IntegerField(default=0)),
+                ('first_mean', models.FloatField(default=0)),
+                ('first_std', models.FloatField(default=0)),
+                ('first_p50', models.FloatField(default=0)),
+                ('first_p90', models.FloatField(default=0)),
+                ('first_last', models.IntegerField(default=0)),
+                ('full_count', models.IntegerField(default=0)),
+                ('full_mean', models.FloatField(blank=True, null=True)),
+                ('full_p50', models.FloatField(blank=True, null=True)),
+                ('full_p90', models.FloatField(blank=True, null=True)),
+                ('full_last', models.IntegerField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'unique_together': {('scope', 'key', 'shipping_type')},
+            },
+        ),
+    ]
@@ -1,9 +1,17 @@
+from contextlib import contextmanager
+from django.conf import settings
 from django.db import models
-from django.db.models.signals import post_save, post_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
-from django.db.models import Sum, F
-from datetime import timedelta, date
+from django.db.models import Sum, F, Count, Min, Value, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Least
+from datetime import timedelta, date, datetime
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from decimal import Decimal
+from utils.cache_utils import CacheService
+from utils.thumbnails import ThumbnailService
+import threading
 
 class MasterItem(models.Model):
     product_code = models.CharField(max_length=100, primary_key=True, verbose_name="รหัสสินค้า") # SKU
@@ -55,6 +63,8 @@ class POHeader(models.Model):
     STATUS_OVERDUE = 'Overdue'
     STATUS_INCOMPLETE = 'Incomplete'
     STATUS_COMPLETE = 'Complete'
+    # Suggested by the reorder engine (utils/replenishment.py), not ordered yet
+    STATUS_DRAFT = 'Draft'
 
     STATUS_CHOICES = [
         (STATUS_PENDING, 'Waiting for Shipment (สินค้ารอจัดส่ง)'),
@@ -62,6 +72,7 @@ class POHeader(models.Model):
         (STATUS_OVERDUE, 'Overdue (เลยกำหนดจัดส่ง)'),
         (STATUS_INCOMPLETE, 'Incomplete (สินค้าไม่ครบ)'),
         (STATUS_COMPLETE, 'Complete (เรียบร้อย)'),
+        (STATUS_DRAFT, 'Draft (ร่างจากระบบแนะนำสั่งซื้อ)'),
     ]
 
     po_number = models.CharField(max_length=50, unique=True, verbose_name="เลข PO")
@@ -101,41 +112,87 @@ class POHeader(models.Model):
 
     def save(self, *args, **kwargs):
         # Auto-calculate estimated date if missing
-        if not self.estimated_date and self.order_date:
-            if self.shipping_type == 'CAR':
-                self.estimated_date = self.order_date + timedelta(days=14)
-            elif self.shipping_type == 'SHIP':
-                self.estimated_date = self.order_date + timedelta(days=25)
+        if not self.estimated_date and self.order_date and self.shipping_type:
+            days = LeadTimeStat.expected_days(self.shipping_type)
+            if days is not None:
+                self.estimated_date = self.order_date + timedelta(days=days)
 
         super().save(*args, **kwargs)
         # Trigger Proration update after save?
         # Better to do it explicitly or via signal, but here is safe for simple updates.
         # Only if PK exists (update)
         if self.pk:
-            if self.yuan_mode == 'top-down':
-                self.prorate_costs()
+            # Top-down: re-prorate; both modes: rates may have changed the landed costs
+            self.prorate_costs()
             self.update_status()
 
     def prorate_costs(self):
         """
-        Prorate total_yuan to items based on qty_ordered.
+        Prorate total_yuan to items based on qty_ordered, then refresh the
+        stored landed costs (bottom-up POs only get the latter).
         Item Total Yuan = Header.total_yuan * (Item.qty_ordered / Header.total_qty)
         """
+        items = list(self.items.all())
         if self.yuan_mode == 'bottom-up':
-            return
+            return self.recompute_landed_costs(items)
 
-        items = self.items.all()
-        total_qty = items.aggregate(sum_qty=Sum('qty_ordered'))['sum_qty'] or 0
+        total_qty = sum(item.qty_ordered for item in items)
         
         if total_qty > 0 and self.total_yuan > 0:
             for item in items:
                 ratio = Decimal(item.qty_ordered) / Decimal(total_qty)
-                item.price_yuan = self.total_yuan * ratio
-                item.price_baht = item.price_yuan * self.exchange_rate
-                item.save(update_fields=['price_yuan', 'price_baht'])
-        elif total_qty == 0:
+                price_yuan = self.total_yuan * ratio
+                # Rounded as stored, so landed costs compare equal to the saved values
+                item.price_yuan = price_yuan.quantize(Decimal('0.0001'))
+                item.price_baht = (price_yuan * self.exchange_rate).quantize(Decimal('0.01'))
+            # One UPDATE for all lines (prices + landed costs)
+            return self.recompute_landed_costs(items, extra_fields=['price_yuan', 'price_baht'])
+        elif total_qty == 0 and items:
              # Reset if no qty
-             items.update(price_yuan=0, price_baht=0)
+             for item in items:
+                 item.price_yuan = item.price_baht = Decimal(0)
+             return self.recompute_landed_costs(items, extra_fields=['price_yuan', 'price_baht'])
+        return self.recompute_landed_costs(items)
+
+    def recompute_landed_costs(self, items=None, extra_fields=()):
+        """
+        Stored landed costs of all lines (POItem.compute_landed_costs) in one
+        bulk UPDATE. save() and prorate_costs() call it, so changes to rates,
+        prices, qty or received CBM are covered. Returns the lines written.
+        """
+        if items is None:
+            items = list(self.items.all())
+        changed = [item for item in items if item.compute_landed_costs(self)]
+        to_save = items if extra_fields else changed
+        if to_save:
+            # bulk_update skips signals, so bump by hand
+            POItem.objects.bulk_update(to_save, list(extra_fields) + POItem.LANDED_COST_FIELDS)
+            CacheService.bump_version('POItem')
+        # Receipts are valued at unit_cost_thb
+        received = [item.pk for item in changed if item.total_received_qty]
+        if received:
+            SkuValuation.mark_receipts_dirty(POItem.objects.filter(pk__in=received))
+        return len(to_save)
+
+    @classmethod
+    def compute_status(cls, item_count, total_ordered, total_received, estimated_date, today=None):
+        """
+        Status rules (see update_status), shared with refresh_statuses().
+        """
+        if not item_count:
+            return cls.STATUS_PENDING
+        if total_received >= total_ordered and total_ordered > 0:
+            return cls.STATUS_COMPLETE
+        if total_received > 0:
+            return cls.STATUS_INCOMPLETE
+        # Not received yet
+        if estimated_date:
+            delta = (estimated_date - (today or date.today())).days
+            if delta < 0:
+                return cls.STATUS_OVERDUE
+            if delta <= 7:
+                return cls.STATUS_ARRIVING
+        return cls.STATUS_PENDING
 
     def update_status(self):
         """
@@ -144,48 +201,55 @@ class POHeader(models.Model):
         2. Incomplete: Rx > 0 but < Ordered
         3. Overdue: Rx == 0 and Today > Est Date
         4. Arriving Soon: Rx == 0 and 0 <= (Est - Today) <= 7
-        5. Waiting: Default
+        5. Waiting: Default (also when the PO has no items)
+        Drafts keep their status until confirmed.
         """
-        items = self.items.all()
-        if not items.exists():
-            self.status = self.STATUS_PENDING
-            # Avoid recursion if called from save, use update or separate save
-            POHeader.objects.filter(pk=self.pk).update(status=self.status)
+        if self.status == self.STATUS_DRAFT:
             return
-
-        # Aggregates
-        aggs = items.aggregate(
+        # Aggregates (one query, item count replaces a separate exists())
+        aggs = self.items.aggregate(
+            item_count=Count('id'),
             total_ordered=Sum('qty_ordered'),
             total_received=Sum('total_received_qty')
         )
-        total_ordered = aggs['total_ordered'] or 0
-        total_received = aggs['total_received'] or 0
-        
-        today = date.today()
-        est_date = self.estimated_date
-        
-        new_status = self.STATUS_PENDING
-        
-        if total_received >= total_ordered and total_ordered > 0:
-            new_status = self.STATUS_COMPLETE
-        elif total_received > 0:
-            new_status = self.STATUS_INCOMPLETE
-        else:
-            # Not received yet
-            if est_date:
-                delta = (est_date - today).days
-                if delta < 0:
-                    new_status = self.STATUS_OVERDUE
-                elif 0 <= delta <= 7:
-                    new_status = self.STATUS_ARRIVING
-                else:
-                    new_status = self.STATUS_PENDING
-            else:
-                 new_status = self.STATUS_PENDING
+        new_status = self.compute_status(
+            aggs['item_count'], aggs['total_ordered'] or 0, aggs['total_received'] or 0, self.estimated_date
+        )
 
         if self.status != new_status:
             self.status = new_status
+            # Avoid recursion if called from save, use update
             POHeader.objects.filter(pk=self.pk).update(status=new_status)
+            # .update() skips signals, invalidate cached data by hand
+            CacheService.bump_version('POHeader')
+
+    @classmethod
+    def refresh_statuses(cls, queryset):
+        """
+        update_status() for many POs at once: one aggregate query plus one
+        UPDATE per status that changed. Returns the number of changed POs.
+        """
+        today = date.today()
+        queryset = queryset.exclude(status=cls.STATUS_DRAFT)
+        # Always the primary: statuses computed from a lagging replica
+        # (po_list reads from it) would overwrite fresher ones
+        rows = queryset.using('default').annotate(
+            item_count=Count('items'),
+            total_ordered=Sum('items__qty_ordered'),
+            total_received=Sum('items__total_received_qty'),
+        ).values_list('pk', 'status', 'estimated_date', 'item_count', 'total_ordered', 'total_received')
+
+        changed = {}
+        for pk, status, estimated_date, item_count, total_ordered, total_received in rows:
+            new_status = cls.compute_status(item_count, total_ordered or 0, total_received or 0, estimated_date, today)
+            if new_status != status:
+                changed.setdefault(new_status, []).append(pk)
+
+        for status, pks in changed.items():
+            cls.objects.filter(pk__in=pks).update(status=status)
+        if changed:
+            CacheService.bump_version('POHeader')
+        return sum(len(pks) for pks in changed.values())
 
     @property
     def total_received_cbm(self):
@@ -215,36 +279,52 @@ class POItem(models.Model):
     total_received_cbm = models.DecimalField(max_digits=10, decimal_places=4, default=0, verbose_name="รับแล้ว (CBM)")
     total_received_weight = models.DecimalField(max_digits=10, decimal_places=2, default=0, verbose_name="รับแล้ว (Weight)")
 
+    # Landed cost (stored so lists/reports can sort and sum in SQL).
+    # Written by POHeader.recompute_landed_costs(); rebuild: manage.py rebuild_landed_costs
+    total_shipping_cost = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name="ค่าขนส่ง (THB)")
+    unit_cost_thb = models.DecimalField(max_digits=14, decimal_places=4, default=0, verbose_name="ต้นทุนต่อชิ้น (THB)")
+    unit_cost_incl_vat = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True, verbose_name="ต้นทุนต่อชิ้นรวม VAT (Domestic)")
+
+    LANDED_COST_FIELDS = ['total_shipping_cost', 'unit_cost_thb', 'unit_cost_incl_vat']
+
     def save(self, *args, **kwargs):
         # We don't calc price here primarily anymore, header does it. 
         # But if we update qty, we should trigger header proration? 
-        # Ideally yes.
+        # Ideally yes. (post_save -> header.prorate_costs() does, for all lines)
+        changed = self.compute_landed_costs(self.header)
         super().save(*args, **kwargs)
+        if changed and self.total_received_qty:
+            SkuValuation.mark_receipts_dirty(POItem.objects.filter(pk=self.pk))
 
-    @property
-    def unit_price_yuan(self):
+    def compute_landed_costs(self, header):
+        """
+        Sets the landed cost fields from this line and its header, no queries.
+        Returns True if a value changed.
+          Shipping   = Received CBM * Header.shipping_rate_thb_cbm
+          Unit cost  = (Total Baht + Shipping) / Qty
+          Incl. VAT  = Unit price * (1 + VAT%) + Shipping / Qty   (DOMESTIC only)
+        """
+        shipping = (Decimal(self.total_received_cbm or 0) * Decimal(header.shipping_rate_thb_cbm or 0)).quantize(Decimal('0.01'))
+        unit_cost = Decimal(0)
+        incl_vat = None
         if self.qty_ordered > 0:
-            return self.price_yuan / Decimal(self.qty_ordered)
-        return 0
+            qty = Decimal(self.qty_ordered)
+            unit_cost = ((Decimal(self.price_baht or 0) + shipping) / qty).quantize(Decimal('0.0001'))
+            if header.order_type == 'DOMESTIC' and self.unit_price is not None:
+                vat = Decimal(header.vat_rate or 0) / 100
+                incl_vat = (Decimal(self.unit_price) * (1 + vat) + shipping / qty).quantize(Decimal('0.0001'))
 
-    @property
-    def total_shipping_cost(self):
-        # Calculated from Received CBM * Header Rate
-        # This is an approximation if viewed before full receipt? 
-        # Or summation of actual receipts? 
-        # Requirement: "Line Estimated Shipping Cost (THB) = Line Received CBM * Header.shipping_rate_thb_cbm"
-        cbm = self.total_received_cbm or 0
-        rate = self.header.shipping_rate_thb_cbm or 0
-        return Decimal(cbm) * Decimal(rate)
+        new = (shipping, unit_cost, incl_vat)
+        changed = new != (self.total_shipping_cost, self.unit_cost_thb, self.unit_cost_incl_vat)
+        self.total_shipping_cost, self.unit_cost_thb, self.unit_cost_incl_vat = new
+        return changed
 
     @property
-    def unit_cost_thb(self):
-        # (Total Baht + Total Shipping Cost) / Qty
-        total_thb = (self.price_baht or 0) + self.total_shipping_cost
+    def unit_price_yuan(self):
         if self.qty_ordered > 0:
-            return total_thb / Decimal(self.qty_ordered)
+            return self.price_yuan / Decimal(self.qty_ordered)
         return 0
-    
+
     def __str__(self):
         return f"{self.sku.product_code} (PO {self.header.po_number})"
 
@@ -303,14 +383,22 @@ class ReceivedPOItem(models.Model):
         data = item.receipts.aggregate(
             total_qty=Sum('received_qty'),
             total_cbm=Sum('received_cbm'),
-            total_weight=Sum('received_weight')
+            total_weight=Sum('received_weight'),
+            first_date=Min('received_date'),
+            first_layer=Min('cost_layer__date'),
         )
         item.total_received_qty = data['total_qty'] or 0
         item.total_received_cbm = data['total_cbm'] or 0
         item.total_received_weight = data['total_weight'] or 0
+        # Received CBM changes the line's landed cost, so all its receipts are
+        # revalued (from the earliest of them, this one, or its old position)
+        item.compute_landed_costs(item.header)
+        dates = [_as_date(d) for d in (data['first_date'], data['first_layer'], self.received_date) if d]
+        SkuValuation.mark_dirty(item.sku_id, min(dates))
+        # Header status is updated by the POItem post_save signal
         item.save()
-        # Trigger header status update
-        item.header.update_status()
+        from utils.leadtimes import LeadTimeService
+        LeadTimeService.refresh([item.sku_id])
 
     @property
     def duration_from_order(self):
@@ -356,12 +444,211 @@ class Sale(models.Model):
     shipping_fee = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     voucher_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 
+    # Cost of goods sold, written by utils/valuation.py (null = not valued yet)
+    cogs_fifo = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, verbose_name="COGS (FIFO)")
+    cogs_avg = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True, verbose_name="COGS (Moving Avg)")
+
     class Meta:
+        # On Postgres the table is partitioned by month (migration 0019, utils/partitions.py);
+        # the (order_id, sku) uniqueness is enforced there by the inventory_sale_key table
         unique_together = ('order_id', 'sku')
+        indexes = [
+            models.Index(fields=['sku', 'date'], name='sale_sku_date_idx'),
+            models.Index(fields=['date', 'sku'], name='sale_date_sku_idx'),
+        ]
 
     def __str__(self):
         return f"{self.order_id} - {self.sku.product_code}"
 
+def _as_date(value):
+    # Sale.date can arrive as a datetime / pandas Timestamp / string from the importer
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, str):
+        return parse_date(value[:10])
+    return value
+
+class CostLayer(models.Model):
+    """
+    FIFO cost layer of one receipt, maintained by utils/valuation.py.
+    cum_qty_before = units of this SKU received before the layer, so FIFO
+    consumption is a range lookup; on_hand_after / avg_cost_after are the
+    moving-average state right after it, the checkpoint a forward
+    recompute starts from.
+    """
+    # Derived data: a deleted receipt leaves its layer behind until the
+    # revaluation it triggers rewrites the SKU's layers (no cascade query)
+    receipt = models.OneToOneField(ReceivedPOItem, on_delete=models.DO_NOTHING, db_constraint=False, related_name='cost_layer')
+    sku = models.ForeignKey(MasterItem, on_delete=models.CASCADE, related_name='cost_layers')
+    date = models.DateField()
+    qty = models.IntegerField()
+    unit_cost = models.DecimalField(max_digits=14, decimal_places=4)
+    cum_qty_before = models.BigIntegerField(default=0)
+    on_hand_after = models.BigIntegerField(default=0)
+    avg_cost_after = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+
+    class Meta:
+        ordering = ['sku', 'date', 'receipt_id']
+        indexes = [models.Index(fields=['sku', 'date'], name='costlayer_sku_date_idx')]
+
+class SkuValuation(models.Model):
+    """
+    Current stock valuation of one SKU (utils/valuation.py).
+    dirty_from: earliest date whose receipts/sales changed since the last
+    valuation; everything from that date on is recomputed.
+    """
+    sku = models.OneToOneField(MasterItem, on_delete=models.CASCADE, primary_key=True, related_name='valuation')
+    on_hand = models.BigIntegerField(default=0)
+    avg_cost = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    stock_value_fifo = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    stock_value_avg = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    dirty_from = models.DateField(null=True, blank=True, db_index=True)
+    valued_at = models.DateTimeField(null=True, blank=True)
+
+    @classmethod
+    def mark_dirty(cls, sku_id, on_date):
+        """
+        Valuation of sku_id must be redone from on_date on. One UPDATE
+        (an INSERT the first time); cheap enough for per-row signals.
+        """
+        on_date = _as_date(on_date)
+        if not sku_id or on_date is None:
+            return
+        updated = cls.objects.filter(sku_id=sku_id).update(
+            dirty_from=Coalesce(Least('dirty_from', Value(on_date)), Value(on_date))
+        )
+        if not updated:
+            # First movement of this SKU; a concurrent insert is merged by the second UPDATE
+            cls.objects.bulk_create([cls(sku_id=sku_id)], ignore_conflicts=True)
+            cls.objects.filter(sku_id=sku_id).update(
+                dirty_from=Coalesce(Least('dirty_from', Value(on_date)), Value(on_date))
+            )
+
+    @classmethod
+    def mark_receipts_dirty(cls, po_items):
+        """
+        Landed cost of these PO lines (a POItem queryset) changed, or they
+        are being deleted: revalue their SKUs from each one's first receipt.
+        One UPDATE however many lines. A SKU with receipts already has its
+        row (mark_dirty made it when they were recorded).
+        """
+        first = Subquery(
+            ReceivedPOItem.objects.filter(po_item__in=po_items, po_item__sku_id=OuterRef('sku_id'))
+            .order_by().values('po_item__sku_id').annotate(first=Min('received_date')).values('first')
+        )
+        cls.objects.filter(sku_id__in=po_items.values('sku_id')).update(
+            dirty_from=Coalesce(Least('dirty_from', first), first, 'dirty_from')
+        )
+
+class SaleDailyRollup(models.Model):
+    """
+    Sales of one SKU per day, platform and shop, summed in SQL from Sale
+    (utils/profitability.py). Rewritten together with the SKU's cost of
+    goods sold by the valuation, so it follows every Sale change.
+    """
+    date = models.DateField()
+    sku = models.ForeignKey(MasterItem, on_delete=models.CASCADE, related_name='daily_rollups')
+    platform = models.CharField(max_length=50)
+    shop_name = models.CharField(max_length=100, blank=True, default='')
+    orders = models.IntegerField(default=0)
+    qty = models.BigIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    net_price = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    fees = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    cogs_fifo = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    cogs_avg = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # Sales without cost of goods yet (not valued, see ValuationService)
+    uncosted = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('date', 'sku', 'platform', 'shop_name')
+        indexes = [models.Index(fields=['sku', 'date'], name='rollup_sku_date_idx')]
+
+class SkuForecast(models.Model):
+    """
+    Demand forecast of one SKU from its daily sales (utils/forecasting.py),
+    recomputed nightly for the whole catalogue (manage.py update_forecasts).
+    """
+    METHOD_SEASONAL = 'seasonal'
+    METHOD_CROSTON = 'croston'
+    METHOD_NONE = 'none'
+    METHOD_CHOICES = [
+        (METHOD_SEASONAL, 'Exponential smoothing + weekday pattern'),
+        (METHOD_CROSTON, 'Croston / SBA (intermittent demand)'),
+        (METHOD_NONE, 'No sales in the history'),
+    ]
+
+    sku = models.OneToOneField(MasterItem, on_delete=models.CASCADE, primary_key=True, related_name='forecast')
+    method = models.CharField(max_length=20, choices=METHOD_CHOICES, default=METHOD_NONE)
+    daily_demand = models.FloatField(default=0, verbose_name="คาดการณ์ขาย/วัน")
+    horizon_demand = models.FloatField(default=0)  # units over the next HORIZON_DAYS
+    variance = models.FloatField(default=0)  # of the daily demand (one-day-ahead errors)
+    days_of_cover = models.FloatField(null=True, blank=True, verbose_name="พอขาย (วัน)")  # None: no demand
+    history_days = models.IntegerField(default=0)
+    sale_days = models.IntegerField(default=0)
+    computed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.sku_id}: {self.daily_demand:.2f}/day ({self.method})"
+
+class LeadTimeStat(models.Model):
+    """
+    Observed lead times (utils/leadtimes.py): days from order to a PO
+    line's first receipt and to its full receipt, over the lines ordered
+    in the last two years. One row per scope key and shipping type
+    ('' = all shipping types). SKU and supplier rows follow receipts as
+    they are saved; the shipping-wide rows are rebuilt nightly
+    (manage.py rebuild_lead_times).
+    """
+    SCOPE_SKU = 'sku'
+    SCOPE_SUPPLIER = 'supplier'  # SupplierInfo.store_name of the SKU
+    SCOPE_SHIPPING = 'shipping'  # every line, key ''
+    SCOPE_CHOICES = [
+        (SCOPE_SKU, 'SKU'),
+        (SCOPE_SUPPLIER, 'Supplier'),
+        (SCOPE_SHIPPING, 'Shipping type'),
+    ]
+    # Estimated arrival of a new PO until enough of its shipping type were received
+    DEFAULT_DAYS = {'CAR': 14, 'SHIP': 25}
+    MIN_COUNT = 3
+
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    key = models.CharField(max_length=255, blank=True, default='')
+    shipping_type = models.CharField(max_length=20, blank=True, default='')
+    first_count = models.IntegerField(default=0)
+    first_mean = models.FloatField(default=0)
+    first_std = models.FloatField(default=0)
+    first_p50 = models.FloatField(default=0)
+    first_p90 = models.FloatField(default=0)
+    first_last = models.IntegerField(default=0)  # of the most recently ordered line
+    full_count = models.IntegerField(default=0)
+    full_mean = models.FloatField(null=True, blank=True)
+    full_p50 = models.FloatField(null=True, blank=True)
+    full_p90 = models.FloatField(null=True, blank=True)
+    full_last = models.IntegerField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('scope', 'key', 'shipping_type')
+
+    def __str__(self):
+        return f"{self.scope} {self.key or '*'} {self.shipping_type or '*'}: p50 {self.first_p50:.0f}d (n={self.first_count})"
+
+    @classmethod
+    def expected_days(cls, shipping_type):
+        """
+        Days from order to arrival for a new PO: DEFAULT_DAYS, or with
+        settings.PO_ESTIMATE_FROM_LEAD_TIMES the median first receipt of
+        its shipping type once MIN_COUNT lines were received (None for an
+        unknown type without history).
+        """
+        if not getattr(settings, 'PO_ESTIMATE_FROM_LEAD_TIMES', False):
+            return cls.DEFAULT_DAYS.get(shipping_type)
+        stat = cls.objects.filter(scope=cls.SCOPE_SHIPPING, key='', shipping_type=shipping_type).first()
+        if stat and stat.first_count >= cls.MIN_COUNT:
+            return round(stat.first_p50)
+        return cls.DEFAULT_DAYS.get(shipping_type)
+
 class JSTStockSnapshot(models.Model):
     sku = models.ForeignKey(MasterItem, on_delete=models.CASCADE)
     quantity = models.IntegerField(verbose_name="คงเหลือ") 
@@ -374,6 +661,55 @@ class JSTStockSnapshot(models.Model):
     class Meta:
         ordering = ['-snapshot_date']
 
+class CurrencyRate(models.Model):
+    """
+    THB per unit of a foreign currency, effective from a date on. The rate
+    of a day is the latest row on or before it. New POs start at today's
+    rate; open ones are repriced with utils/repricing.py.
+    """
+    currency = models.CharField(max_length=3, default='CNY', verbose_name="สกุลเงิน")
+    effective_date = models.DateField(verbose_name="มีผลตั้งแต่วันที่")
+    rate = models.DecimalField(max_digits=10, decimal_places=4, verbose_name="เรทเงิน (THB)")
+    note = models.CharField(max_length=255, blank=True, default='', verbose_name="หมายเหตุ")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = ('currency', 'effective_date')
+        ordering = ['currency', '-effective_date']
+
+    def __str__(self):
+        return f"{self.currency} {self.rate} ({self.effective_date})"
+
+    @classmethod
+    def rate_on(cls, on_date=None, currency='CNY'):
+        """The CurrencyRate in effect on on_date (today by default), or None."""
+        return (
+            cls.objects.filter(currency=currency, effective_date__lte=on_date or date.today())
+            .order_by('-effective_date').first()
+        )
+
+
+class RepricingLog(models.Model):
+    """
+    Audit row of one repricing run (utils/repricing.py): the rate applied
+    and, per PO, the old rate and the Total Baht before / after.
+    """
+    created_at = models.DateTimeField(auto_now_add=True)
+    currency_rate = models.ForeignKey(CurrencyRate, on_delete=models.SET_NULL, null=True, blank=True, related_name='repricings')
+    rate = models.DecimalField(max_digits=10, decimal_places=4)
+    include_complete = models.BooleanField(default=False)
+    triggered_by = models.CharField(max_length=150, blank=True, default='')
+    po_count = models.IntegerField(default=0)
+    item_count = models.IntegerField(default=0)
+    baht_before = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    baht_after = models.DecimalField(max_digits=16, decimal_places=2, default=0)
+    # [{"po_number", "old_rate", "baht_before", "baht_after"}, ...]
+    changes = models.JSONField(default=list)
+
+    def __str__(self):
+        return f"Reprice @ {self.rate} - {self.po_count} PO ({self.created_at:%Y-%m-%d %H:%M})"
+
+
 class ImportLog(models.Model):
     IMPORT_TYPE_CHOICES = [
         ('master', 'Master Data'),
@@ -389,6 +725,10 @@ class ImportLog(models.Model):
     
     import_type = models.CharField(max_length=20, choices=IMPORT_TYPE_CHOICES)
     filename = models.CharField(max_length=255)
+    # Where the upload was stored + SHA-256 computed while streaming (duplicate detection)
+    file_path = models.CharField(max_length=500, blank=True, default='')
+    file_hash = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    file_size = models.BigIntegerField(blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     started_at = models.DateTimeField(auto_now_add=True)
     completed_at = models.DateTimeField(blank=True, null=True)
@@ -428,6 +768,79 @@ class SupplierInfo(models.Model):
         return self.product_name_manual or "N/A"
 
 
+class ReportSnapshot(models.Model):
+    """
+    Precomputed default-filter version of a report (zlib-compressed JSON).
+    Refreshed after imports and receiving, see utils/reports.py.
+    """
+    report = models.CharField(max_length=50, unique=True)
+    data_version = models.CharField(max_length=200)
+    report_date = models.DateField()
+    payload = models.BinaryField()
+    size_bytes = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.report} @ {self.created_at}"
+
+
+class OutboxMessage(models.Model):
+    """
+    E-mail waiting to be sent by the outbox worker (manage.py run_outbox),
+    so requests never wait on SMTP. See utils/outbox.py.
+    """
+    STATUS_PENDING = 'Pending'
+    STATUS_SENT = 'Sent'
+    STATUS_FAILED = 'Failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'Pending'),
+        (STATUS_SENT, 'Sent'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    recipient = models.CharField(max_length=255)
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING)
+    attempts = models.IntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
+
+    def __str__(self):
+        return f"{self.recipient} - {self.subject} ({self.status})"
+
+
+class LoginActivity(models.Model):
+    """
+    Login audit trail. Written with one INSERT during the request; the
+    outbox worker appends unsynced rows to the Google Sheet in batches.
+    """
+    EVENT_CHOICES = [
+        ('otp_requested', 'OTP requested'),
+        ('login', 'Login'),
+        ('otp_failed', 'Wrong OTP'),
+        ('denied', 'Email not allowed'),
+    ]
+
+    email = models.CharField(max_length=255)
+    event = models.CharField(max_length=20, choices=EVENT_CHOICES)
+    ip_address = models.CharField(max_length=45, blank=True, default='')
+    user_agent = models.CharField(max_length=255, blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    synced_at = models.DateTimeField(blank=True, null=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        return f"{self.email} {self.event} @ {self.created_at}"
+
+
 # Signals to ensure Proration happens when Items are changed
 @receiver(post_save, sender=POItem)
 def update_header_proration_on_save(sender, instance, created, **kwargs):
@@ -442,8 +855,91 @@ def update_header_proration_on_save(sender, instance, created, **kwargs):
         instance.header.prorate_costs()
         instance.header.update_status()
 
+def _deleted_with(origin, *model_classes):
+    # The delete() behind a delete signal ('origin') was called on an instance
+    # or a queryset of one of these models, so this row is a cascade of it
+    if isinstance(origin, models.QuerySet):
+        return issubclass(origin.model, model_classes)
+    return isinstance(origin, model_classes)
+
 @receiver(post_delete, sender=POItem)
 def update_header_proration_on_delete(sender, instance, **kwargs):
+    # Items deleted together with their PO: nothing left to recalculate
+    if _deleted_with(kwargs.get('origin'), POHeader):
+        return
     if instance.header:
         instance.header.prorate_costs()
         instance.header.update_status()
+
+
+_sale_signals = threading.local()
+
+@contextmanager
+def deferred_sale_signals():
+    """
+    For writers saving Sale rows one by one (the sales importer): inside,
+    a saved/deleted Sale neither marks its SKU for revaluation nor bumps
+    the 'Sale' cache version. The caller marks each SKU once
+    (SkuValuation.mark_dirty) and bumps 'Sale' after the write.
+    """
+    previous = getattr(_sale_signals, 'deferred', False)
+    _sale_signals.deferred = True
+    try:
+        yield
+    finally:
+        _sale_signals.deferred = previous
+
+def sale_signals_deferred():
+    return getattr(_sale_signals, 'deferred', False)
+
+# Stock valuation: a receipt or sale marks its SKU dirty from its date,
+# utils/valuation.py recomputes forward from there (after imports/receiving, cron)
+@receiver([post_save, post_delete], sender=Sale)
+def mark_sale_valuation_dirty(sender, instance, **kwargs):
+    if _deleted_with(kwargs.get('origin'), MasterItem) or sale_signals_deferred():
+        return
+    SkuValuation.mark_dirty(instance.sku_id, instance.date)
+
+# Receipts saved/deleted one by one mark in ReceivedPOItem._update_parent_stats;
+# these cover the receipts removed together with their PO line / PO
+@receiver(pre_delete, sender=POHeader)
+def mark_po_valuation_dirty(sender, instance, **kwargs):
+    if _deleted_with(kwargs.get('origin'), MasterItem):
+        return
+    SkuValuation.mark_receipts_dirty(POItem.objects.filter(header=instance, total_received_qty__gt=0))
+
+@receiver(pre_delete, sender=POItem)
+def mark_po_item_valuation_dirty(sender, instance, **kwargs):
+    if _deleted_with(kwargs.get('origin'), MasterItem, POHeader) or not instance.total_received_qty:
+        return
+    SkuValuation.mark_receipts_dirty(POItem.objects.filter(pk=instance.pk))
+
+
+# Signals to keep the shared cache consistent across workers.
+# Bumping the model's version makes every cached value built from it unreachable.
+@receiver([post_save, post_delete], sender=MasterItem)
+@receiver([post_save, post_delete], sender=POHeader)
+@receiver([post_save, post_delete], sender=POItem)
+@receiver([post_save, post_delete], sender=ReceivedPOItem)
+@receiver([post_save, post_delete], sender=Sale)
+def bump_cache_version(sender, **kwargs):
+    if sender is Sale and sale_signals_deferred():
+        return
+    CacheService.bump_version(sender.__name__)
+
+# Batches and attachments are shown as part of their PO
+@receiver([post_save, post_delete], sender=POReceiptBatch)
+@receiver([post_save, post_delete], sender=POAttachment)
+def bump_po_header_version(sender, **kwargs):
+    CacheService.bump_version('POHeader')
+
+# Thumbnails for table/list images (originals can be several MB phone photos)
+@receiver(post_save, sender=MasterItem)
+def generate_master_item_thumbnails(sender, instance, **kwargs):
+    ThumbnailService.generate(instance.image)
+
+@receiver(post_save, sender=SupplierInfo)
+def generate_supplier_thumbnails(sender, instance, **kwargs):
+    for field in (instance.product_image, instance.qr_code, instance.other_image):
+        ThumbnailService.generate(field)
+
@@ -0,0 +1,13 @@
+from django import template
+from utils.thumbnails import ThumbnailService
+
+register = template.Library()
+
+
+@register.filter
+def thumb_url(fieldfile, size_name='sm'):
+    """
+    {{ item.image|thumb_url }} or {{ item.image|thumb_url:"md" }}
+    Falls back to the original image when no variant exists yet.
+    """
+    return ThumbnailService.url(fieldfile, size_name) or ''
@@ -1,8 +1,12 @@
-from django.test import TestCase, Client
+from django.test import TestCase, TransactionTestCase, Client, override_settings
 from django.urls import reverse
+from django.conf import settings
+from unittest import skipUnless
 from django.contrib.auth.models import User
-from .models import MasterItem, POHeader, POItem
-from datetime import date
+from django.core.cache import cache
+from .models import MasterItem, POHeader, POItem, ReceivedPOItem
+from utils.cache_utils import CacheService
+from datetime import date, timedelta
 from decimal import Decimal
 
 class POCalculationTests(TestCase):
@@ -16,8 +20,8 @@ class POCalculationTests(TestCase):
 
     def test_po_model_calculations(self):
         """
-        Test that POHeader correctly calculates total CBM and transportation cost
-        based on the new Yuan rate logic.
+        Test that POHeader prorates total_yuan over the items by qty and that
+        shipping cost comes from received CBM * THB/CBM rate.
         """
         # Create Header
         header = POHeader.objects.create(
@@ -25,39 +29,32 @@ class POCalculationTests(TestCase):
             order_date=date.today(),
             order_type="IMPORTED",
             exchange_rate=Decimal("5.0"),
-            shipping_rate_yuan_per_cbm=Decimal("100.00"), # 100 Yuan/CBM
-            shipping_rate_kg=Decimal("10.00")
+            total_yuan=Decimal("150.00"),
+            shipping_rate_thb_cbm=Decimal("100.00"), # 100 THB/CBM
         )
         
-        # Create Items
-        # Item 1: 2 CBM
-        POItem.objects.create(
-            header=header,
-            sku=self.sku,
-            qty_ordered=10,
-            price_yuan=Decimal("10.00"),
-            cbm=Decimal("2.0"),
-            weight=Decimal("10.0")
-        )
+        # Create Items (qty 10 + qty 5)
+        item1 = POItem.objects.create(header=header, sku=self.sku, qty_ordered=10)
+        item2 = POItem.objects.create(header=header, sku=self.sku, qty_ordered=5)
+        header.prorate_costs()
+        item1.refresh_from_db()
+        item2.refresh_from_db()
         
-        # Item 2: 3 CBM
-        POItem.objects.create(
-            header=header,
-            sku=self.sku,
-            qty_ordered=5,
-            price_yuan=Decimal("20.00"),
-            cbm=Decimal("3.0"),
-            weight=Decimal("5.0")
-        )
+        # Yuan split by qty => 150 * 10/15 = 100, 150 * 5/15 = 50
+        self.assertEqual(item1.price_yuan, Decimal("100.0000"))
+        self.assertEqual(item2.price_yuan, Decimal("50.0000"))
+        # Baht = Yuan * Ex Rate
+        self.assertEqual(item1.price_baht, Decimal("500.00"))
+        self.assertEqual(item2.price_baht, Decimal("250.00"))
         
-        # Check Total CBM => 2.0 + 3.0 = 5.0
-        self.assertEqual(header.total_cbm, Decimal("5.0"))
+        # Receive 2 CBM of item 1
+        ReceivedPOItem.objects.create(po_item=item1, received_qty=10, received_cbm=Decimal("2.0"))
+        item1.refresh_from_db()
         
-        # Check Transportation Cost
-        # Formula: Total CBM (5.0) * Rate Yuan (100) * Ex Rate (5.0)
-        # Expected: 5.0 * 100 * 5.0 = 2500.00
-        expected_cost = Decimal("5.0") * Decimal("100.00") * Decimal("5.0")
-        self.assertEqual(header.transportation_cost, expected_cost)
+        # Shipping: Received CBM (2.0) * Rate (100) = 200.00
+        self.assertEqual(item1.total_shipping_cost, Decimal("200.00"))
+        # Unit cost: (500 + 200) / 10 = 70
+        self.assertEqual(item1.unit_cost_thb, Decimal("70"))
 
 class POCreateViewTests(TestCase):
     def setUp(self):
@@ -83,14 +80,14 @@ class POCreateViewTests(TestCase):
             'shipping_type': 'CAR',
             'estimated_date': '2023-10-15',
             'exchange_rate': '5.2',
-            'shipping_rate_yuan_per_cbm': '60.0',
+            'total_yuan': '15.5',
+            'shipping_rate_thb_cbm': '60.0',
+            'yuan_mode': 'top-down',
             
             # Row 1
             'sku_1': 'SKU-VIEW-001',
             'qty_1': '10',
-            'yuan_1': '15.5',
-            'cbm_1': '1.5', # user inputs total CBM for line
-            'kg_1': '20',
+            'carton_qty_1': '2',
         }
         
         # Send AJAX request
@@ -107,14 +104,1671 @@ class POCreateViewTests(TestCase):
         
         # Verify DB
         po = POHeader.objects.get(po_number='PO-AJAX-001')
-        self.assertEqual(po.shipping_rate_yuan_per_cbm, Decimal("60.0"))
+        self.assertEqual(po.shipping_rate_thb_cbm, Decimal("60.0"))
         self.assertEqual(po.exchange_rate, Decimal("5.2"))
         
         item = po.items.first()
         self.assertEqual(item.sku.product_code, 'SKU-VIEW-001')
-        self.assertEqual(item.cbm, Decimal("1.5"))
+        self.assertEqual(item.carton_qty, 2)
         
-        # Verify Item Price Calculation
+        # Verify Item Price Calculation (single line gets all the prorated Yuan)
         # Price Baht = Yuan (15.5) * Ex Rate (5.2) = 80.6
+        self.assertEqual(item.price_yuan, Decimal("15.5"))
         expected_baht = Decimal("15.5") * Decimal("5.2")
         self.assertAlmostEqual(item.price_baht, expected_baht, places=2)
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class CacheServiceTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        MasterItem.objects.create(product_code="CACHE-001", name="Cached", category="A")
+
+    def test_categories_invalidated_on_master_item_write(self):
+        self.assertEqual(CacheService.get_categories(), ["A"])
+        self.assertEqual(CacheService.get_categories(), ["A"])
+
+        MasterItem.objects.create(product_code="CACHE-002", name="New", category="B")
+        self.assertEqual(CacheService.get_categories(), ["A", "B"])
+
+        stats = CacheService.stats()
+        self.assertEqual(stats['names']['categories']['hits'], 1)
+        self.assertEqual(stats['names']['categories']['misses'], 2)
+
+    def test_unrelated_write_keeps_entry(self):
+        calls = []
+        def compute():
+            calls.append(1)
+            return "value"
+
+        CacheService.get_or_set('fragment', ('Sale',), compute)
+        MasterItem.objects.create(product_code="CACHE-003", name="Other")
+        CacheService.get_or_set('fragment', ('Sale',), compute)
+        self.assertEqual(len(calls), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='etaguser', password='password')
+        self.client = Client()
+        self.client.login(username='etaguser', password='password')
+        self.sku = MasterItem.objects.create(product_code="ETAG-001", name="ETag Item", current_stock=5)
+
+    def test_stock_report_returns_304_until_data_changes(self):
+        url = reverse('stock_report')
+        first = self.client.get(url)
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+
+        again = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(again.status_code, 304)
+
+        self.sku.note1 = "changed"
+        self.sku.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], etag)
+
+    def test_filters_are_part_of_the_version(self):
+        url = reverse('stock_report')
+        etag = self.client.get(url)['ETag']
+        filtered = self.client.get(url, {'search': 'ETAG'}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(filtered.status_code, 200)
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class ReportSnapshotTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='snapuser', password='password')
+        self.client = Client()
+        self.client.login(username='snapuser', password='password')
+        MasterItem.objects.create(product_code="SNAP-001", name="Snapshot Item", current_stock=3)
+
+    def test_default_stock_report_served_from_snapshot(self):
+        from utils.reports import ReportSnapshotService
+        ReportSnapshotService.refresh_all()
+
+        response = self.client.get(reverse('stock_report'))
+        self.assertIsNotNone(response.context['snapshot_at'])
+        self.assertEqual(response.context['stock_items'][0]['sku'], "SNAP-001")
+
+        # Filters that differ from the default are computed live
+        response = self.client.get(reverse('stock_report'), {'search': 'SNAP'})
+        self.assertIsNone(response.context['snapshot_at'])
+
+    def test_snapshot_ignored_after_data_changes(self):
+        from utils.reports import ReportSnapshotService
+        ReportSnapshotService.refresh_all()
+        MasterItem.objects.create(product_code="SNAP-002", name="Added Later")
+
+        response = self.client.get(reverse('stock_report'))
+        self.assertIsNone(response.context['snapshot_at'])
+        self.assertEqual(len(response.context['stock_items']), 2)
+
+
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        import tempfile
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_thumbnails_created_on_save_and_used_for_url(self):
+        from io import BytesIO
+        from PIL import Image
+        from django.core.files.base import ContentFile
+        from utils.thumbnails import ThumbnailService
+
+        buf = BytesIO()
+        Image.new('RGB', (1200, 800), 'red').save(buf, 'JPEG')
+        item = MasterItem.objects.create(product_code="IMG-001", name="Image Item")
+        item.image.save("IMG-001.jpg", ContentFile(buf.getvalue()), save=True)
+
+        url = ThumbnailService.url(item.image)
+        self.assertIn("/thumbs/", url)
+        with Image.open(ThumbnailService.targets_for(item.image.name, force=True)[0][1]) as thumb:
+            self.assertLessEqual(max(thumb.size), 80)
+
+    def test_url_falls_back_to_original(self):
+        from utils.thumbnails import ThumbnailService
+        item = MasterItem(product_code="IMG-002", name="No Thumb", image="products/missing.jpg")
+        self.assertEqual(ThumbnailService.url(item.image), item.image.url)
+
+
+class ImportUploadTests(TestCase):
+    def setUp(self):
+        import tempfile
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+        self.user = User.objects.create_user(username='importer', password='password')
+        self.client = Client()
+        self.client.login(username='importer', password='password')
+        # Don't actually run the import in a thread during tests
+        from unittest.mock import patch
+        self.thread_patch = patch('inventory.views.threading.Thread')
+        self.thread_patch.start()
+
+    def tearDown(self):
+        import shutil
+        self.thread_patch.stop()
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_duplicate_file_is_rejected_unless_forced(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import ImportLog
+
+        content = b"same workbook bytes"
+        for _ in range(2):
+            self.client.post(reverse('import_data'), {'type': 'sales', 'file': SimpleUploadedFile("sales.xlsx", content)})
+        self.assertEqual(ImportLog.objects.count(), 1)
+        self.assertEqual(len(ImportLog.objects.get().file_hash), 64)
+
+        self.client.post(reverse('import_data'), {'type': 'sales', 'force': '1', 'file': SimpleUploadedFile("sales.xlsx", content)})
+        self.assertEqual(ImportLog.objects.count(), 2)
+
+    def test_chunked_upload_resumes_from_server_offset(self):
+        import hashlib
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        from .models import ImportLog
+
+        url = reverse('import_upload_chunk')
+        content = b"0123456789" * 10
+        upload_id = self.client.post(url, {'action': 'start', 'type': 'stock', 'filename': 'stock.xlsx', 'size': len(content)}).json()['upload_id']
+
+        self.client.post(url, {'action': 'chunk', 'upload_id': upload_id, 'offset': 0, 'chunk': SimpleUploadedFile("c", content[:40])})
+        # Client lost track (e.g. reconnect) and resends the first slice
+        response = self.client.post(url, {'action': 'chunk', 'upload_id': upload_id, 'offset': 0, 'chunk': SimpleUploadedFile("c", content[:40])})
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.client.get(url, {'upload_id': upload_id}).json()['offset'], 40)
+
+        self.client.post(url, {'action': 'chunk', 'upload_id': upload_id, 'offset': 40, 'chunk': SimpleUploadedFile("c", content[40:])})
+        self.assertTrue(self.client.post(url, {'action': 'finish', 'upload_id': upload_id}).json()['success'])
+
+        log = ImportLog.objects.get()
+        self.assertEqual(log.file_hash, hashlib.sha256(content).hexdigest())
+        self.assertEqual(log.file_size, len(content))
+
+
+class ChunkedUploadLockTests(TestCase):
+    # Separate from ImportUploadTests, which patches threading.Thread
+    def setUp(self):
+        import tempfile
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_retry_during_slow_write_is_not_appended_twice(self):
+        import threading
+        import time
+        from utils.uploads import ChunkedUploadService
+
+        content = b"0123456789" * 4
+        upload_id = ChunkedUploadService.start('stock.xlsx', 80, 'stock')
+        writing = threading.Event()
+
+        class SlowChunk:
+            size = len(content)
+
+            def chunks(self, chunk_size):
+                yield content[:20]
+                writing.set()
+                time.sleep(0.2)
+                yield content[20:]
+
+        first = threading.Thread(target=ChunkedUploadService.append, args=(upload_id, 0, SlowChunk()))
+        first.start()
+        writing.wait(5)
+        # Same slice resent while the first request is mid-write
+        with self.assertRaisesMessage(ValueError, 'Offset mismatch: expected 40, got 0'):
+            ChunkedUploadService.append(upload_id, 0, SlowChunk())
+        first.join()
+        self.assertEqual(ChunkedUploadService.get_offset(upload_id), 40)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, PERF_MONITORING_ENABLED=True, PERF_SLOW_REQUEST_MS=0)
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='perfuser', password='password')
+        self.client = Client()
+        self.client.login(username='perfuser', password='password')
+
+    def test_server_timing_header_and_slow_log(self):
+        with self.assertLogs('inventory.performance', level='WARNING') as logs:
+            response = self.client.get(reverse('po_list'))
+
+        self.assertIn('db;dur=', response['Server-Timing'])
+        self.assertIn('tpl;dur=', response['Server-Timing'])
+        self.assertIn('"view": "po_list"', logs.output[-1])
+
+    def test_sql_shapes_ignore_literals(self):
+        from utils.query_tracking import normalize_sql
+        self.assertEqual(
+            normalize_sql('SELECT * FROM "t" WHERE "id" = 5 AND "code" IN (%s, %s)'),
+            normalize_sql("SELECT * FROM \"t\" WHERE \"id\" = 12 AND \"code\" IN ('A', 'B', 'C')"),
+        )
+
+
+@override_settings(CACHES=LOCMEM_CACHE, PROFILING_ENABLED=True)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        import tempfile
+        cache.clear()
+        self.profile_dir = tempfile.mkdtemp()
+        self.override = override_settings(PROFILE_DIR=self.profile_dir, PROFILE_MAX_ENTRIES=2)
+        self.override.enable()
+        self.staff = User.objects.create_user(username='staffer', password='password', is_staff=True)
+        self.client = Client()
+        self.client.login(username='staffer', password='password')
+        MasterItem.objects.create(product_code="PROF-001", name="Profiled Item")
+
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.profile_dir, ignore_errors=True)
+
+    def test_staff_profile_is_captured_and_ring_buffer_bounded(self):
+        from utils.profiling import ProfileStore
+
+        response = self.client.get(reverse('stock_report'), {'status': 'low', '_profile': '1'})
+        profile_id = response['X-Profile-Id']
+        data = ProfileStore.load(profile_id)
+        self.assertEqual(data['meta']['view'], 'stock_report')
+        self.assertTrue(data['queries'])
+
+        sql = self.client.get(reverse('profile_download', args=[profile_id, 'sql']))
+        self.assertIn(b'inventory_masteritem', sql.content)
+
+        self.client.get(reverse('stock_report'), {'_profile': 'sample'})
+        self.client.get(reverse('stock_report'), {'_profile': 'sample'})
+        self.assertEqual(len(ProfileStore.list_ids()), 2)
+
+    def test_normal_users_are_never_profiled(self):
+        User.objects.create_user(username='regular', password='password')
+        client = Client()
+        client.login(username='regular', password='password')
+        response = client.get(reverse('stock_report'), {'_profile': '1'})
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(client.get(reverse('profiles')).status_code, 403)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, METRICS_ENABLED=True, METRICS_ALLOWED_IPS=['127.0.0.1'])
+class MetricsTests(TestCase):
+    def setUp(self):
+        import tempfile
+        cache.clear()
+        self.metrics_dir = tempfile.mkdtemp()
+        self.override = override_settings(METRICS_DIR=self.metrics_dir)
+        self.override.enable()
+        from utils.metrics import MetricsService
+        MetricsService.reset()
+        self.user = User.objects.create_user(username='metricsuser', password='password')
+        self.client = Client()
+        self.client.login(username='metricsuser', password='password')
+
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.metrics_dir, ignore_errors=True)
+
+    def test_view_latency_and_queue_metrics_exposed(self):
+        from .models import ImportLog
+        ImportLog.objects.create(import_type='sales', filename='big.xlsx', status='Pending')
+        self.client.get(reverse('stock_report'))
+
+        body = self.client.get(reverse('metrics'), REMOTE_ADDR='127.0.0.1').content.decode()
+        self.assertIn('jst_http_requests_total{method="GET",status="200",view="stock_report"} 1', body)
+        self.assertIn('jst_http_request_duration_seconds_count{view="stock_report"} 1', body)
+        self.assertIn('jst_import_queue_depth{status="Pending"} 1', body)
+
+    def test_metrics_merged_across_worker_files(self):
+        import json, os
+        from utils.metrics import MetricsService
+        # Another worker's dump
+        with open(os.path.join(self.metrics_dir, '99999.json'), 'w') as f:
+            json.dump({'counters': [['jst_import_rows_total', [['import_type', 'sales'], ['result', 'success']], 40]], 'histograms': []}, f)
+        MetricsService.inc('jst_import_rows_total', 2, import_type='sales', result='success')
+
+        counters, _ = MetricsService.collect()
+        self.assertEqual(counters[('jst_import_rows_total', (('import_type', 'sales'), ('result', 'success')))], 42)
+
+    def test_metrics_forbidden_for_other_clients(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 403)
+
+
+class ScaleDataTests(TestCase):
+    def test_generation_is_reproducible(self):
+        from django.db import connection
+        from django.db.models import Sum
+        from django.test.utils import CaptureQueriesContext
+        from .models import Sale, JSTStockSnapshot
+        from utils.scale_data import ScaleDataGenerator
+
+        end = date(2026, 1, 31)
+        counts = ScaleDataGenerator(scale=0.01, seed=7, years=1, snapshot_days=3, end_date=end).generate()
+        first_total = Sale.objects.aggregate(t=Sum('total_price'))['t']
+        self.assertEqual(counts['items'], 10)
+        self.assertEqual(
+            set(JSTStockSnapshot.objects.values_list('snapshot_date', flat=True)),
+            {date(2026, 1, 29), date(2026, 1, 30), date(2026, 1, 31)},
+        )
+        self.assertTrue(POHeader.objects.filter(order_type='IMPORTED').exists())
+
+        # A real SKU that merely looks generated is left alone
+        real = MasterItem.objects.create(product_code='SC-000001', name='Real')
+        Sale.objects.create(order_id='SC-REAL-1', sku=real, qty=1, price=10, status='Completed', platform='Shopee', date=end)
+        # No per-sale signal work: sales go in DELETE batches, each PO marks its receipts once
+        sales, pos = Sale.objects.count(), POHeader.objects.count()
+        with CaptureQueriesContext(connection) as queries:
+            ScaleDataGenerator.clear()
+        self.assertLess(len(queries), sales / 10)
+        self.assertEqual(sum(q['sql'].startswith('UPDATE "inventory_skuvaluation"') for q in queries), pos)
+        self.assertEqual(list(Sale.objects.values_list('order_id', flat=True)), ['SC-REAL-1'])
+        self.assertEqual(list(MasterItem.objects.values_list('pk', flat=True)), ['SC-000001'])
+        self.assertFalse(POHeader.objects.exists())
+        real.delete()
+        ScaleDataGenerator(scale=0.01, seed=7, years=1, snapshot_days=3, end_date=end).generate()
+        self.assertEqual(Sale.objects.aggregate(t=Sum('total_price'))['t'], first_total)
+
+
+class BenchmarkTests(TestCase):
+    def test_run_rolls_back_and_counts_queries(self):
+        from utils.benchmarking import BenchmarkRunner
+
+        runner = BenchmarkRunner(repeat=2, log=lambda msg: None)
+        data = runner.run([0.01], ['receive_items_50', 'view_stock_report_cold'])
+
+        result = data['results']['0.01/receive_items_50']
+        self.assertEqual(result['runs'], 2)
+        self.assertGreater(result['queries'], 0)
+        self.assertIn('peak_kb', result)
+        self.assertIn('0.01/view_stock_report_cold', data['results'])
+        # Dataset and receipts were rolled back
+        self.assertFalse(MasterItem.objects.exists())
+        self.assertFalse(ReceivedPOItem.objects.exists())
+
+    def test_compare_flags_regressions_beyond_margin(self):
+        from utils.benchmarking import compare_results
+
+        baseline = {'results': {'1/x': {'wall_ms': 100, 'queries': 10, 'peak_kb': 1000}}}
+        current = {'results': {'1/x': {'wall_ms': 115, 'queries': 13, 'peak_kb': 1100}, '1/new': {'wall_ms': 1}}}
+        regressions = compare_results(current, baseline, max_regression=0.2)
+        self.assertEqual(len(regressions), 1)
+        self.assertIn('1/x queries: 10 -> 13', regressions[0])
+        self.assertEqual(compare_results(current, baseline, max_regression=0.5), [])
+
+
+class LoadTestLoginTests(TestCase):
+    def test_disabled_without_token(self):
+        with self.settings(LOADTEST_LOGIN_TOKEN=''):
+            response = self.client.post(reverse('loadtest_login'), {'token': ''})
+        self.assertEqual(response.status_code, 404)
+
+    def test_token_logs_in_dedicated_user_only(self):
+        with self.settings(LOADTEST_LOGIN_TOKEN='secret', LOADTEST_USERNAME='loadtest'):
+            self.assertEqual(self.client.post(reverse('loadtest_login'), {'token': 'wrong'}).status_code, 403)
+            response = self.client.post(reverse('loadtest_login'), {'token': 'secret'})
+        self.assertEqual(response.json()['user'], 'loadtest')
+        self.assertEqual(self.client.get(reverse('stock_report')).status_code, 200)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, METRICS_ALLOWED_IPS=['127.0.0.1'])
+class QueryBudgetTests(TestCase):
+    """
+    Every URL in inventory/urls.py runs against a small and a 4x larger
+    dataset: the query count must not grow with the rows (N+1) and must
+    stay within the view's budget. New URLs need an entry in CASES.
+    """
+
+    SMALL_SCALE = 0.01
+    LARGE_SCALE = 0.04
+
+    # url name -> (method, budget); args/data come from request_for()
+    CASES = {
+        'login': ('GET', 2),
+        'logout': ('GET', 4),
+        'otp_verify': ('GET', 1),
+        'loadtest_login': ('POST', 1),
+        'sales_summary': ('GET', 9),
+        'stock_report': ('GET', 7),
+        'po_list': ('GET', 11),
+        'profitability_report': ('GET', 7),
+        'replenishment': ('GET', 8),
+        'get_search_options': ('GET', 4),
+        'supplier_info': ('GET', 4),
+        'save_supplier_info': ('POST', 4),
+        'delete_supplier_info': ('POST', 4),
+        'import_data': ('GET', 2),
+        'import_upload_chunk': ('GET', 2),
+        'po_detail': ('GET', 9),
+        # +1 on receiving / deleting a PO: marking the SKUs for revaluation;
+        # +4 per receipt: refreshing its SKU's / supplier's lead-time stats
+        'receive_po_item': ('POST', 17),
+        'po_create': ('GET', 4),
+        'delete_received_item': ('POST', 17),
+        'delete_po': ('POST', 13),
+        'po_cost_simulation': ('GET', 4),
+        'update_min_limit': ('POST', 2),
+        'product_list': ('GET', 4),
+        'get_product_detail': ('GET', 3),
+        'save_product': ('POST', 3),
+        'get_po_history': ('GET', 4),
+        'get_sales_history': ('GET', 3),
+        'metrics': ('GET', 3),
+        'cache_stats': ('GET', 2),
+        'profiles': ('GET', 2),
+        'profile_download': ('GET', 2),
+    }
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='budget', password='pw', is_staff=True)
+
+    def seed(self, scale):
+        from .models import SupplierInfo
+        from utils.scale_data import ScaleDataGenerator
+
+        ScaleDataGenerator.clear()
+        SupplierInfo.objects.all().delete()
+        ScaleDataGenerator(scale=scale, seed=3, years=1, snapshot_days=2, log=lambda msg: None).generate()
+        items = list(MasterItem.objects.all())
+        SupplierInfo.objects.bulk_create([
+            SupplierInfo(sku=item, store_name=f"Store {i}", note='x') for i, item in enumerate(items)
+        ])
+
+    def request_for(self, name):
+        """
+        (path, data) hitting the biggest objects so detail pages grow too.
+        """
+        from django.db.models import Count
+        from .models import SupplierInfo, Sale
+        from utils.scale_data import SKU_PREFIX
+
+        po = POHeader.objects.annotate(n=Count('items')).order_by('-n', 'id').first()
+        po_item = POItem.objects.filter(header=po).order_by('id').first()
+        receipt = ReceivedPOItem.objects.annotate(n=Count('po_item__header__items')).order_by('-n', 'id').first()
+        top_sku = Sale.objects.values('sku__product_code').annotate(n=Count('id')).order_by('-n', 'sku__product_code').first()['sku__product_code']
+        received_sku = ReceivedPOItem.objects.values('po_item__sku__product_code').annotate(n=Count('id')).order_by('-n').first()['po_item__sku__product_code']
+        supplier = SupplierInfo.objects.order_by('id').first()
+        last_sale = Sale.objects.order_by('-date').values_list('date', flat=True).first()
+
+        if name in ('sales_summary', 'profitability_report'):
+            return reverse(name), {'start_date': f"{last_sale - timedelta(days=29):%Y-%m-%d}", 'end_date': f"{last_sale:%Y-%m-%d}"}
+        if name == 'get_search_options':
+            return reverse(name), {'sku_query': SKU_PREFIX, 'po_number': ''}
+        if name in ('po_detail', 'delete_po'):
+            return reverse(name, args=[po.id]), {}
+        if name == 'receive_po_item':
+            return reverse(name, args=[po_item.id]), {'received_qty': 1, 'received_date': f"{date.today():%Y-%m-%d}"}
+        if name == 'delete_received_item':
+            return reverse(name, args=[receipt.id]), {}
+        if name == 'delete_supplier_info':
+            return reverse(name, args=[supplier.id]), {}
+        if name == 'save_supplier_info':
+            return reverse(name), {'store_name': 'New store', 'sku_code': top_sku}
+        if name == 'update_min_limit':
+            return reverse(name, args=[top_sku]), {'min_limit': 5}
+        if name == 'get_product_detail':
+            return reverse(name, args=[top_sku]), {}
+        if name == 'save_product':
+            return reverse(name), {'product_code': top_sku, 'name': 'Renamed'}
+        if name == 'get_po_history':
+            return reverse(name, args=[received_sku]), {}
+        if name == 'get_sales_history':
+            return reverse(name, args=[top_sku]), {}
+        if name == 'profile_download':
+            return reverse(name, args=['20260101-000000-00000000', 'json']), {}
+        if name == 'po_cost_simulation':
+            return reverse(name), {'rate': ['4.8', '5.2'], 'freight': ['3500', '4500']}
+        if name == 'replenishment':
+            # Demand for every SKU, so the suggestion pass runs in full
+            from .models import SkuForecast
+            SkuForecast.objects.bulk_create(
+                [SkuForecast(sku_id=sku, method='seasonal', daily_demand=5, variance=4)
+                 for sku in MasterItem.objects.values_list('pk', flat=True)],
+                ignore_conflicts=True,
+            )
+            return reverse(name), {}
+        if name == 'loadtest_login':
+            return reverse(name), {'token': 'x'}
+        return reverse(name), {}
+
+    def measure(self, name):
+        from django.db import connection
+        from unittest.mock import patch
+        from utils.query_tracking import QueryTracker
+
+        method, _ = self.CASES[name]
+        path, data = self.request_for(name)
+        cache.clear()
+        self.client.force_login(self.user)
+        tracker = QueryTracker()
+        # Snapshot refresh threads would run on their own connection
+        with patch('utils.reports.ReportSnapshotService.refresh_in_background'), connection.execute_wrapper(tracker):
+            response = getattr(self.client, method.lower())(path, data)
+        self.assertLess(response.status_code, 500, f"{name} failed")
+        return tracker
+
+    def describe(self, tracker):
+        return "\n".join(f"  {r['count']}x {r['sql'][:300]}" for r in tracker.top_repeated(limit=5))
+
+    def test_every_url_has_a_budget(self):
+        from .urls import urlpatterns
+        self.assertEqual({p.name for p in urlpatterns} - set(self.CASES), set())
+
+    def test_query_counts_within_budget_and_flat(self):
+        small = {}
+        self.seed(self.SMALL_SCALE)
+        for name in self.CASES:
+            small[name] = self.measure(name)
+        self.seed(self.LARGE_SCALE)
+        for name, (method, budget) in self.CASES.items():
+            large = self.measure(name)
+            with self.subTest(view=name):
+                self.assertLessEqual(
+                    large.count, small[name].count,
+                    f"{name}: {small[name].count} queries -> {large.count} with 4x data\n{self.describe(large)}",
+                )
+                self.assertLessEqual(
+                    large.count, budget,
+                    f"{name}: {large.count} queries, budget {budget}\n{self.describe(large)}",
+                )
+
+
+class StartupImportTests(TestCase):
+    def test_web_worker_does_not_load_heavy_libraries(self):
+        import subprocess, sys
+        from django.conf import settings
+
+        # Fresh interpreter, like a gunicorn worker: WSGI app + every view module
+        code = (
+            "import sys\n"
+            "from django.core.wsgi import get_wsgi_application\n"
+            "get_wsgi_application()\n"
+            "from django.urls import get_resolver\n"
+            "get_resolver().url_patterns\n"
+            "print('loaded:' + ','.join(m for m in ('pandas', 'numpy', 'requests', 'gspread', 'google.oauth2') if m in sys.modules))\n"
+        )
+        proc = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, cwd=str(settings.BASE_DIR))
+        self.assertEqual(proc.returncode, 0, proc.stderr[-2000:])
+        self.assertEqual(proc.stdout.strip().splitlines()[-1], 'loaded:')
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend', OUTBOX_MAX_ATTEMPTS=3)
+class OutboxTests(TestCase):
+    def test_login_only_queues_otp(self):
+        from unittest import mock
+        from django.core import mail
+        from .models import OutboxMessage, LoginActivity
+
+        with mock.patch('inventory.views.get_allowed_users', return_value=['boss@example.com']):
+            response = self.client.post(reverse('login'), {'email': 'Boss@example.com'})
+            self.client.post(reverse('login'), {'email': 'stranger@example.com'})
+        self.assertRedirects(response, reverse('otp_verify'))
+        self.assertEqual(len(mail.outbox), 0)
+        message = OutboxMessage.objects.get()
+        self.assertEqual(message.recipient, 'boss@example.com')
+        self.assertIn(self.client.session['otp_code'], message.body)
+        self.assertEqual(
+            sorted(LoginActivity.objects.values_list('event', flat=True)), ['denied', 'otp_requested']
+        )
+
+    def test_send_pending_delivers_and_marks_sent(self):
+        from django.core import mail
+        from utils.outbox import OutboxService
+        from .models import OutboxMessage
+
+        OutboxService.enqueue_email('a@example.com', 'OTP', '123456')
+        OutboxService.enqueue_email('b@example.com', 'OTP', '654321')
+        self.assertEqual(OutboxService.send_pending(), (2, 0))
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), ['a@example.com', 'b@example.com'])
+        self.assertEqual(OutboxMessage.objects.filter(status=OutboxMessage.STATUS_SENT).count(), 2)
+        # Nothing left to send
+        self.assertEqual(OutboxService.send_pending(), (0, 0))
+
+    def test_smtp_failure_backs_off_then_gives_up(self):
+        from unittest import mock
+        from django.utils import timezone
+        from utils.outbox import OutboxService
+        from .models import OutboxMessage
+
+        message = OutboxService.enqueue_email('a@example.com', 'OTP', '123456')
+        with mock.patch('utils.outbox.get_connection', side_effect=OSError('connection refused')):
+            self.assertEqual(OutboxService.send_pending(), (0, 1))
+            message.refresh_from_db()
+            self.assertEqual((message.status, message.attempts), (OutboxMessage.STATUS_PENDING, 1))
+            self.assertGreater(message.next_attempt_at, timezone.now())
+            # Not due yet
+            self.assertEqual(OutboxService.send_pending(), (0, 0))
+
+            for _ in range(2):
+                OutboxMessage.objects.update(next_attempt_at=timezone.now())
+                OutboxService.send_pending()
+        message.refresh_from_db()
+        self.assertEqual((message.status, message.attempts), (OutboxMessage.STATUS_FAILED, 3))
+        self.assertIn('connection refused', message.last_error)
+
+    def test_login_activity_flushed_in_one_batch(self):
+        from unittest import mock
+        from django.test import RequestFactory
+        from utils.outbox import LoginActivityService
+        from .models import LoginActivity
+
+        request = RequestFactory().get('/', HTTP_X_REAL_IP='10.0.0.5')
+        for i in range(3):
+            LoginActivityService.record(request, f"user{i}@example.com", 'login')
+
+        with self.settings(LOGIN_ACTIVITY_SHEET_ID='sheet'), \
+                mock.patch('utils.auth_utils.append_login_activity') as append:
+            self.assertEqual(LoginActivityService.flush(), 3)
+            self.assertEqual(LoginActivityService.flush(), 0)
+        append.assert_called_once()
+        sheet_id, rows = append.call_args.args
+        self.assertEqual((sheet_id, len(rows)), ('sheet', 3))
+        self.assertEqual(rows[0][1:4], ['user0@example.com', 'login', '10.0.0.5'])
+        self.assertFalse(LoginActivity.objects.filter(synced_at__isnull=True).exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class SalePartitionTests(TestCase):
+    """
+    Range queries must only read the months they ask for. The EXPLAIN
+    checks need the partitioned table, i.e. Postgres.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        from utils.partitions import SalePartitionService
+        from .models import Sale
+
+        SalePartitionService.ensure_partitions(date(2025, 1, 1), date(2025, 12, 31))
+        cls.item = MasterItem.objects.create(product_code='PART-1', name='Partitioned')
+        for month in (1, 3, 6, 9):
+            Sale.objects.create(
+                order_id=f"P-{month}", sku=cls.item, qty=month, price=10, total_price=10 * month,
+                status='Completed', platform='Shopee', date=date(2025, month, 15),
+            )
+        User.objects.create_user(username='partition', password='password')
+
+    def setUp(self):
+        cache.clear()
+        self.client.login(username='partition', password='password')
+
+    def require_partitions(self):
+        from unittest import SkipTest
+        from utils.partitions import SalePartitionService
+        if not SalePartitionService.is_partitioned():
+            raise SkipTest('Sale is only partitioned on Postgres')
+
+    def partitions_read(self, url, params):
+        """
+        Partition tables in the EXPLAIN plans of every Sale query the view runs.
+        """
+        import re
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        sale_queries = [q['sql'] for q in ctx.captured_queries if '"inventory_sale"' in q['sql']]
+        self.assertTrue(sale_queries)
+        scanned = set()
+        with connection.cursor() as cursor:
+            for sql in sale_queries:
+                cursor.execute('EXPLAIN ' + sql)
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+                scanned |= set(re.findall(r'inventory_sale_y\d{4}m\d{2}', plan))
+        return scanned
+
+    def test_daily_sales_range_prunes_partitions(self):
+        self.require_partitions()
+        scanned = self.partitions_read(reverse('sales_summary'), {'start_date': '2025-03-01', 'end_date': '2025-03-31'})
+        self.assertEqual(scanned, {'inventory_sale_y2025m03'})
+
+    def test_sales_history_range_prunes_partitions(self):
+        self.require_partitions()
+        url = reverse('get_sales_history', args=['PART-1'])
+        scanned = self.partitions_read(url, {'start_date': '2025-05-01', 'end_date': '2025-06-30'})
+        self.assertEqual(scanned, {'inventory_sale_y2025m05', 'inventory_sale_y2025m06'})
+        # Without a range every month is read
+        self.assertTrue({'inventory_sale_y2025m01', 'inventory_sale_y2025m09'} <= self.partitions_read(url, {}))
+
+    def test_order_sku_unique_across_partitions(self):
+        from django.db import IntegrityError, transaction
+        from .models import Sale
+
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Sale.objects.create(order_id='P-1', sku=self.item, qty=1, price=10, status='Completed', platform='Shopee', date=date(2025, 11, 1))
+        # Moving a row to another month keeps its key, deleting frees it
+        Sale.objects.filter(order_id='P-1').update(date=date(2025, 12, 1))
+        Sale.objects.filter(order_id='P-3').delete()
+        Sale.objects.create(order_id='P-3', sku=self.item, qty=1, price=10, status='Completed', platform='Shopee', date=date(2025, 2, 1))
+        self.assertEqual(Sale.objects.filter(order_id__in=['P-1', 'P-3']).count(), 2)
+
+    def test_sales_history_date_filter(self):
+        response = self.client.get(
+            reverse('get_sales_history', args=['PART-1']), {'start_date': '2025-03-01', 'end_date': '2025-06-30'}
+        )
+        self.assertEqual([s.qty for s in response.context['sales']], [6, 3])
+        response = self.client.get(reverse('get_sales_history', args=['PART-1']), {'start_date': 'bad'})
+        self.assertEqual(len(response.context['sales']), 4)
+
+    def test_missing_month_created_on_demand(self):
+        self.require_partitions()
+        from utils.partitions import SalePartitionService
+
+        self.assertEqual(SalePartitionService.ensure_for_dates([date(2031, 2, 10)]), ['inventory_sale_y2031m02'])
+        self.assertEqual(SalePartitionService.ensure_for_dates([date(2031, 2, 20)]), [])
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHE, RETENTION_SNAPSHOT_DAILY_DAYS=90, RETENTION_SNAPSHOT_WEEKLY_DAYS=365,
+    RETENTION_IMPORT_FILE_COMPRESS_DAYS=7, RETENTION_IMPORT_FILE_DELETE_DAYS=180,
+    RETENTION_PARTIAL_UPLOAD_DAYS=2, RETENTION_ERROR_LOG_DAYS=30, RETENTION_ERROR_LOG_MAX_CHARS=100,
+    RETENTION_BATCH_SIZE=50,
+)
+class RetentionTests(TestCase):
+    def setUp(self):
+        import tempfile
+        self.media_root = tempfile.mkdtemp()
+        self.override = override_settings(MEDIA_ROOT=self.media_root)
+        self.override.enable()
+
+    def tearDown(self):
+        import shutil
+        self.override.disable()
+        shutil.rmtree(self.media_root, ignore_errors=True)
+
+    def test_snapshots_downsampled_to_weekly_then_monthly(self):
+        from .models import JSTStockSnapshot
+        from utils.retention import RetentionService
+
+        today = date(2026, 6, 30)
+        item = MasterItem.objects.create(product_code='RET-1', name='Retention')
+        snapshots = JSTStockSnapshot.objects.bulk_create([JSTStockSnapshot(sku=item, quantity=i) for i in range(500)])
+        for i, snapshot in enumerate(snapshots):
+            snapshot.snapshot_date = today - timedelta(days=i)
+        JSTStockSnapshot.objects.bulk_update(snapshots, ['snapshot_date'])
+
+        self.assertGreater(RetentionService.downsample_snapshots(dry_run=True, today=today), 0)
+        self.assertEqual(JSTStockSnapshot.objects.count(), 500)
+        deleted = RetentionService.downsample_snapshots(today=today)
+
+        dates = list(JSTStockSnapshot.objects.order_by('-snapshot_date').values_list('snapshot_date', flat=True))
+        self.assertEqual(len(dates), 500 - deleted)
+        daily = [d for d in dates if d >= today - timedelta(days=90)]
+        weekly = [d for d in dates if today - timedelta(days=365) <= d < today - timedelta(days=90)]
+        monthly = [d for d in dates if d < today - timedelta(days=365)]
+        self.assertEqual(len(daily), 91)
+        self.assertEqual(len(weekly), len({d.isocalendar()[:2] for d in weekly}))
+        self.assertTrue(all(d.weekday() == 6 for d in weekly[1:-1]))  # last day of each full week kept
+        self.assertEqual(len(monthly), len({(d.year, d.month) for d in monthly}))
+        # Idempotent
+        self.assertEqual(RetentionService.downsample_snapshots(today=today), 0)
+
+    def test_import_files_compressed_then_deleted(self):
+        import gzip, os, time
+        from .models import ImportLog
+        from utils.retention import RetentionService
+
+        imports = os.path.join(self.media_root, 'imports')
+        os.makedirs(os.path.join(imports, 'partial'))
+
+        def make(name, age_days):
+            path = os.path.join(imports, name)
+            with open(path, 'wb') as f:
+                f.write(b'order,sku\n' * 100)
+            old = time.time() - age_days * 86400
+            os.utime(path, (old, old))
+            return path
+
+        make('recent.xlsx', 1)
+        make('week_old.xlsx', 10)
+        make('ancient.xlsx', 200)
+        make('running.xlsx', 300)
+        make('partial/abc.part', 5)
+        done = ImportLog.objects.create(import_type='sales', filename='week_old.xlsx', file_path='imports/week_old.xlsx', status='Success')
+        gone = ImportLog.objects.create(import_type='sales', filename='ancient.xlsx', file_path='imports/ancient.xlsx', status='Failed')
+        ImportLog.objects.create(import_type='sales', filename='running.xlsx', file_path='imports/running.xlsx', status='Processing')
+
+        self.assertEqual(RetentionService.clean_import_files(dry_run=True), {'compressed': 1, 'deleted': 1, 'partial_deleted': 1})
+        self.assertTrue(os.path.exists(os.path.join(imports, 'ancient.xlsx')))
+        RetentionService.clean_import_files()
+
+        self.assertEqual(sorted(os.listdir(imports)), ['partial', 'recent.xlsx', 'running.xlsx', 'week_old.xlsx.gz'])
+        self.assertEqual(os.listdir(os.path.join(imports, 'partial')), [])
+        with gzip.open(os.path.join(imports, 'week_old.xlsx.gz')) as f:
+            self.assertEqual(f.read(), b'order,sku\n' * 100)
+        done.refresh_from_db()
+        gone.refresh_from_db()
+        self.assertEqual((done.file_path, gone.file_path), ('imports/week_old.xlsx.gz', ''))
+
+    def test_old_error_logs_truncated(self):
+        from django.utils import timezone
+        from .models import ImportLog
+        from utils.retention import RetentionService
+
+        old = ImportLog.objects.create(import_type='sales', filename='old.xlsx', error_log='x' * 10_000)
+        recent = ImportLog.objects.create(import_type='sales', filename='new.xlsx', error_log='y' * 10_000)
+        ImportLog.objects.filter(pk=old.pk).update(started_at=timezone.now() - timedelta(days=40))
+
+        self.assertEqual(RetentionService.truncate_error_logs(dry_run=True), 1)
+        self.assertEqual(RetentionService.truncate_error_logs(), 1)
+        old.refresh_from_db()
+        recent.refresh_from_db()
+        self.assertTrue(old.error_log.startswith('x' * 100))
+        self.assertLess(len(old.error_log), 200)
+        self.assertEqual(len(recent.error_log), 10_000)
+        self.assertEqual(RetentionService.truncate_error_logs(), 0)
+
+
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        from django.test import RequestFactory
+        self.factory = RequestFactory()
+
+    def routed_view(self):
+        from utils.db_routing import ReplicaRouter, read_replica
+
+        @read_replica
+        def view(request):
+            reads = [ReplicaRouter().db_for_read(MasterItem)]
+            if request.method == 'POST':
+                ReplicaRouter().db_for_write(MasterItem)
+                reads.append(ReplicaRouter().db_for_read(MasterItem))
+            return reads
+        return view
+
+    def test_reads_routed_only_inside_read_replica_views(self):
+        from unittest import mock
+        from utils.db_routing import ReplicaRouter
+
+        view = self.routed_view()
+        router = ReplicaRouter()
+        with mock.patch('utils.db_routing.replica_configured', return_value=True):
+            self.assertEqual(view(self.factory.get('/stock/')), ['replica'])
+            # Writes and non-GET requests stay on the primary
+            self.assertEqual(view(self.factory.post('/stock/')), [None, None])
+            self.assertEqual(router.db_for_write(MasterItem), 'default')
+        self.assertIsNone(router.db_for_read(MasterItem))
+        # No replica configured: decorator is a no-op
+        with mock.patch('utils.db_routing.replica_configured', return_value=False):
+            self.assertEqual(view(self.factory.get('/stock/')), [None])
+        self.assertFalse(router.allow_migrate('replica', 'inventory'))
+
+    def test_read_your_writes(self):
+        import time
+        from unittest import mock
+        from django.db import transaction
+        from django.http import HttpResponse
+        from utils.db_routing import ReplicaRouter, STICKY_COOKIE, use_replica
+        from .middleware import ReplicaStickyMiddleware
+
+        router = ReplicaRouter()
+        with use_replica():
+            self.assertEqual(router.db_for_read(MasterItem), 'replica')
+            with transaction.atomic():
+                self.assertIsNone(router.db_for_read(MasterItem))
+            router.db_for_write(MasterItem)
+            self.assertIsNone(router.db_for_read(MasterItem))
+
+        with mock.patch('utils.db_routing.replica_configured', return_value=True), \
+                mock.patch('inventory.middleware.replica_configured', return_value=True):
+            middleware = ReplicaStickyMiddleware(lambda request: HttpResponse())
+            self.assertNotIn(STICKY_COOKIE, middleware(self.factory.get('/stock/')).cookies)
+            cookie = middleware(self.factory.post('/stock/')).cookies[STICKY_COOKIE]
+            self.assertGreater(float(cookie.value), time.time())
+
+            # Within the window the user's report pages read the primary
+            request = self.factory.get('/stock/')
+            request.COOKIES[STICKY_COOKIE] = cookie.value
+            self.assertEqual(self.routed_view()(request), [None])
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_lagging_replica_neither_fills_shared_cache_nor_etags(self):
+        import time
+        from unittest import mock
+        from django.http import HttpResponse
+        from utils.cache_utils import versioned_etag
+        from utils.db_routing import ReplicaRouter, STICKY_COOKIE, read_replica, use_replica
+
+        # A replica that has not replayed the last write yet: what a read
+        # returns depends on where the router sends it
+        def lagging_read():
+            return 'before write' if ReplicaRouter().db_for_read(MasterItem) == 'replica' else 'after write'
+
+        cache.clear()
+        CacheService.bump_version('MasterItem')  # the write, on the primary
+        with use_replica():
+            self.assertEqual(CacheService.get_or_set('lagging', ('MasterItem',), lagging_read), 'after write')
+            # The view's own reads still use the replica
+            self.assertEqual(lagging_read(), 'before write')
+        self.assertEqual(CacheService.get_or_set('lagging', ('MasterItem',), lagging_read), 'after write')
+
+        @versioned_etag('MasterItem')
+        @read_replica
+        def page(request):
+            return HttpResponse(lagging_read())
+
+        user = User.objects.create_user(username='lag', password='pw')
+        with mock.patch('utils.db_routing.replica_configured', return_value=True):
+            request = self.factory.get('/stock/')
+            request.user = user
+            response = page(request)
+            self.assertEqual(response.content, b'before write')
+            self.assertFalse(response.has_header('ETag'))
+            # Read from the primary after the user's own write: safe to tag
+            request = self.factory.get('/stock/')
+            request.user = user
+            request.COOKIES[STICKY_COOKIE] = str(time.time() + 60)
+            response = page(request)
+            self.assertEqual(response.content, b'after write')
+            self.assertTrue(response.has_header('ETag'))
+
+
+@skipUnless('replica' in settings.DATABASES, "Needs a 'replica' database (DB_REPLICA_HOST)")
+@override_settings(CACHES=LOCMEM_CACHE)
+class ReplicaQueryTests(TransactionTestCase):
+    """
+    End to end against the configured replica alias (in tests a mirror of
+    the default database). Run on its own, the TestCase suites cannot see
+    their uncommitted rows through a second connection:
+        DB_REPLICA_HOST=localhost python manage.py test inventory.tests.ReplicaQueryTests
+    """
+    databases = '__all__'
+
+    def test_report_reads_replica_until_user_saves(self):
+        from django.db import connections
+        from django.test.utils import CaptureQueriesContext
+
+        MasterItem.objects.create(product_code='REP-1', name='Replica')
+        User.objects.create_user(username='replica', password='password')
+        self.client.login(username='replica', password='password')
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(self.client.get(reverse('stock_report')).status_code, 200)
+        self.assertTrue(replica.captured_queries)
+
+        self.client.post(reverse('stock_report'), {'action': 'update_field', 'sku': 'REP-1', 'field': 'note2', 'value': 'x'},
+                         HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        with CaptureQueriesContext(connections['replica']) as replica:
+            self.assertEqual(self.client.get(reverse('stock_report')).status_code, 200)
+        self.assertEqual(replica.captured_queries, [])
+
+
+class LandedCostTests(TestCase):
+    def setUp(self):
+        self.sku = MasterItem.objects.create(product_code='LC-1', name='Landed')
+        self.header = POHeader.objects.create(
+            po_number='PO-LC-1', order_date=date.today(), order_type='IMPORTED',
+            exchange_rate=Decimal('5.0'), total_yuan=Decimal('100.00'), shipping_rate_thb_cbm=Decimal('100.00'),
+        )
+        self.item = POItem.objects.create(header=self.header, sku=self.sku, qty_ordered=10)
+        ReceivedPOItem.objects.create(po_item=self.item, received_qty=10, received_cbm=Decimal('1.0'))
+
+    def test_header_rate_changes_recompute_stored_costs(self):
+        self.item.refresh_from_db()
+        # (500 + 100) / 10
+        self.assertEqual(self.item.total_shipping_cost, Decimal('100.00'))
+        self.assertEqual(self.item.unit_cost_thb, Decimal('60.0000'))
+
+        self.header.shipping_rate_thb_cbm = Decimal('300.00')
+        self.header.save()
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.total_shipping_cost, Decimal('300.00'))
+        self.assertEqual(self.item.unit_cost_thb, Decimal('80.0000'))
+
+        self.header.exchange_rate = Decimal('6.0')
+        self.header.save()
+        self.item.refresh_from_db()
+        # (600 + 300) / 10
+        self.assertEqual(self.item.unit_cost_thb, Decimal('90.0000'))
+        self.assertIsNone(self.item.unit_cost_incl_vat)
+
+    def test_domestic_cost_including_vat(self):
+        header = POHeader.objects.create(
+            po_number='PO-LC-D', order_date=date.today(), order_type='DOMESTIC', yuan_mode='bottom-up',
+            vat_rate=Decimal('7.00'), shipping_rate_thb_cbm=Decimal('0'),
+        )
+        item = POItem.objects.create(header=header, sku=self.sku, qty_ordered=4, unit_price=Decimal('100.00'), price_baht=Decimal('428.00'))
+        item.refresh_from_db()
+        self.assertEqual(item.unit_cost_thb, Decimal('107.0000'))
+        self.assertEqual(item.unit_cost_incl_vat, Decimal('107.0000'))
+
+        header.vat_rate = Decimal('10.00')
+        header.save()
+        item.refresh_from_db()
+        self.assertEqual(item.unit_cost_incl_vat, Decimal('110.0000'))
+
+    def test_rebuild_command_and_sql_sort(self):
+        from django.core.management import call_command
+        from io import StringIO
+
+        other = POItem.objects.create(header=self.header, sku=self.sku, qty_ordered=5)
+        POItem.objects.update(unit_cost_thb=0, total_shipping_cost=0)
+        out = StringIO()
+        call_command('rebuild_landed_costs', stdout=out)
+        self.assertIn('2 line(s) updated', out.getvalue())
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.total_shipping_cost, Decimal('100.00'))
+
+        ordered = list(POItem.objects.order_by('-unit_cost_thb').values_list('pk', flat=True))
+        self.assertEqual(ordered, [self.item.pk, other.pk])  # 600/15*10 + 100 over 10 vs 200/5
+
+        User.objects.create_user(username='lc', password='pw')
+        self.client.login(username='lc', password='pw')
+        response = self.client.get(reverse('po_list'), {'sort': 'unit_cost_asc'})
+        self.assertEqual([i.pk for i in response.context['po_items']], [other.pk, self.item.pk])
+        self.assertEqual(response.context['footer_summary']['total_shipping'], Decimal('100.00'))
+
+
+class ValuationTests(TestCase):
+    def setUp(self):
+        from .models import Sale
+        self.Sale = Sale
+        self.sku = MasterItem.objects.create(product_code='VAL-1', name='Valued')
+        self.header = POHeader.objects.create(
+            po_number='PO-VAL-1', order_date=date(2026, 1, 1), order_type='IMPORTED', yuan_mode='bottom-up',
+            exchange_rate=Decimal('1'), shipping_rate_thb_cbm=Decimal('0'),
+        )
+        # 10 @ 10 THB, then 10 @ 20 THB
+        self.cheap = POItem.objects.create(header=self.header, sku=self.sku, qty_ordered=10, price_baht=Decimal('100.00'))
+        self.dear = POItem.objects.create(header=self.header, sku=self.sku, qty_ordered=10, price_baht=Decimal('200.00'))
+        ReceivedPOItem.objects.create(po_item=self.cheap, received_qty=10, received_date=date(2026, 1, 1))
+        ReceivedPOItem.objects.create(po_item=self.dear, received_qty=10, received_date=date(2026, 1, 2))
+
+    def sale(self, order_id, qty, day):
+        return self.Sale.objects.create(order_id=order_id, sku=self.sku, qty=qty, price=Decimal('50'),
+                                        status='Completed', platform='Shopee', date=date(2026, 1, day))
+
+    def test_compute_fifo_and_moving_average(self):
+        from utils.valuation import ValuationService
+
+        result = ValuationService.compute([1, 2], [10, 10], [10.0, 20.0], [3, 4], [15, 10])
+        # FIFO 10x10 + 5x20; then 5x20 left + 5 short at the average (15)
+        self.assertEqual(list(result['cogs_fifo']), [200.0, 175.0])
+        self.assertEqual(list(result['cogs_avg']), [225.0, 150.0])
+        self.assertEqual(result['on_hand'], -5)
+        self.assertEqual(result['stock_value_fifo'], 0.0)
+        self.assertEqual(result['stock_value_avg'], 0.0)
+
+    def test_incremental_matches_rebuild_and_only_touches_later_sales(self):
+        from .models import SkuValuation
+        from utils.valuation import ValuationService
+
+        early = self.sale('V-1', 5, 3)
+        late = self.sale('V-2', 10, 5)
+        ValuationService.process_dirty()
+        late.refresh_from_db()
+        self.assertEqual(late.cogs_fifo, Decimal('150.00'))  # 5x10 + 5x20
+        state = SkuValuation.objects.get(sku=self.sku)
+        self.assertIsNone(state.dirty_from)
+        self.assertEqual(state.on_hand, 5)
+        self.assertEqual(state.stock_value_fifo, Decimal('100.00'))
+
+        # Backdated sale: only sales from its date on are revalued
+        self.Sale.objects.filter(pk=early.pk).update(cogs_fifo=Decimal('-1'))
+        self.sale('V-3', 3, 4)
+        self.assertEqual(SkuValuation.objects.get(sku=self.sku).dirty_from, date(2026, 1, 4))
+        ValuationService.process_dirty()
+        early.refresh_from_db()
+        self.assertEqual(early.cogs_fifo, Decimal('-1.00'))
+        late.refresh_from_db()
+        self.assertEqual(late.cogs_fifo, Decimal('180.00'))  # units 9-18: 2x10 + 8x20
+
+        incremental = {s.pk: (s.cogs_fifo, s.cogs_avg) for s in self.Sale.objects.exclude(pk=early.pk)}
+        ValuationService.rebuild([self.sku.pk])
+        rebuilt = {s.pk: (s.cogs_fifo, s.cogs_avg) for s in self.Sale.objects.exclude(pk=early.pk)}
+        self.assertEqual(incremental, rebuilt)
+        early.refresh_from_db()
+        self.assertEqual(early.cogs_fifo, Decimal('50.00'))
+
+    def test_landed_cost_change_and_receipt_delete_revalue(self):
+        from .models import SkuValuation
+        from utils.valuation import ValuationService
+
+        sale = self.sale('V-1', 20, 3)
+        ValuationService.process_dirty()
+        sale.refresh_from_db()
+        self.assertEqual(sale.cogs_fifo, Decimal('300.00'))
+
+        self.dear.price_baht = Decimal('400.00')
+        self.dear.save()
+        self.assertEqual(SkuValuation.objects.get(sku=self.sku).dirty_from, date(2026, 1, 2))
+        ValuationService.process_dirty()
+        sale.refresh_from_db()
+        self.assertEqual(sale.cogs_fifo, Decimal('500.00'))
+
+        self.dear.receipts.get().delete()
+        ValuationService.process_dirty()
+        sale.refresh_from_db()
+        # 10 received, 10 short at the average of the day (10)
+        self.assertEqual(sale.cogs_fifo, Decimal('200.00'))
+        self.assertEqual(self.sku.cost_layers.count(), 1)
+
+    def test_sales_import_marks_each_sku_once(self):
+        import io
+        import pandas as pd
+        from unittest.mock import patch
+        from .models import SkuValuation
+        from utils.importers import ImportService
+
+        self.sale('V-OLD', 2, 2)
+        SkuValuation.objects.filter(sku=self.sku).update(dirty_from=None)
+        file = io.BytesIO()
+        pd.DataFrame({
+            'Order ID': ['V-1', 'V-2', 'V-3', 'V-OLD'], 'SKU': ['VAL-1'] * 4, 'Quantity': [1, 2, 3, 5],
+            'Total Price': [50, 100, 150, 250], 'Date': ['2026-01-05', '2026-01-03', '2026-01-04', '2026-01-20'],
+        }).to_excel(file, index=False)
+        file.seek(0)
+
+        with patch.object(SkuValuation, 'mark_dirty', wraps=SkuValuation.mark_dirty) as mark_dirty, \
+                patch('utils.importers.ValuationService.process_dirty'):
+            results = ImportService.import_sales_data(file)
+        self.assertEqual(results['success'], 4)
+        # One mark for the SKU, from the oldest sale touched (the updated V-OLD keeps its date)
+        mark_dirty.assert_called_once_with('VAL-1', date(2026, 1, 2))
+        self.assertEqual(SkuValuation.objects.get(sku=self.sku).dirty_from, date(2026, 1, 2))
+
+    def test_update_valuation_command(self):
+        from django.core.management import call_command
+        from io import StringIO
+
+        self.sale('V-1', 4, 3)
+        out = StringIO()
+        call_command('update_valuation', stdout=out)
+        self.assertIn('Revalued 1 dirty SKU(s)', out.getvalue())
+        self.assertIn('FIFO 260.00 THB', out.getvalue())  # 6x10 + 10x20
+        call_command('update_valuation', '--rebuild', stdout=out)
+        self.assertIn('Rebuilt 1 SKU valuation(s)', out.getvalue())
+
+
+class ProfitabilityTests(TestCase):
+    def setUp(self):
+        from .models import Sale
+        self.Sale = Sale
+        self.sku = MasterItem.objects.create(product_code='PRF-1', name='Profit', category='A')
+        self.other = MasterItem.objects.create(product_code='PRF-2', name='Other', category='B')
+        header = POHeader.objects.create(
+            po_number='PO-PRF-1', order_date=date(2026, 1, 1), order_type='IMPORTED', yuan_mode='bottom-up',
+            exchange_rate=Decimal('1'), shipping_rate_thb_cbm=Decimal('0'),
+        )
+        item = POItem.objects.create(header=header, sku=self.sku, qty_ordered=10, price_baht=Decimal('100.00'))
+        ReceivedPOItem.objects.create(po_item=item, received_qty=10, received_date=date(2026, 1, 1))
+        self.start, self.end = date(2026, 1, 1), date(2026, 1, 31)
+
+    def sale(self, order_id, sku, qty, total, day, platform='Shopee', fee='0'):
+        return self.Sale.objects.create(
+            order_id=order_id, sku=sku, qty=qty, price=total / qty, total_price=total,
+            net_price=total - Decimal(fee), commission_fee=Decimal(fee), status='Completed',
+            platform=platform, shop_name='Main', date=date(2026, 1, day),
+        )
+
+    def filters(self, **changes):
+        from utils.profitability import ProfitabilityService
+        filters = ProfitabilityService.default_filters()
+        filters.update(start_date=self.start, end_date=self.end, **changes)
+        return filters
+
+    def test_rollups_follow_sales_through_valuation(self):
+        from .models import SaleDailyRollup
+        from utils.valuation import ValuationService
+
+        self.sale('P-1', self.sku, 2, Decimal('100'), 2, fee='10')
+        self.sale('P-2', self.sku, 3, Decimal('150'), 2, fee='15')
+        ValuationService.process_dirty()
+        rollup = SaleDailyRollup.objects.get(sku=self.sku)
+        self.assertEqual((rollup.orders, rollup.qty, rollup.net_price, rollup.fees, rollup.cogs_fifo, rollup.uncosted),
+                         (2, 5, Decimal('225.00'), Decimal('25.00'), Decimal('50.00'), 0))
+
+        self.Sale.objects.get(order_id='P-2').delete()
+        ValuationService.process_dirty()
+        rollup = SaleDailyRollup.objects.get(sku=self.sku)
+        self.assertEqual((rollup.orders, rollup.qty, rollup.cogs_fifo), (1, 2, Decimal('20.00')))
+
+    def test_report_groups_sorts_and_totals_in_sql(self):
+        from utils.profitability import ProfitabilityService
+        from utils.valuation import ValuationService
+
+        self.sale('P-1', self.sku, 2, Decimal('100'), 2, fee='10')
+        self.sale('P-2', self.sku, 1, Decimal('40'), 20, platform='Lazada')
+        self.sale('P-3', self.other, 1, Decimal('30'), 3)  # never received: no cost
+        ValuationService.process_dirty()
+
+        report = ProfitabilityService.build_report(self.filters())
+        self.assertEqual([r['sku_id'] for r in report['rows']], ['PRF-1', 'PRF-2'])
+        top = report['rows'][0]
+        self.assertEqual((top['net'], top['cogs'], top['profit']), (Decimal('130.00'), Decimal('30.00'), Decimal('100.00')))
+        self.assertEqual(report['totals']['profit'], Decimal('130.00'))
+        self.assertEqual(report['rows'][1]['uncosted'], 0)  # valued at the average (0) of a SKU with no receipts
+
+        by_platform = ProfitabilityService.build_report(self.filters(group=['platform'], sort='revenue_desc'))
+        self.assertEqual([(r['platform'], r['total_qty']) for r in by_platform['rows']], [('Shopee', 3), ('Lazada', 1)])
+        monthly = ProfitabilityService.build_report(self.filters(group=[], period='month', category='A'))
+        self.assertEqual([(r['period'], r['revenue']) for r in monthly['rows']], [(date(2026, 1, 1), Decimal('140.00'))])
+
+    def test_view_pages_caches_default_and_exports_csv(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from unittest.mock import patch
+        from utils.valuation import ValuationService
+
+        for day in range(1, 4):
+            self.sale(f'P-{day}', self.sku, 1, Decimal('50'), day)
+        ValuationService.process_dirty()
+        User.objects.create_user(username='prf', password='pw')
+        self.client.login(username='prf', password='pw')
+        url = reverse('profitability_report')
+        params = {'start_date': '2026-01-01', 'end_date': '2026-01-31', 'group': 'sku', 'period': 'day'}
+
+        with patch('utils.profitability.PAGE_SIZE', 2):
+            response = self.client.get(url, {**params, 'page': 2})
+        self.assertEqual((response.context['page'], response.context['num_pages'], response.context['count']), (2, 2, 3))
+
+        response = self.client.get(url, {**params, 'export': 'csv'})
+        lines = b''.join(response.streaming_content).decode('utf-8-sig').splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[1].startswith('2026-01-01,PRF-1,Profit,,,1,1,50.00,0.00,50.00,10.00,40.00,80.00'))
+
+        # Default view (this month) a second time: from the cache
+        cache.clear()
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as warm:
+            self.client.get(url)
+        self.assertFalse([q for q in warm.captured_queries if 'saledailyrollup' in q['sql']])
+
+
+class WhatIfTests(TestCase):
+    def setUp(self):
+        self.sku = MasterItem.objects.create(product_code='WI-1', name='What if')
+        self.new_sku = MasterItem.objects.create(product_code='WI-2', name='Never received')
+        self.header = POHeader.objects.create(
+            po_number='PO-WI-1', order_date=date.today(), order_type='IMPORTED', shipping_type='SHIP',
+            exchange_rate=Decimal('5.0'), total_yuan=Decimal('300.00'), shipping_rate_thb_cbm=Decimal('1000.00'),
+        )
+        # Top-down: 300 yuan over 20 + 10 units -> 200 / 100 yuan
+        self.item = POItem.objects.create(header=self.header, sku=self.sku, qty_ordered=20)
+        self.other = POItem.objects.create(header=self.header, sku=self.new_sku, qty_ordered=10)
+        # 10 of 20 received in 0.5 CBM -> projected 1 CBM for the line
+        ReceivedPOItem.objects.create(po_item=self.item, received_qty=10, received_cbm=Decimal('0.5'))
+
+    def test_scenarios_cost_open_lines_without_writing(self):
+        from utils.whatif import WhatIfService
+
+        before = list(POItem.objects.order_by('id').values_list('price_baht', 'total_shipping_cost', 'unit_cost_thb'))
+        scenarios = WhatIfService.scenarios([5.5], [1000, 2000], 'SHIP')
+        self.assertEqual(len(scenarios), 2)
+        report = WhatIfService.simulate(scenarios)
+
+        self.assertEqual((report['lines'], report['no_cbm_lines']), (2, 1))
+        # 1500 baht + 1 CBM x 1000
+        self.assertEqual(report['totals']['baseline'], 2500.0)
+        # 300 yuan x 5.5 = 1650 (+150); freight 2000 adds another 1000
+        self.assertEqual(report['totals']['deltas'], [150.0, 1150.0])
+        po = report['per_po'][0]
+        self.assertEqual((po['po_number'], po['costs']), ('PO-WI-1', [2650.0, 3650.0]))
+        sku = next(row for row in report['per_sku'] if row['sku'] == 'WI-1')
+        self.assertEqual(sku['unit_cost_baseline'], 100.0)  # (1000 + 1000) / 20
+        self.assertEqual(sku['unit_costs'], [105.0, 155.0])
+
+        after = list(POItem.objects.order_by('id').values_list('price_baht', 'total_shipping_cost', 'unit_cost_thb'))
+        self.assertEqual(before, after)
+
+    def test_freight_only_for_shipping_type_and_complete_pos_left_out(self):
+        from utils.whatif import WhatIfService
+
+        report = WhatIfService.simulate(WhatIfService.scenarios([], [2000], 'CAR'))
+        self.assertEqual(report['totals']['deltas'], [0.0])
+        POHeader.objects.filter(pk=self.header.pk).update(status=POHeader.STATUS_COMPLETE)
+        self.assertEqual(WhatIfService.simulate([])['lines'], 0)
+
+    def test_draft_pos_left_out(self):
+        from utils.whatif import WhatIfService
+
+        draft = POHeader.objects.create(
+            po_number='PO-WI-DRAFT', order_date=date.today(), order_type='IMPORTED', shipping_type='SHIP',
+            status=POHeader.STATUS_DRAFT, exchange_rate=Decimal('5.0'), total_yuan=Decimal('500.00'),
+        )
+        POItem.objects.create(header=draft, sku=self.sku, qty_ordered=50)
+        report = WhatIfService.simulate(WhatIfService.scenarios([5.5]))
+        self.assertEqual(report['lines'], 2)
+        self.assertEqual(report['totals']['baseline'], 2500.0)
+        self.assertEqual([po['po_number'] for po in report['per_po']], ['PO-WI-1'])
+
+    def test_view_returns_json_and_rejects_bad_rates(self):
+        User.objects.create_user(username='wi', password='pw')
+        self.client.login(username='wi', password='pw')
+        url = reverse('po_cost_simulation')
+        data = self.client.get(url, {'rate': ['5.5', '6'], 'freight': '1000'}).json()
+        self.assertEqual(data['totals']['deltas'], [150.0, 300.0])
+        self.assertEqual(self.client.get(url, {'rate': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'shipping_type': 'PLANE'}).status_code, 400)
+
+
+class RepricingTests(TestCase):
+    def setUp(self):
+        self.sku = MasterItem.objects.create(product_code='RP-1', name='Reprice')
+        self.top_down = POHeader.objects.create(
+            po_number='PO-RP-TD', order_date=date.today(), order_type='IMPORTED', shipping_type='SHIP',
+            exchange_rate=Decimal('5.0'), total_yuan=Decimal('301.00'), shipping_rate_thb_cbm=Decimal('1000.00'),
+        )
+        # 301 yuan over 20 + 10 units: prorated shares don't divide evenly
+        self.item = POItem.objects.create(header=self.top_down, sku=self.sku, qty_ordered=20)
+        POItem.objects.create(header=self.top_down, sku=self.sku, qty_ordered=10)
+        ReceivedPOItem.objects.create(po_item=self.item, received_qty=10, received_cbm=Decimal('0.5'))
+        self.bottom_up = POHeader.objects.create(
+            po_number='PO-RP-BU', order_date=date.today(), order_type='IMPORTED', yuan_mode='bottom-up',
+            exchange_rate=Decimal('5.0'),
+        )
+        POItem.objects.create(header=self.bottom_up, sku=self.sku, qty_ordered=3,
+                              price_yuan=Decimal('33.3300'), price_baht=Decimal('166.65'))
+        self.complete = POHeader.objects.create(
+            po_number='PO-RP-DONE', order_date=date.today(), order_type='IMPORTED',
+            exchange_rate=Decimal('5.0'), total_yuan=Decimal('100.00'),
+        )
+        POItem.objects.create(header=self.complete, sku=self.sku, qty_ordered=10)
+        POHeader.objects.filter(pk=self.complete.pk).update(status=POHeader.STATUS_COMPLETE)
+
+    def prices(self):
+        return list(POItem.objects.order_by('id').values_list('price_baht', 'unit_cost_thb'))
+
+    def test_reprice_matches_per_po_proration_and_logs_changes(self):
+        from inventory.models import SkuValuation
+        from utils.repricing import RepricingService
+
+        SkuValuation.objects.filter(sku=self.sku).update(dirty_from=None)
+        log = RepricingService.reprice('5.37', triggered_by='test')
+
+        self.assertEqual((log.po_count, log.item_count), (2, 3))
+        self.assertEqual(log.baht_before, Decimal('1671.65'))  # 1505 + 166.65
+        self.assertEqual(log.baht_after, Decimal('1795.35'))  # 301 x 5.37 = 1616.37, 33.33 x 5.37 = 178.98
+        self.assertEqual([change['po_number'] for change in log.changes], ['PO-RP-TD', 'PO-RP-BU'])
+        self.assertEqual(log.changes[0]['old_rate'], '5.0000')
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.price_baht, Decimal('1077.58'))  # 301 x 20/30 x 5.37
+        self.assertEqual(self.item.unit_cost_thb, Decimal('78.8790'))  # (1077.58 + 500) / 20
+        self.assertIsNotNone(SkuValuation.objects.get(sku=self.sku).dirty_from)
+        # Same values the per-PO save path stores; the Completed PO is untouched
+        repriced = self.prices()
+        for header in POHeader.objects.all():
+            header.prorate_costs()
+        self.assertEqual(self.prices(), repriced)
+        self.assertEqual(POItem.objects.get(header=self.complete).price_baht, Decimal('500.00'))
+        self.assertEqual(POHeader.objects.get(pk=self.complete.pk).exchange_rate, Decimal('5.0'))
+
+        # Nothing left at another rate
+        self.assertEqual(RepricingService.reprice('5.37').po_count, 0)
+
+    def test_command_uses_rate_in_effect_and_po_create_default(self):
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from inventory.models import CurrencyRate, RepricingLog
+        from io import StringIO
+
+        with self.assertRaises(CommandError):
+            call_command('reprice_pos', stdout=StringIO())
+        CurrencyRate.objects.create(effective_date=date.today() - timedelta(days=7), rate=Decimal('5.1'))
+        current = CurrencyRate.objects.create(effective_date=date.today(), rate=Decimal('5.2'))
+        CurrencyRate.objects.create(effective_date=date.today() + timedelta(days=1), rate=Decimal('9.9'))
+        self.assertEqual(CurrencyRate.rate_on(), current)
+
+        out = StringIO()
+        call_command('reprice_pos', '--include-complete', stdout=out)
+        self.assertIn('3 PO(s) / 4 line(s) repriced at 5.2000', out.getvalue())
+        log = RepricingLog.objects.get()
+        self.assertEqual((log.currency_rate, log.include_complete), (current, True))
+        self.assertEqual(POItem.objects.get(header=self.complete).price_baht, Decimal('520.00'))
+
+        User.objects.create_user(username='rp', password='pw')
+        self.client.login(username='rp', password='pw')
+        self.assertEqual(self.client.get(reverse('po_create')).context['exchange_rate'], Decimal('5.2'))
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        from .models import SaleDailyRollup
+        self.end = date(2026, 3, 1)
+        self.steady = MasterItem.objects.create(product_code='FC-1', name='Steady', current_stock=140)
+        self.lumpy = MasterItem.objects.create(product_code='FC-2', name='Lumpy', current_stock=0)
+        MasterItem.objects.create(product_code='FC-3', name='Never sold')
+        rollups = []
+        for back in range(56):
+            day = self.end - timedelta(days=back)
+            # 7 a day with twice as much on Saturdays; the other SKU sells 10 every 5th day
+            rollups.append(SaleDailyRollup(date=day, sku=self.steady, platform='Shopee', qty=14 if day.weekday() == 5 else 7))
+            if back % 5 == 0:
+                rollups.append(SaleDailyRollup(date=day, sku=self.lumpy, platform='Shopee', qty=10))
+        SaleDailyRollup.objects.bulk_create(rollups)
+
+    def test_forecast_per_sku_method_and_days_of_cover(self):
+        from .models import SkuForecast
+        from utils.forecasting import ForecastService
+
+        self.assertEqual(ForecastService.run(end_date=self.end, history_days=56), 3)
+        steady = SkuForecast.objects.get(sku=self.steady)
+        self.assertEqual((steady.method, steady.history_days, steady.sale_days), ('seasonal', 56, 56))
+        self.assertAlmostEqual(steady.daily_demand, 8.0, delta=0.3)  # (6 x 7 + 14) / 7
+        self.assertAlmostEqual(steady.days_of_cover, 140 / steady.daily_demand, places=1)
+        self.assertLess(steady.variance, 4)
+
+        lumpy = SkuForecast.objects.get(sku=self.lumpy)
+        self.assertEqual(lumpy.method, 'croston')
+        self.assertAlmostEqual(lumpy.daily_demand, 1.9, delta=0.1)  # 10 / 5 x SBA 0.95
+        self.assertEqual(lumpy.days_of_cover, 0)
+        never = SkuForecast.objects.get(sku_id='FC-3')
+        self.assertEqual((never.method, never.daily_demand, never.days_of_cover), ('none', 0, None))
+
+    def test_process_pool_gives_the_same_forecast_and_command(self):
+        from django.core.management import call_command
+        from io import StringIO
+        from unittest.mock import patch
+        from utils.forecasting import ForecastService
+
+        data = ForecastService.load(self.end, 56)
+        single = ForecastService.compute(data)
+        with patch('utils.forecasting.POOL_MIN_SKUS', 0):
+            pooled = ForecastService.compute(data, workers=2)
+        self.assertEqual([round(v, 6) for v in pooled['daily']], [round(v, 6) for v in single['daily']])
+
+        out = StringIO()
+        call_command('update_forecasts', '--workers', '1', '--days', '56', '--end-date', '2026-03-01', stdout=out)
+        self.assertIn('Forecast 3 SKU(s)', out.getvalue())
+        self.assertIn('1 seasonal, 1 croston, 1 none', out.getvalue())
+
+    def test_sales_summary_etag_follows_forecasts(self):
+        from utils.forecasting import ForecastService
+        cache.clear()
+        User.objects.create_user(username='fc', password='pw')
+        self.client.login(username='fc', password='pw')
+        url = reverse('sales_summary')
+        self.client.get(url)  # sets the CSRF cookie, part of the ETag
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # The nightly forecast update changes the forecast/day and days of cover columns
+        ForecastService.run(end_date=self.end, history_days=56)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ReplenishmentTests(TestCase):
+    def setUp(self):
+        from .models import SkuForecast, SupplierInfo
+        self.today = date.today()
+        self.sku = MasterItem.objects.create(product_code='RO-1', name='Reorder', current_stock=50)
+        stocked = MasterItem.objects.create(product_code='RO-2', name='Plenty', current_stock=5000)
+        gone = MasterItem.objects.create(product_code='RO-3', name='Gone', status=MasterItem.STATUS_DISCONTINUED)
+        for sku in (self.sku, stocked, gone):
+            SkuForecast.objects.create(sku=sku, method='seasonal', daily_demand=10, variance=4)
+        SupplierInfo.objects.create(sku=self.sku, store_name='Shop A', wechat_id='shop-a')
+
+        # Last order: 100 units in 4 cartons at 5 yuan, first receipt 20 days after ordering
+        past = POHeader.objects.create(
+            po_number='PO-RO-OLD', order_date=self.today - timedelta(days=40), order_type='IMPORTED',
+            shipping_type='SHIP', yuan_mode='bottom-up', exchange_rate=Decimal('5.0'),
+        )
+        item = POItem.objects.create(header=past, sku=self.sku, qty_ordered=100, carton_qty=4, price_yuan=Decimal('500'))
+        ReceivedPOItem.objects.create(po_item=item, received_qty=100, received_date=self.today - timedelta(days=20))
+        # Still to arrive
+        open_po = POHeader.objects.create(po_number='PO-RO-OPEN', order_date=self.today, order_type='IMPORTED')
+        POItem.objects.create(header=open_po, sku=self.sku, qty_ordered=30)
+
+    def test_suggestion_covers_lead_time_and_rounds_to_cartons(self):
+        from utils.replenishment import ReplenishmentService
+
+        suggestions = ReplenishmentService.suggestions()
+        self.assertEqual([s['sku'] for s in suggestions], ['RO-1'])
+        row = suggestions[0]
+        self.assertEqual((row['lead_days'], row['incoming'], row['supplier']), (20.0, 30, 'Shop A'))
+        # Safety 1.65 x sqrt(20 x 4) = 14.8; up to 10 x (20 + 7) + 14.8 = 284.8; minus 50 + 30 -> 9 cartons of 25
+        self.assertEqual((row['safety_stock'], row['reorder_point'], row['order_up_to']), (15, 215, 285))
+        self.assertEqual((row['qty'], row['cartons'], row['per_carton']), (225, 9, 25))
+
+    def test_drafts_grouped_by_supplier_and_kept_out_of_open_supply(self):
+        from .models import CurrencyRate
+        from utils.replenishment import ReplenishmentService
+
+        CurrencyRate.objects.create(effective_date=self.today, rate=Decimal('5.2'))
+        [header] = ReplenishmentService.create_drafts(ReplenishmentService.suggestions())
+        self.assertEqual(header.po_number, f"DRAFT-{self.today:%Y%m%d}-001")
+        self.assertEqual((header.status, header.yuan_mode, header.wechat_contact), ('Draft', 'bottom-up', 'shop-a'))
+        self.assertEqual(header.estimated_date, self.today + timedelta(days=20))
+        line = POItem.objects.get(header=header)
+        self.assertEqual((line.qty_ordered, line.carton_qty, line.price_yuan), (225, 9, Decimal('1125.0000')))
+        self.assertEqual((line.price_baht, line.unit_cost_thb), (Decimal('5850.00'), Decimal('26.0000')))
+
+        # Drafted qty counts for the next run, not as incoming stock; statuses leave drafts alone
+        self.assertEqual(ReplenishmentService.suggestions(), [])
+        from utils.reports import ReportService
+        self.assertEqual(ReportService.build_incoming_map(), {'RO-1': 30})
+        POHeader.refresh_statuses(POHeader.objects.all())
+        header.refresh_from_db()
+        self.assertEqual(header.status, POHeader.STATUS_DRAFT)
+
+    def test_view_drafts_ticked_skus_and_confirm(self):
+        User.objects.create_user(username='ro', password='pw')
+        self.client.login(username='ro', password='pw')
+        url = reverse('replenishment')
+        self.assertEqual([s['sku'] for s in self.client.get(url).context['suggestions']], ['RO-1'])
+        self.client.post(url, {})
+        self.assertFalse(POHeader.objects.filter(status=POHeader.STATUS_DRAFT).exists())
+        response = self.client.post(url, {'sku': ['RO-1']})
+        self.assertRedirects(response, reverse('po_list') + '?status=Draft', fetch_redirect_response=False)
+
+        draft = POHeader.objects.get(status=POHeader.STATUS_DRAFT)
+        self.client.post(reverse('po_detail', args=[draft.pk]), {'action': 'confirm_draft'})
+        draft.refresh_from_db()
+        self.assertEqual((draft.status, draft.estimated_date), (POHeader.STATUS_PENDING, self.today + timedelta(days=20)))
+
+
+class LeadTimeTests(TestCase):
+    def setUp(self):
+        from .models import SupplierInfo
+        self.today = date.today()
+        self.sku = MasterItem.objects.create(product_code='LT-1', name='Lead 1')
+        self.other = MasterItem.objects.create(product_code='LT-2', name='Lead 2')
+        for sku in (self.sku, self.other):
+            SupplierInfo.objects.create(sku=sku, store_name='Shop L')
+
+    def receive(self, sku, shipping_type, ordered_ago, qty, receipts):
+        header = POHeader.objects.create(
+            po_number=f"PO-LT-{POHeader.objects.count() + 1}", order_type='IMPORTED', shipping_type=shipping_type,
+            order_date=self.today - timedelta(days=ordered_ago),
+        )
+        item = POItem.objects.create(header=header, sku=sku, qty_ordered=qty)
+        return [
+            ReceivedPOItem.objects.create(po_item=item, received_qty=received, received_date=header.order_date + timedelta(days=after))
+            for after, received in receipts
+        ]
+
+    def stat(self, scope, key, shipping_type=''):
+        from .models import LeadTimeStat
+        return LeadTimeStat.objects.get(scope=scope, key=key, shipping_type=shipping_type)
+
+    def test_receipts_refresh_sku_and_supplier_stats(self):
+        from .models import LeadTimeStat
+        self.receive(self.sku, 'SHIP', 60, 10, [(20, 5), (30, 5)])
+        [car_receipt] = self.receive(self.sku, 'CAR', 30, 10, [(10, 10)])
+        self.receive(self.other, 'SHIP', 50, 10, [(24, 4)])
+
+        stat = self.stat('sku', 'LT-1')
+        self.assertEqual((stat.first_count, stat.first_mean, stat.first_p50, stat.first_last), (2, 15.0, 15.0, 10))
+        self.assertEqual((stat.full_count, stat.full_p50, stat.full_last), (2, 20.0, 10))
+        ship = self.stat('sku', 'LT-1', 'SHIP')
+        self.assertEqual((ship.first_count, ship.first_p50, ship.full_p50), (1, 20.0, 30.0))
+        # Both SKUs of the store; LT-2's line is not fully received
+        supplier = self.stat('supplier', 'Shop L')
+        self.assertEqual((supplier.first_count, supplier.first_p50, supplier.first_last, supplier.full_count), (3, 20.0, 10, 2))
+        self.assertFalse(LeadTimeStat.objects.filter(scope='shipping').exists())
+
+        car_receipt.delete()
+        self.assertEqual(self.stat('sku', 'LT-1').first_count, 1)
+        self.assertFalse(LeadTimeStat.objects.filter(scope='sku', key='LT-1', shipping_type='CAR').exists())
+
+    def new_po_lead(self, po_number, shipping_type):
+        header = POHeader.objects.create(po_number=po_number, order_type='IMPORTED', shipping_type=shipping_type, order_date=self.today)
+        return (header.estimated_date - self.today).days
+
+    @override_settings(PO_ESTIMATE_FROM_LEAD_TIMES=True)
+    def test_rebuild_feeds_estimated_date_of_new_pos(self):
+        from io import StringIO
+        from django.core.management import call_command
+        self.receive(self.sku, 'SHIP', 60, 10, [(20, 10)])
+        self.receive(self.other, 'SHIP', 50, 10, [(24, 10)])
+        call_command('rebuild_lead_times', stdout=StringIO())
+        self.assertEqual(self.stat('shipping', '', 'SHIP').first_count, 2)
+
+        # Hard-coded defaults until MIN_COUNT lines of the shipping type were received
+        self.assertEqual(self.new_po_lead('PO-LT-SHIP', 'SHIP'), 25)
+        self.receive(self.other, 'SHIP', 45, 10, [(18, 10)])
+        call_command('rebuild_lead_times', stdout=StringIO())
+        self.assertEqual(self.new_po_lead('PO-LT-SHIP-2', 'SHIP'), 20)
+        self.assertEqual(self.new_po_lead('PO-LT-CAR', 'CAR'), 14)
+
+    def test_estimated_date_keeps_defaults_unless_enabled(self):
+        from .models import LeadTimeStat
+        from utils.leadtimes import LeadTimeService
+        for ago, after in ((60, 20), (50, 24), (45, 18)):
+            self.receive(self.sku, 'SHIP', ago, 10, [(after, 10)])
+        LeadTimeService.rebuild()
+        self.assertEqual(self.stat('shipping', '', 'SHIP').first_count, LeadTimeStat.MIN_COUNT)
+
+        self.assertEqual(self.new_po_lead('PO-LT-DEFAULT', 'SHIP'), 25)
+        with override_settings(PO_ESTIMATE_FROM_LEAD_TIMES=True):
+            self.assertEqual(self.new_po_lead('PO-LT-OBSERVED', 'SHIP'), 20)
+
+    @override_settings(CACHES=LOCMEM_CACHE)
+    def test_po_history_shows_lead_times(self):
+        from utils.leadtimes import LeadTimeService
+        cache.clear()
+        User.objects.create_user(username='lt', password='pw')
+        self.client.login(username='lt', password='pw')
+        self.receive(self.sku, 'SHIP', 60, 10, [(20, 10)])
+        url = reverse('get_po_history', args=['LT-1'])
+        self.client.get(url)  # sets the CSRF cookie, part of the ETag
+        response = self.client.get(url)
+        self.assertEqual([stat.shipping_type for stat in response.context['lead_times']], ['', 'SHIP'])
+        self.assertContains(response, 'P90 20')
+
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # The nightly rebuild (window moved on: the line is now too old) changes the partial
+        LeadTimeService.rebuild(today=self.today + timedelta(days=700))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['lead_times'], [])
@@ -6,16 +6,20 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     path('otp-verify/', views.otp_verify_view, name='otp_verify'),
+    path('login/loadtest/', views.loadtest_login_view, name='loadtest_login'),
     
     # Core Pages
     path('', views.daily_sales_view, name='sales_summary'), # Home is sales summary
     path('stock/', views.stock_report_view, name='stock_report'),
     path('po/', views.po_list_view, name='po_list'),
+    path('reports/profitability/', views.profitability_view, name='profitability_report'),
+    path('reports/replenishment/', views.replenishment_view, name='replenishment'),
     path('search/options/', views.get_search_options, name='get_search_options'),
     path('suppliers/', views.supplier_info_view, name='supplier_info'),
     path('suppliers/save/', views.save_supplier_info, name='save_supplier_info'),
     path('suppliers/delete/<int:supplier_id>/', views.delete_supplier_info, name='delete_supplier_info'),
     path('import/', views.import_data_view, name='import_data'),
+    path('import/upload/', views.import_upload_chunk_view, name='import_upload_chunk'),
     
     # Ajax/Actions
     path('po/<int:po_id>/', views.po_detail_view, name='po_detail'),
@@ -23,10 +27,17 @@ urlpatterns = [
     path('po/create/', views.po_create_view, name='po_create'), # New URL
     path('po/receipt/delete/<int:receipt_id>/', views.delete_received_item_view, name='delete_received_item'),
     path('po/<int:po_id>/delete/', views.delete_po_view, name='delete_po'), # Delete PO
+    path('po/simulate/', views.po_cost_simulation_view, name='po_cost_simulation'),
     path('stock/update-limit/<str:sku>/', views.update_min_limit, name='update_min_limit'),
     path('products/', views.product_list_view, name='product_list'),
     path('products/get/<str:sku>/', views.get_product_detail, name='get_product_detail'),
     path('products/save/', views.save_product_view, name='save_product'),
     path('stock/history/<str:sku>/', views.get_po_history, name='get_po_history'),
     path('sales/history/<str:sku>/', views.get_sales_history, name='get_sales_history'),
+
+    # Monitoring
+    path('metrics', views.metrics_view, name='metrics'),
+    path('cache/stats/', views.cache_stats_view, name='cache_stats'),
+    path('profiles/', views.profiles_view, name='profiles'),
+    path('profiles/<str:profile_id>.<str:fmt>', views.profile_download_view, name='profile_download'),
 ]
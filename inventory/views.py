@@ -1,26 +1,38 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Sum, F, Q, DecimalField, Count, ExpressionWrapper
-from django.db.models.functions import Coalesce
+from django.db.models import Sum, Q, Count, Max
 from django.views.decorators.http import require_POST
-from datetime import datetime, date, timedelta
+from django.views.decorators.csrf import csrf_exempt
+from datetime import datetime, date
 
 # Import Models and Utils
-from .models import MasterItem, Sale, POHeader, POItem, ReceivedPOItem, JSTStockSnapshot, POReceiptBatch
+from .models import MasterItem, Sale, POHeader, POItem, ReceivedPOItem, JSTStockSnapshot, POReceiptBatch, SaleDailyRollup, CurrencyRate, SkuForecast, LeadTimeStat
 from utils.auth_utils import send_otp_email, create_token, generate_otp
-from utils.importers import ImportService
 from utils.stock_calculator import StockService
-
+from utils.cache_utils import CacheService, versioned_etag
+from utils.reports import ReportService, ReportSnapshotService
+from utils.profitability import ProfitabilityService, GROUPINGS, PERIODS, PROFIT_SORTS
+from utils.whatif import WhatIfService
+from utils.replenishment import ReplenishmentService
+from utils.uploads import ChunkedUploadService, uploaded_file_hash
+from utils.metrics import MetricsService
+from utils.db_routing import read_replica
+from utils.outbox import LoginActivityService
+
+import csv
+import itertools
 import os
 import json
 import threading
+import time
+from functools import lru_cache
 from decimal import Decimal
 from django.core.files.storage import default_storage
-from django.core.files.base import ContentFile
 # ... other imports
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
@@ -31,8 +43,9 @@ from django.conf import settings
 from .models import MasterItem, Sale, POHeader, POItem, ReceivedPOItem, JSTStockSnapshot
 from utils.auth_utils import send_otp_email, create_token, generate_otp
 
+@lru_cache(maxsize=1)
 def get_allowed_users():
-    # Parse allowed users from env
+    # Parse allowed users from env (once per worker, the env doesn't change at runtime)
     allowed_str = os.getenv('ALLOWED_USERS', '[]')
     try:
         # It's stored as a string representation of list in .env usually?
@@ -54,6 +67,7 @@ def login_view(request):
         # Check if email is in allowed list
         # Simple string matching
         if email not in [u.lower() for u in allowed_users]:
+            LoginActivityService.record(request, email, 'denied')
             messages.error(request, "❌ อีเมลนี้ไม่มีสิทธิ์ใช้งานระบบ")
             return redirect('login')
         
@@ -64,8 +78,9 @@ def login_view(request):
         request.session['otp_code'] = otp_code
         request.session['otp_email'] = email
         
-        # Send Email
+        # Queue Email (outbox worker sends it, login doesn't wait on SMTP)
         if send_otp_email(email, otp_code):
+            LoginActivityService.record(request, email, 'otp_requested')
             messages.success(request, f"✅ ส่งรหัส OTP ไปยัง {email} แล้ว")
             return redirect('otp_verify')
         else:
@@ -87,6 +102,7 @@ def otp_verify_view(request):
             # Get or Create User
             user, created = User.objects.get_or_create(username=email, defaults={'email': email})
             login(request, user)
+            LoginActivityService.record(request, email, 'login')
             
             # Clear session
             del request.session['otp_code']
@@ -95,10 +111,34 @@ def otp_verify_view(request):
             messages.success(request, "เข้าสู่ระบบสำเร็จ!")
             return redirect('sales_summary')
         else:
+            LoginActivityService.record(request, email, 'otp_failed')
             messages.error(request, "❌ รหัส OTP ไม่ถูกต้อง")
             
     return render(request, 'inventory/otp_verify.html')
 
+@csrf_exempt
+@require_POST
+def loadtest_login_view(request):
+    """
+    Test-mode login for scripts/load_test.py (no OTP e-mail).
+    Only exists while LOADTEST_LOGIN_TOKEN is set; always logs in the
+    dedicated LOADTEST_USERNAME account, never a real user.
+    """
+    from django.conf import settings
+    from django.http import Http404, HttpResponseForbidden
+    import hmac
+
+    expected = getattr(settings, 'LOADTEST_LOGIN_TOKEN', '')
+    if not expected:
+        raise Http404()
+    token = request.POST.get('token') or request.headers.get('X-Loadtest-Token', '')
+    if not hmac.compare_digest(token.encode(), expected.encode()):
+        return HttpResponseForbidden("Invalid token")
+
+    user, _ = User.objects.get_or_create(username=settings.LOADTEST_USERNAME)
+    login(request, user)
+    return JsonResponse({'status': 'ok', 'user': user.username})
+
 @login_required
 def import_data_view(request):
     from .models import ImportLog
@@ -111,23 +151,24 @@ def import_data_view(request):
         if not uploaded_file:
             messages.error(request, "กรุณาเลือกไฟล์ (Please select a file)")
             return redirect('import_data')
+
+        # Hash was computed while the upload streamed to disk
+        file_hash = uploaded_file_hash(uploaded_file)
+        duplicate = find_duplicate_import(import_type, file_hash)
+        if duplicate and request.POST.get('force') != '1':
+            messages.warning(
+                request,
+                f"⚠️ ไฟล์นี้เคยนำเข้าแล้ว ({duplicate.filename}, {duplicate.started_at:%d/%m/%Y %H:%M}) "
+                f"- ติ๊ก 'นำเข้าซ้ำ' เพื่อยืนยัน (Duplicate file, tick 'import again' to force)"
+            )
+            return redirect('import_data')
             
         # 1. Save file to disk (temp or media) so thread can access it
-        # We use default_storage
-        file_path = default_storage.save(f"imports/{uploaded_file.name}", ContentFile(uploaded_file.read()))
-        full_path = default_storage.path(file_path)
+        # Passing the UploadedFile lets storage move/copy it in chunks instead of reading it into memory
+        file_path = default_storage.save(f"imports/{uploaded_file.name}", uploaded_file)
         
-        # 2. Create Log Entry
-        log = ImportLog.objects.create(
-            import_type=import_type,
-            filename=uploaded_file.name,
-            status='Pending'
-        )
-        
-        # 3. Start Background Thread
-        thread = threading.Thread(target=process_import_background, args=(log.id, full_path, import_type))
-        thread.setDaemon(True)
-        thread.start()
+        # 2. Create Log Entry + 3. Start Background Thread
+        start_import(import_type, file_path, uploaded_file.name, file_hash, uploaded_file.size)
         
         messages.info(request, f"⏳ เริ่มต้นประมวลผล {uploaded_file.name} ในเบื้องหลังแล้ว (Started in background)...")
         
@@ -140,12 +181,120 @@ def import_data_view(request):
     # GET: Show Logs
     recent_logs = ImportLog.objects.all().order_by('-started_at')[:10]
             
-    return render(request, 'inventory/import_data.html', {'result_log': None, 'recent_logs': recent_logs})
+    return render(request, 'inventory/import_data.html', {
+        'result_log': None,
+        'recent_logs': recent_logs,
+        'chunk_size': settings.IMPORT_CHUNK_SIZE,
+        'max_upload_size': settings.IMPORT_MAX_UPLOAD_SIZE,
+    })
+
+def find_duplicate_import(import_type, file_hash):
+    """
+    Earlier import of the same file content (not failed), if any.
+    """
+    from .models import ImportLog
+    if not file_hash:
+        return None
+    return ImportLog.objects.filter(
+        import_type=import_type, file_hash=file_hash
+    ).exclude(status='Failed').order_by('-started_at').first()
+
+def start_import(import_type, file_path, filename, file_hash, file_size):
+    """
+    Creates the ImportLog and processes the stored file in a background thread.
+    """
+    from .models import ImportLog
+    log = ImportLog.objects.create(
+        import_type=import_type,
+        filename=filename,
+        file_path=file_path,
+        file_hash=file_hash,
+        file_size=file_size,
+        status='Pending'
+    )
+    
+    thread = threading.Thread(target=process_import_background, args=(log.id, default_storage.path(file_path), import_type))
+    thread.setDaemon(True)
+    thread.start()
+    return log
+
+@login_required
+def import_upload_chunk_view(request):
+    """
+    Resumable upload for large exports (see ChunkedUploadService).
+    GET ?upload_id=   -> bytes received so far (resume point)
+    POST action=start  (filename, size, type) -> upload_id
+    POST action=chunk  (upload_id, offset, chunk file) -> new offset
+    POST action=finish (upload_id, force) -> starts the import
+    """
+    if request.method == 'GET':
+        try:
+            upload_id = request.GET.get('upload_id')
+            return JsonResponse({'offset': ChunkedUploadService.get_offset(upload_id)})
+        except (ValueError, FileNotFoundError):
+            return JsonResponse({'error': 'Upload not found'}, status=404)
+
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+
+    action = request.POST.get('action')
+    upload_id = request.POST.get('upload_id')
+    try:
+        if action == 'start':
+            import_type = request.POST.get('type')
+            if import_type not in ('master', 'stock', 'sales'):
+                return JsonResponse({'error': 'Invalid import type'}, status=400)
+            upload_id = ChunkedUploadService.start(
+                request.POST.get('filename', 'upload.xlsx'),
+                int(request.POST.get('size', 0)),
+                import_type,
+            )
+            return JsonResponse({'upload_id': upload_id, 'offset': 0})
+
+        if action == 'chunk':
+            chunk = request.FILES.get('chunk')
+            if not chunk:
+                return JsonResponse({'error': 'Missing chunk'}, status=400)
+            try:
+                offset = ChunkedUploadService.append(upload_id, int(request.POST.get('offset', -1)), chunk)
+            except ValueError as e:
+                # Client re-syncs from the returned offset
+                return JsonResponse({'error': str(e), 'offset': ChunkedUploadService.get_offset(upload_id)}, status=409)
+            return JsonResponse({'offset': offset})
+
+        if action == 'finish':
+            meta = ChunkedUploadService.get_meta(upload_id)
+            duplicate = find_duplicate_import(meta['import_type'], ChunkedUploadService.get_hash(upload_id))
+            if duplicate and request.POST.get('force') != '1':
+                # Part is kept: client can confirm (force=1) or abort without re-uploading
+                return JsonResponse({
+                    'duplicate': True,
+                    'message': f"ไฟล์นี้เคยนำเข้าแล้ว ({duplicate.filename}, {duplicate.started_at:%d/%m/%Y %H:%M})",
+                })
+            file_path, filename, import_type, file_hash, size = ChunkedUploadService.finish(upload_id)
+            start_import(import_type, file_path, filename, file_hash, size)
+            messages.info(request, f"⏳ เริ่มต้นประมวลผล {filename} ในเบื้องหลังแล้ว (Started in background)...")
+            return JsonResponse({'success': True})
+
+        if action == 'abort':
+            ChunkedUploadService.discard(upload_id)
+            return JsonResponse({'success': True})
+
+        return JsonResponse({'error': 'Unknown action'}, status=400)
+
+    except FileNotFoundError:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
 
 def process_import_background(log_id, file_path, import_type):
     from .models import ImportLog
     from django.utils import timezone
+    # pandas/numpy/requests live behind ImportService: load them only in
+    # the import thread so web workers start (and stay) light
+    from utils.importers import ImportService
     
+    job_start = time.perf_counter()
     # Re-fetch log to ensure thread safety connection
     try:
         log = ImportLog.objects.get(id=log_id)
@@ -172,6 +321,8 @@ def process_import_background(log_id, file_path, import_type):
             if result:
                 log.success_count = result.get('success', 0)
                 log.failed_count = result.get('failed', 0)
+                MetricsService.inc('jst_import_rows_total', log.success_count, import_type=import_type, result='success')
+                MetricsService.inc('jst_import_rows_total', log.failed_count, import_type=import_type, result='failed')
                 
                 if result.get('errors'):
                      log.error_log = "\n".join(result['errors'])
@@ -182,6 +333,12 @@ def process_import_background(log_id, file_path, import_type):
                      log.status = 'Success' # Partial success is still success usually, or Warning
                 else:
                      log.status = 'Failed'
+
+                if log.status == 'Success':
+                    # Precompute the default reports everyone opens after the import
+                    snapshot_start = time.perf_counter()
+                    ReportSnapshotService.refresh_all()
+                    MetricsService.observe('jst_import_phase_seconds', time.perf_counter() - snapshot_start, import_type=import_type, phase='snapshots')
             else:
                 log.status = 'Failed'
                 log.error_log = "No result returned from service."
@@ -197,18 +354,26 @@ def process_import_background(log_id, file_path, import_type):
         if 'log' in locals():
             log.completed_at = timezone.now()
             log.save()
-            
-        # Optional: Delete file after processing
-        # if os.path.exists(file_path):
-        #    os.remove(file_path)
+            MetricsService.inc('jst_import_jobs_total', import_type=import_type, status=log.status)
+        MetricsService.observe('jst_import_phase_seconds', time.perf_counter() - job_start, import_type=import_type, phase='total')
 
+        # The upload stays for re-checks; manage.py apply_retention compresses
+        # and later deletes it (RETENTION_IMPORT_FILE_* settings)
+
+
+# ?sort= on the PO list; landed costs are stored columns, so these sort in SQL
+PO_LIST_SORTS = {
+    'unit_cost_desc': ('-unit_cost_thb', '-header__order_date'),
+    'unit_cost_asc': ('unit_cost_thb', '-header__order_date'),
+    'shipping_desc': ('-total_shipping_cost', '-header__order_date'),
+}
 
 @login_required
+@versioned_etag('MasterItem', 'POHeader', 'POItem', 'ReceivedPOItem')
+@read_replica
 def po_list_view(request):
     # Refresh statuses for all non-Complete POs so date-based transitions are current
-    stale_headers = POHeader.objects.exclude(status='Complete')
-    for h in stale_headers:
-        h.update_status()
+    POHeader.refresh_statuses(POHeader.objects.exclude(status='Complete'))
 
     po_number_query = request.GET.get('po_number', '').strip()
     search_query = request.GET.get('search', '').strip()
@@ -269,11 +434,15 @@ def po_list_view(request):
             items = items.filter(header__status=status_filter)
         
     # Category Filter
-    categories = MasterItem.objects.values_list('category', flat=True).distinct().order_by('category')
+    categories = CacheService.get_categories()
     selected_category = request.GET.get('category', '')
     if selected_category:
         items = items.filter(sku__category=selected_category)
 
+    sort = request.GET.get('sort', '')
+    if sort in PO_LIST_SORTS:
+        items = items.order_by(*PO_LIST_SORTS[sort])
+
     # For each item, we need to calculate waiting_qty for the main table too
     for item in items:
         item.waiting_qty = max(0, item.qty_ordered - item.total_received_qty)
@@ -291,35 +460,28 @@ def po_list_view(request):
     
     # 1. Total Shipping (Imported Only)
     imported_items = items.filter(header__order_type='IMPORTED')
-    shipping_agg = imported_items.annotate(
-        cost=ExpressionWrapper(
-            F('total_received_cbm') * Coalesce(F('header__shipping_rate_thb_cbm'), Decimal(0)),
-            output_field=DecimalField()
-        )
-    ).aggregate(total=Sum('cost'))
+    shipping_agg = imported_items.aggregate(total=Sum('total_shipping_cost'))
     summary['shipping_cost'] = shipping_agg['total'] or 0
 
-    # 2. Status Counts — ใช้ header.status ที่ refresh แล้วโดยตรง
-    summary['waiting'] = items.filter(header__status='Pending').count()
-    summary['arriving'] = items.filter(header__status='Arriving Soon').count()
-    summary['incomplete'] = items.filter(header__status='Incomplete').count()
-    summary['overdue'] = items.filter(header__status='Overdue').count()
-    summary['complete'] = items.filter(header__status='Complete').count()
+    # 2. Status Counts — ใช้ header.status ที่ refresh แล้วโดยตรง (one query for all five)
+    status_counts = items.order_by().aggregate(
+        waiting=Count('id', filter=Q(header__status='Pending')),
+        arriving=Count('id', filter=Q(header__status='Arriving Soon')),
+        incomplete=Count('id', filter=Q(header__status='Incomplete')),
+        overdue=Count('id', filter=Q(header__status='Overdue')),
+        complete=Count('id', filter=Q(header__status='Complete')),
+    )
+    summary.update(status_counts)
 
     # --- Footer/Table Totals (All Filtered Items) ---
-    footer_aggs = items.annotate(
-        shipping_cost=ExpressionWrapper(
-            F('total_received_cbm') * Coalesce(F('header__shipping_rate_thb_cbm'), Decimal(0)),
-            output_field=DecimalField()
-        )
-    ).aggregate(
+    footer_aggs = items.aggregate(
         total_ordered=Sum('qty_ordered'),
         total_received=Sum('total_received_qty'),
         total_yuan=Sum('price_yuan'),
         total_baht=Sum('price_baht'),
         total_cbm=Sum('total_received_cbm'),
         total_weight=Sum('total_received_weight'),
-        total_shipping=Sum('shipping_cost')
+        total_shipping=Sum('total_shipping_cost')
     )
     
     t_baht = footer_aggs['total_baht'] or Decimal(0)
@@ -354,6 +516,7 @@ def po_list_view(request):
         'end_date': end_date_str,
         'bill_start_date': bill_start_date_str,
         'bill_end_date': bill_end_date_str,
+        'sort': sort,
         'summary': summary,
         'footer_summary': footer_summary,
     }
@@ -601,9 +764,22 @@ def po_detail_view(request, po_id):
 
             if count_update > 0 or saved_batches:
                 messages.success(request, f"✅ Updated Info & Batches: {saved_batches}")
+
+            if saved_batches:
+                ReportSnapshotService.refresh_in_background()
             
             return redirect('po_detail', po_id=po.id)
 
+        elif action == 'confirm_draft' and po.status == POHeader.STATUS_DRAFT:
+            # Suggested PO approved: ordered today, same expected lead time
+            lead = (po.estimated_date - po.order_date) if po.estimated_date else None
+            po.order_date = date.today()
+            po.estimated_date = po.order_date + lead if lead is not None else None
+            po.status = POHeader.STATUS_PENDING
+            po.save()
+            messages.success(request, f"✅ ยืนยันใบสั่งซื้อ {po.po_number} เรียบร้อย")
+            return redirect('po_detail', po_id=po.id)
+
         elif action == 'add_item':
             sku_code = request.POST.get('sku_code')
             if sku_code:
@@ -654,9 +830,9 @@ def po_detail_view(request, po_id):
     # item.batch_qtys = { 1: 10, 2: 0, ... }
     # item.summary = { total_qty, total_cbm, total_kg }
     
-    items = po.items.all()
+    items = po.items.select_related('sku').prefetch_related('receipts__batch')
     for item in items:
-        # Fetch receipts
+        # Fetch receipts (prefetched)
         receipts = item.receipts.all()
         r_map = { r.batch.batch_no: r for r in receipts if r.batch }
         
@@ -714,6 +890,7 @@ def receive_po_item(request, po_item_id):
             # Requirement: "Fetch System Stock: Calculate Initial + Total Received - Total Sold".
             # This strongly implies dynamic calculation from a static base. I'll stick to not updating MasterItem.
             
+            ReportSnapshotService.refresh_in_background()
             messages.success(request, f"บันทึกการรับสินค้า {item.sku.product_code} จำนวน {qty} ชิ้น เรียบร้อย")
         else:
             messages.error(request, "ข้อมูลไม่ถูกต้อง")
@@ -727,6 +904,7 @@ def delete_received_item_view(request, receipt_id):
         po_id = receipt.po_item.header.id
         # Delete triggers recalculation via model delete() override
         receipt.delete()
+        ReportSnapshotService.refresh_in_background()
         messages.success(request, "✅ ลบประวัติการรับเรียบร้อย")
         return redirect('po_detail', po_id=po_id)
     return redirect('po_list')
@@ -745,53 +923,97 @@ def delete_po_view(request, po_id):
     
     return redirect('po_detail', po_id=po_id)
 
+@login_required
+@read_replica
+def po_cost_simulation_view(request):
+    """
+    What-if landed costs of the open POs, JSON, nothing saved:
+    ?rate=5.1&rate=5.3 (THB per yuan) &freight=4500 (THB/CBM) &shipping_type=SHIP
+    Every rate x freight combination is one scenario.
+    """
+    try:
+        rates = [float(v) for v in request.GET.getlist('rate') if v.strip()]
+        freights = [float(v) for v in request.GET.getlist('freight') if v.strip()]
+    except ValueError:
+        return JsonResponse({'error': 'Rates must be numbers'}, status=400)
+    shipping_type = request.GET.get('shipping_type', '')
+    if shipping_type and shipping_type not in dict(POHeader.SHIPPING_TYPE_CHOICES):
+        return JsonResponse({'error': 'Unknown shipping type'}, status=400)
+    return JsonResponse(WhatIfService.simulate(WhatIfService.scenarios(rates, freights, shipping_type)))
+
 def logout_view(request):
     logout(request)
     messages.info(request, "ออกจากระบบแล้ว")
     return redirect('login')
 
+def resolve_sales_filters(request):
+    """
+    Sales summary filters from GET, or from the session when the page is
+    opened without parameters. GET values are persisted to the session.
+    """
+    # Session Persistence Logic
+    if not request.GET and 'sales_filter_mode' in request.session:
+        # Load from session if no GET params and session exists
+        return {
+            'start_date': request.session.get('sales_start_date'),
+            'end_date': request.session.get('sales_end_date'),
+            'search': request.session.get('sales_search', ''),
+            'filter_mode': request.session.get('sales_filter_mode', 'general'),
+            'movement': request.session.get('sales_movement', 'all'),
+            'focus_date': request.session.get('sales_focus_date', ''),
+            'category': request.session.get('sales_category', ''),
+            'status': request.session.get('sales_status', ''),
+            'fav': request.session.get('sales_fav', 'false') == 'true',
+        }
+
+    # Load from GET or use Defaults (and save to session if GET is present, or just always save current state)
+    # Using .get() returns None if missing, so we handle defaults below
+    filters = {
+        'start_date': request.GET.get('start_date'),
+        'end_date': request.GET.get('end_date'),
+        'search': request.GET.get('search', '').strip(),
+        'filter_mode': request.GET.get('filter_mode', 'general'),
+        'movement': request.GET.get('movement', 'all'),
+        'focus_date': request.GET.get('focus_date', ''),
+        'category': request.GET.get('category', '').strip(),
+        'status': request.GET.get('status', '').strip(),
+        'fav': request.GET.get('fav') == 'true',
+    }
+
+    # Save to session (only if meaningful? easier to always save current view state)
+    request.session['sales_start_date'] = filters['start_date']
+    request.session['sales_end_date'] = filters['end_date']
+    request.session['sales_search'] = filters['search']
+    request.session['sales_filter_mode'] = filters['filter_mode']
+    request.session['sales_movement'] = filters['movement']
+    request.session['sales_focus_date'] = filters['focus_date']
+    request.session['sales_category'] = filters['category']
+    request.session['sales_status'] = filters['status']
+    request.session['sales_fav'] = 'true' if filters['fav'] else 'false'
+    return filters
+
+def sales_filters_etag_part(request):
+    return sorted(resolve_sales_filters(request).items())
+
 @login_required
+@versioned_etag(*ReportService.SALES_DEPENDS_ON, extra=sales_filters_etag_part)
+@read_replica
 def daily_sales_view(request):
     # Standard Date Handling
     today = date.today()
     default_end = date.today()
     # default_end = today + timedelta(days=30)
-    
-    # Session Persistence Logic
-    if not request.GET and 'sales_filter_mode' in request.session:
-        # Load from session if no GET params and session exists
-        start_date_str = request.session.get('sales_start_date')
-        end_date_str = request.session.get('sales_end_date')
-        search_query = request.session.get('sales_search', '')
-        filter_mode = request.session.get('sales_filter_mode', 'general')
-        movement_filter = request.session.get('sales_movement', 'all')
-        focus_date_str = request.session.get('sales_focus_date', '')
-        selected_category = request.session.get('sales_category', '')
-        status_filter = request.session.get('sales_status', '')
-        show_fav = request.session.get('sales_fav', 'false') == 'true'
-    else:
-        # Load from GET or use Defaults (and save to session if GET is present, or just always save current state)
-        # Using .get() returns None if missing, so we handle defaults below
-        start_date_str = request.GET.get('start_date')
-        end_date_str = request.GET.get('end_date')
-        search_query = request.GET.get('search', '').strip()
-        filter_mode = request.GET.get('filter_mode', 'general')
-        movement_filter = request.GET.get('movement', 'all')
-        focus_date_str = request.GET.get('focus_date', '')
-        selected_category = request.GET.get('category', '').strip()
-        status_filter = request.GET.get('status', '').strip()
-        show_fav = request.GET.get('fav') == 'true'
-        
-        # Save to session (only if meaningful? easier to always save current view state)
-        request.session['sales_start_date'] = start_date_str
-        request.session['sales_end_date'] = end_date_str
-        request.session['sales_search'] = search_query
-        request.session['sales_filter_mode'] = filter_mode
-        request.session['sales_movement'] = movement_filter
-        request.session['sales_focus_date'] = focus_date_str
-        request.session['sales_category'] = selected_category
-        request.session['sales_status'] = status_filter
-        request.session['sales_fav'] = 'true' if show_fav else 'false'
+
+    filters = resolve_sales_filters(request)
+    start_date_str = filters['start_date']
+    end_date_str = filters['end_date']
+    search_query = filters['search']
+    filter_mode = filters['filter_mode']
+    movement_filter = filters['movement']
+    focus_date_str = filters['focus_date']
+    selected_category = filters['category']
+    status_filter = filters['status']
+    show_fav = filters['fav']
     
     # Parse dates or use defaults
     try:
@@ -803,11 +1025,7 @@ def daily_sales_view(request):
         end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date() if end_date_str else default_end
     except (ValueError, TypeError):
         end_date = default_end
-    
-    # Calculate number of days in range for average calculation
-    num_days = (end_date - start_date).days + 1
-    if num_days < 1: num_days = 1
-    
+
     focus_date = None
     if focus_date_str:
         try:
@@ -815,178 +1033,51 @@ def daily_sales_view(request):
         except (ValueError, TypeError):
             pass
 
-    # 1. Base Product Query
-    products = MasterItem.objects.all().order_by('product_code')
+    parsed_filters = {
+        'start_date': start_date,
+        'end_date': end_date,
+        'search': search_query,
+        'filter_mode': filter_mode,
+        'movement': movement_filter,
+        'focus_date': focus_date,
+        'category': selected_category,
+        'status': status_filter,
+        'fav': show_fav,
+    }
 
-    if search_query:
-        products = products.filter(Q(product_code__icontains=search_query) | Q(name__icontains=search_query))
+    # Default view is precomputed after imports/receiving
+    snapshot = None
+    if parsed_filters == ReportService.default_sales_filters(today):
+        snapshot = ReportSnapshotService.load(ReportSnapshotService.SALES_SUMMARY)
 
-    # Category Filter
-    categories = MasterItem.objects.values_list('category', flat=True).distinct().order_by('category')
-    if selected_category:
-        products = products.filter(category=selected_category)
-        
-    # Favorites Filter
-    if show_fav:
-        products = products.filter(is_favourite=True)
-        
-    # 2. Annotate Total Period Sales/Qty
-    products = products.annotate(
-        period_qty=Coalesce(Sum('sale__qty', filter=Q(sale__date__range=(start_date, end_date))), 0),
-        period_amount=Coalesce(Sum('sale__total_price', filter=Q(sale__date__range=(start_date, end_date))), 0, output_field=DecimalField())
-    )
-
-    # 3. Apply Filters based on Mode
-    if filter_mode == 'focus' and focus_date:
-        # Focus Mode: Filter products that have ANY sale on the specific focus date
-        # Use distinct() to avoid duplicates if multiple sales occur on that date
-        products = products.filter(sale__date=focus_date).distinct()
-        
+    if snapshot:
+        data, snapshot_at = snapshot
     else:
-        # General Mode: Apply Movement Filter
-        if movement_filter == 'active': # "มีการเคลื่อนไหว"
-            products = products.filter(period_qty__gt=0)
-        elif movement_filter == 'inactive': # "ไม่มีการเคลื่อนไหว"
-            products = products.filter(period_qty=0)
-    
-    # 4. Fetch Daily Sales Breakdown (Optimization)
-    # Get all sales within the range for the filtered products
-    sales_qs = Sale.objects.filter(
-        date__range=(start_date, end_date)
-    ).values('sku_id', 'date', 'qty')
-    
-    if search_query:
-        sales_qs = sales_qs.filter(Q(sku__product_code__icontains=search_query) | Q(sku__name__icontains=search_query))
-    if selected_category:
-        sales_qs = sales_qs.filter(sku__category=selected_category)
-    if show_fav:
-         # Need to filter sales by fav status too if we want to be strict, but products list is already filtered.
-         # Sales mapping relies on sku_id, so it's fine.
-         pass
-        
-    # Build Sales Map: sales_map[product_id][date_obj] = qty
-    sales_map = {}
-    for entry in sales_qs:
-        p_id = entry['sku_id']
-        d = entry['date']
-        q = entry['qty']
-        
-        if p_id not in sales_map:
-            sales_map[p_id] = {}
-        
-        sales_map[p_id][d] = sales_map[p_id].get(d, 0) + q
-
-    # 5. Generate Date Columns
-    date_columns = []
-    curr = start_date
-    while curr <= end_date:
-        date_columns.append(curr)
-        curr += timedelta(days=1)
-
-
-    # Prepare Pending Count Map (Incoming logic: count non-Complete items)
-    # User Request: "ให้นับจำนวนสินค้าทุกสถานะ ยกเว้น"เรียบร้อย" จากสรุปหน้ารายการสั่งซื้อ PO"
-    # Logic: Sum qty_ordered for items where PO Header Status != 'Complete'
-    # Wait, "Completed" status in PO means all received?
-    # Usually "Incoming" means not yet received.
-    # If PO is 'Pending' or 'Incomplete' or 'Arriving', it counts.
-    # If PO is 'Complete', it doesn't.
-    # We should exclude 'Complete' status.
-    incoming_items = POItem.objects.exclude(header__status='Complete').values('sku').annotate(
-        total_incoming=Sum('qty_ordered'),
-        total_received=Sum('total_received_qty')
-    )
-    # Incoming = Ordered - Received? Or just Ordered?
-    # Requirement: "ให้นับจำนวนสินค้าทุกสถานะ ยกเว้น เรียบร้อย" ... "จากสรุปหน้ารายการสั่งซื้อ PO"
-    # Usually Incoming = Ordered - Received.
-    # If I ordered 100, received 20, Incoming is 80.
-    # If PO is Complete, Incoming is 0.
-    # Let's calculate Remaining = Ordered - Received for non-Complete POs.
-    
-    incoming_map = {}
-    for inc in incoming_items:
-        rem = (inc['total_incoming'] or 0) - (inc['total_received'] or 0)
-        if rem > 0:
-            incoming_map[inc['sku']] = rem
-
-    # 6. Attach Daily Sales List to Products and Filtering by Status IN PYTHON
-    # Because 'status' logic involves complex conditionals (discontinued field vs stock vs min_limit),
-    # and we can't easily filter by computed property in DB without huge annotations.
-    # The 'status' field in MasterItem helps for 'Discontinued', but 'Normal/Low/Empty' is dynamic based on stock.
-    
-    # We evaluate products now
-    products_list = list(products) # Hit DB
-    final_products = []
-    
-    for p in products_list:
-        # Determine Status
-        status_code = 'normal'
-        status_label = 'ปกติ'
-        
-        if p.status == 'DISCONTINUED':
-             status_code = 'discontinued'
-             status_label = 'เลิกขาย'
-        elif p.current_stock <= 0:
-             status_code = 'empty'
-             status_label = 'หมด'
-        elif p.current_stock <= p.min_limit:
-             status_code = 'low'
-             status_label = 'ใกล้หมด'
-        
-        # Apply Status Filter
-        if status_filter:
-            if status_filter == 'discontinued' and status_code != 'discontinued': continue
-            if status_filter == 'empty' and status_code != 'empty': continue
-            if status_filter == 'low' and status_code != 'low': continue
-            if status_filter == 'normal' and status_code != 'normal': continue
-            
-        # Attach Computed Fields
-        p.display_status_code = status_code
-        p.display_status_label = status_label
-        p.incoming_qty = incoming_map.get(p.pk, 0)
-        
-        # Sales Map
-        p.daily_sales = []
-        p_sales = sales_map.get(p.pk, {})
-        for d in date_columns:
-            qty = p_sales.get(d, 0)
-            p.daily_sales.append(qty)
-            
-        # Avg Sales
-        if num_days > 0:
-             p.avg_sales = p.period_qty / num_days
-        else:
-             p.avg_sales = 0
-             
-        final_products.append(p)
-            
-    # Thai Date Headers
-    thai_months_abbr = ["", "ม.ค.", "ก.พ.", "มี.ค.", "เม.ย.", "พ.ค.", "มิ.ย.", "ก.ค.", "ส.ค.", "ก.ย.", "ต.ค.", "พ.ย.", "ธ.ค."]
-    date_headers = []
-    for d in date_columns:
-        # e.g. "1 ม.ค."
-        date_headers.append(f"{d.day} {thai_months_abbr[d.month]}")
+        data, snapshot_at = ReportService.build_sales_summary(parsed_filters), None
 
     context = {
-        'products': final_products,
+        'products': data['products'],
         'start_date': start_date.strftime('%Y-%m-%d'),
         'end_date': end_date.strftime('%Y-%m-%d'),
-        'date_headers': date_headers,
+        'date_headers': data['date_headers'],
         'search_query': search_query,
-        'categories': categories,
+        'categories': CacheService.get_categories(),
         'selected_category': selected_category,
         'movement_filter': movement_filter,
         'filter_mode': filter_mode,
         'focus_date': focus_date_str,
         'status_filter': status_filter,
         'show_fav': show_fav,
-        'num_days': num_days,
-        'total_period_sales': sum(p.period_amount for p in final_products), 
+        'num_days': data['num_days'],
+        'total_period_sales': data['total_period_sales'],
+        'snapshot_at': snapshot_at,
     }
     
     return render(request, 'inventory/sales_summary.html', context)
 
 @login_required
+@versioned_etag('MasterItem', 'POHeader', 'POItem')
+@read_replica
 def stock_report_view(request):
     # Handle AJAX Update
     if request.method == 'POST' and request.headers.get('x-requested-with') == 'XMLHttpRequest':
@@ -1014,122 +1105,122 @@ def stock_report_view(request):
                 return JsonResponse({'success': False, 'error': str(e)})
 
     # Filters
-    search_query = request.GET.get('search', '').strip()
-    status_filter = request.GET.get('status', '')
-    selected_category = request.GET.get('category', '')
-    show_fav = request.GET.get('fav') == 'true'
-    
-    # Base Query
-    items_qs = MasterItem.objects.all().order_by('product_code')
-    
-    if search_query:
-        items_qs = items_qs.filter(Q(product_code__icontains=search_query) | Q(name__icontains=search_query))
-        
-    if selected_category:
-        items_qs = items_qs.filter(category=selected_category)
-        
-    if show_fav:
-        items_qs = items_qs.filter(is_favourite=True)
-
-    # Categories for filter
-    categories = MasterItem.objects.values_list('category', flat=True).distinct().order_by('category')
-    
-    # Annotate with Pending PO Data (Waiting/Arriving)
-    today = date.today()
-    next_week = today + timedelta(days=7)
-    
-    # We need to map SKU -> { qty_pending, qty_arriving }
-    # Let's do this efficiently.
-    # Group by SKU, filter PO Status=Pending
-    
-    # รวม qty รอเข้าจากทุก status ที่ยังไม่รับครบ (ยกเว้น Complete)
-    # - Pending / Arriving Soon / Overdue : นับ qty_ordered ทั้งหมด (ยังไม่ได้รับอะไรเลย หรือส่วนที่ยังค้างอยู่)
-    # - Incomplete : นับเฉพาะส่วนที่ยังไม่ได้รับ (qty_ordered - total_received_qty)
-    open_statuses = ['Pending', 'Arriving Soon', 'Overdue']
-    pending_items = POItem.objects.filter(
-        header__status__in=open_statuses
-    ).values('sku').annotate(
-        total_pending=Sum('qty_ordered')
-    )
-    pending_map = {p['sku']: p['total_pending'] for p in pending_items}
+    filters = {
+        'search': request.GET.get('search', '').strip(),
+        'status': request.GET.get('status', ''),
+        'category': request.GET.get('category', ''),
+        'fav': request.GET.get('fav') == 'true',
+    }
 
-    incomplete_items = POItem.objects.filter(
-        header__status='Incomplete'
-    ).values('sku').annotate(
-        remaining=Sum(F('qty_ordered') - F('total_received_qty'))
-    )
-    for p in incomplete_items:
-        sku = p['sku']
-        remaining = max(p['remaining'] or 0, 0)
-        pending_map[sku] = pending_map.get(sku, 0) + remaining
-    
-    # Arriving Logic: Pending AND Estimated Date <= next 7 days
-    arriving_items = POItem.objects.filter(
-        header__status='Pending',
-        header__estimated_date__range=[today, next_week]
-    ).values('sku').annotate(
-        total_arriving=Sum('qty_ordered')
-    )
-    arriving_map = {p['sku']: p['total_arriving'] for p in arriving_items}
+    # Default view is precomputed after imports/receiving
+    snapshot = None
+    if filters == ReportService.default_stock_filters():
+        snapshot = ReportSnapshotService.load(ReportSnapshotService.STOCK_REPORT)
 
-    # "Stock Alert" logic based on existing code style (iterating)
-    filtered_data = []
-    
-    for item in items_qs:
-        # Calculate Stock (Using Model Logic or Service if exists)
-        # Using item.current_stock directly for now as per model definition
-        current_stock = item.current_stock
-        
-        # Pending/Arriving from Maps
-        qty_pending = pending_map.get(item.product_code, 0)
-        # qty_arriving is subset of pending? Or separate? 
-        # Usually user just wants to know "Incoming".
-        # Let's use total_pending as "Incoming".
-        
-        # Status Logic
-        status_code = 'normal'
-        if current_stock <= 0:
-            status_code = 'out_of_stock' # Sold Out / Red
-        elif current_stock <= item.min_limit:
-            status_code = 'low_stock' # Low / Orange
-        
-        # Filter Logic
-        # Mapping UI status to internal code
-        # UI: "ok" (Normal), "low" (Low), "empty" (Sold Out)
-        
-        if status_filter == 'empty' and status_code != 'out_of_stock': continue
-        if status_filter == 'low' and status_code != 'low_stock': continue
-        if status_filter == 'ok' and status_code != 'normal': continue
-        
-        # Alert Diff
-        alert_diff = 0
-        if current_stock < item.min_limit:
-            alert_diff = item.min_limit - current_stock
-            
-        filtered_data.append({
-            'sku': item.product_code,
-            'name': item.name,
-            'image_url': item.image.url if item.image else None,
-            'current_stock': current_stock,
-            'status_code': status_code,
-            'qty_pending': qty_pending,
-            'min_limit': item.min_limit,
-            'alert_diff': alert_diff,
-            'is_favourite': item.is_favourite,
-            'note1': item.note1,
-            'note2': item.note2,
-        })
+    if snapshot:
+        data, snapshot_at = snapshot
+    else:
+        data, snapshot_at = ReportService.build_stock_report(filters), None
 
     context = {
-        'stock_items': filtered_data,
-        'search_query': search_query,
-        'selected_status': status_filter,
-        'categories': categories,
-        'selected_category': selected_category,
-        'show_fav': show_fav,
+        'stock_items': data['stock_items'],
+        'search_query': filters['search'],
+        'selected_status': filters['status'],
+        'categories': CacheService.get_categories(),
+        'selected_category': filters['category'],
+        'show_fav': filters['fav'],
+        'snapshot_at': snapshot_at,
     }
     return render(request, 'inventory/stock_report.html', context)
 
+def resolve_profitability_filters(request):
+    filters = ProfitabilityService.default_filters()
+    for param in ('start_date', 'end_date'):
+        try:
+            filters[param] = datetime.strptime(request.GET.get(param, ''), '%Y-%m-%d').date()
+        except ValueError:
+            pass
+    groups = [g for g in request.GET.getlist('group') if g in GROUPINGS]
+    if groups or 'period' in request.GET:
+        filters['group'] = groups
+    for param in ('platform', 'shop', 'search', 'category'):
+        filters[param] = request.GET.get(param, filters[param]).strip()
+    if request.GET.get('period') in PERIODS:
+        filters['period'] = request.GET['period']
+    if request.GET.get('cost') == 'avg':
+        filters['cost'] = 'avg'
+    if request.GET.get('sort') in PROFIT_SORTS:
+        filters['sort'] = request.GET['sort']
+    page = request.GET.get('page', '')
+    filters['page'] = int(page) if page.isdigit() else 1
+    return filters
+
+@login_required
+@versioned_etag('MasterItem', 'SaleDailyRollup')
+@read_replica
+def profitability_view(request):
+    filters = resolve_profitability_filters(request)
+
+    if request.GET.get('export') == 'csv':
+        writer = csv.writer(Echo())
+        # BOM: Excel opens Thai product names as UTF-8
+        rows = (writer.writerow(row) for row in ProfitabilityService.csv_rows(filters))
+        response = StreamingHttpResponse(itertools.chain(['\ufeff'], rows), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profitability_{filters["start_date"]:%Y%m%d}_{filters["end_date"]:%Y%m%d}.csv"'
+        return response
+
+    data = ProfitabilityService.cached_report(filters)
+    query = request.GET.copy()
+    query.pop('page', None)
+    # grouped() falls back to SKU rows when nothing is selected
+    show_sku = 'sku' in filters['group'] or not (filters['group'] or filters['period'] in PERIODS)
+    context = {
+        **data,
+        'filters': filters,
+        'show_sku': show_sku,
+        'label_columns': (filters['period'] in PERIODS) + 2 * show_sku + ('platform' in filters['group']) + ('shop' in filters['group']),
+        'start_date': filters['start_date'].strftime('%Y-%m-%d'),
+        'end_date': filters['end_date'].strftime('%Y-%m-%d'),
+        'query_string': query.urlencode(),
+        'categories': CacheService.get_categories(),
+        'platforms': [p for p, _ in Sale.PLATFORM_CHOICES],
+        'shops': CacheService.get_or_set(
+            'rollup_shops', ('SaleDailyRollup',),
+            lambda: list(SaleDailyRollup.objects.exclude(shop_name='').values_list('shop_name', flat=True).distinct().order_by('shop_name')),
+        ),
+    }
+    return render(request, 'inventory/profitability.html', context)
+
+
+@login_required
+def replenishment_view(request):
+    """
+    Reorder suggestions for the whole catalogue (utils/replenishment.py).
+    POST turns the ticked SKUs into draft POs, one per supplier.
+    """
+    suggestions = ReplenishmentService.suggestions()
+
+    if request.method == 'POST':
+        selected = set(request.POST.getlist('sku'))
+        chosen = [s for s in suggestions if s['sku'] in selected]
+        headers = ReplenishmentService.create_drafts(chosen)
+        if headers:
+            messages.success(request, f"✅ สร้างร่างใบสั่งซื้อ {len(headers)} ใบ ({len(chosen)} รายการ) เรียบร้อย")
+            return redirect(f"{reverse('po_list')}?status={POHeader.STATUS_DRAFT}")
+        messages.warning(request, "⚠️ ยังไม่ได้เลือกสินค้า")
+        return redirect('replenishment')
+
+    context = {
+        'suggestions': suggestions,
+        'forecast_at': SkuForecast.objects.aggregate(last=Max('computed_at'))['last'],
+    }
+    return render(request, 'inventory/replenishment.html', context)
+
+class Echo:
+    # csv.writer target that hands each line back for streaming
+    def write(self, value):
+        return value
+
 @login_required
 def update_min_limit(request, sku):
     if request.method == 'POST':
@@ -1145,6 +1236,8 @@ def update_min_limit(request, sku):
                         count += 1
                     except ValueError:
                         continue
+            # .update() skips signals
+            CacheService.bump_version('MasterItem')
             messages.success(request, f"บันทึกค่าจุดเตือนเรียบร้อยแล้ว ({count} รายการ)")
             return redirect('stock_report')
         else:
@@ -1153,45 +1246,6 @@ def update_min_limit(request, sku):
             
     return redirect('stock_report')
 
-def get_po_history(request, sku):
-    """
-    Returns HTML partial for PO History of a specific SKU
-    """
-    if not request.user.is_authenticated:
-        from django.http import HttpResponseForbidden
-        return HttpResponseForbidden()
-    
-    # Fetch Items
-    po_items = POItem.objects.filter(sku__product_code=sku).select_related('header', 'sku').prefetch_related('receipts').order_by('-header__order_date')
-    
-    formatted_data = []
-    for item in po_items:
-        # received date (first receipt?)
-        first_receipt = item.receipts.order_by('received_date').first()
-        received_date = first_receipt.received_date if first_receipt else None
-        
-        duration = None
-        if received_date and item.header.order_date:
-            duration = (received_date - item.header.order_date).days
-            
-        # Cost per piece (Baht)
-        cost_per_piece = 0
-        if item.qty_ordered > 0:
-            cost_per_piece = item.price_baht / item.qty_ordered
-            
-        # Total Yuan (if price_yuan is unit)
-        total_yuan = item.price_yuan * item.qty_ordered
-        
-        formatted_data.append({
-            'item': item,
-            'received_date': received_date,
-            'duration': duration,
-            'cost_per_piece': cost_per_piece,
-            'total_yuan': total_yuan
-        })
-        
-    return render(request, 'inventory/partials/po_history_table.html', {'history_items': formatted_data})
-
 def get_sales_history(request, sku):
     if not request.user.is_authenticated:
         from django.http import HttpResponseForbidden
@@ -1420,7 +1474,12 @@ def po_create_view(request):
             messages.error(request, f"❌ Error creating PO: {e}")
             # Fallback for non-AJAX
             
-    return render(request, 'inventory/po_create.html', {'master_items': master_items})
+    # New POs start at the rate in effect today (CurrencyRate)
+    current_rate = CurrencyRate.rate_on()
+    return render(request, 'inventory/po_create.html', {
+        'master_items': master_items,
+        'exchange_rate': current_rate.rate if current_rate else Decimal('5.0'),
+    })
 
 @login_required
 def product_list_view(request):
@@ -1432,7 +1491,7 @@ def product_list_view(request):
         products = products.filter(Q(product_code__icontains=search_query) | Q(name__icontains=search_query))
         
     # Category Filter
-    categories = MasterItem.objects.values_list('category', flat=True).distinct().order_by('category')
+    categories = CacheService.get_categories()
     selected_category = request.GET.get('category', '')
     if selected_category:
         products = products.filter(category=selected_category)
@@ -1505,6 +1564,8 @@ def save_product_view(request):
     return redirect('product_list')
 
 @login_required
+@versioned_etag('MasterItem', 'POHeader', 'POItem', 'ReceivedPOItem', 'LeadTimeStat')
+@read_replica
 def get_po_history(request, sku):
     # Fetch all receipts for this SKU
     receipts = ReceivedPOItem.objects.filter(po_item__sku__product_code=sku).select_related('po_item', 'po_item__header', 'po_item__sku').order_by('-received_date')
@@ -1529,12 +1590,30 @@ def get_po_history(request, sku):
         
         processed_receipts.append(r)
     
-    return render(request, 'inventory/partials/po_history_table.html', {'history_items': processed_receipts})
+    # Observed lead times (utils/leadtimes.py): per shipping type and over all of them
+    lead_times = sorted(
+        LeadTimeStat.objects.filter(scope=LeadTimeStat.SCOPE_SKU, key=sku),
+        key=lambda stat: stat.shipping_type,
+    )
+
+    return render(request, 'inventory/partials/po_history_table.html', {
+        'history_items': processed_receipts,
+        'lead_times': lead_times,
+    })
 
 @login_required
+@versioned_etag('Sale')
+@read_replica
 def get_sales_history(request, sku):
     # Fetch sales for the given SKU
     sales = Sale.objects.filter(sku__product_code=sku).order_by('-date')
+
+    # Optional ?start_date=&end_date= (YYYY-MM-DD): only those months' partitions are read
+    for param, lookup in (('start_date', 'date__gte'), ('end_date', 'date__lte')):
+        try:
+            sales = sales.filter(**{lookup: datetime.strptime(request.GET.get(param, ''), '%Y-%m-%d').date()})
+        except ValueError:
+            pass
     
     # Platform Colors
     platform_colors = {
@@ -1697,5 +1776,103 @@ def delete_supplier_info(request, supplier_id):
         messages.success(request, "✅ ลบข้อมูลร้านค้าเรียบร้อย")
     return redirect('supplier_info')
 
+@login_required
+def cache_stats_view(request):
+    """
+    Shared cache hit/miss statistics (staff only).
+    """
+    if not request.user.is_staff:
+        from django.http import HttpResponseForbidden
+        return HttpResponseForbidden()
+
+    if request.method == 'POST' and request.POST.get('action') == 'reset':
+        CacheService.reset_stats()
+
+    return JsonResponse(CacheService.stats())
+
+@login_required
+def profiles_view(request):
+    """
+    Captured request profiles (staff only). Capture with ?_profile=1 or ?_profile=sample.
+    """
+    if not request.user.is_staff:
+        from django.http import HttpResponseForbidden
+        return HttpResponseForbidden()
+
+    from utils.profiling import ProfileStore
+
+    if request.method == 'POST' and request.POST.get('action') == 'delete':
+        try:
+            ProfileStore.delete(request.POST.get('profile_id'))
+        except ValueError:
+            pass
+        return redirect('profiles')
+
+    return render(request, 'inventory/profiles.html', {
+        'profiles': ProfileStore.list_profiles(),
+        'max_entries': settings.PROFILE_MAX_ENTRIES,
+    })
+
+@login_required
+def profile_download_view(request, profile_id, fmt):
+    if not request.user.is_staff:
+        from django.http import HttpResponseForbidden
+        return HttpResponseForbidden()
+
+    from django.http import HttpResponse, Http404
+    from utils.profiling import ProfileStore
+
+    try:
+        content, content_type = ProfileStore.render(profile_id, fmt)
+    except (ValueError, FileNotFoundError):
+        raise Http404("Profile not found")
+
+    response = HttpResponse(content, content_type=content_type)
+    if request.GET.get('download'):
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.{fmt}"'
+    return response
 
+def metrics_view(request):
+    """
+    Prometheus scrape endpoint (text format). Allowed from METRICS_ALLOWED_IPS
+    or for logged-in staff. Behind nginx the client IP comes from X-Real-IP
+    (gunicorn only listens on the local unix socket).
+    """
+    from django.http import HttpResponse, HttpResponseForbidden
+    from django.db.models import Min
+    from django.utils import timezone
+    from .models import ImportLog
+
+    client_ip = request.META.get('HTTP_X_REAL_IP') or request.META.get('REMOTE_ADDR')
+    is_staff = request.user.is_authenticated and request.user.is_staff
+    if client_ip not in settings.METRICS_ALLOWED_IPS and not is_staff:
+        return HttpResponseForbidden()
 
+    # Queue state comes straight from ImportLog (shared by all workers already)
+    queue = {row['status']: row for row in ImportLog.objects.filter(
+        status__in=['Pending', 'Processing']
+    ).values('status').annotate(depth=Count('id'), oldest=Min('started_at'))}
+    now = timezone.now()
+    depth_samples = []
+    age_samples = []
+    for status in ('Pending', 'Processing'):
+        row = queue.get(status)
+        depth_samples.append(({'status': status}, row['depth'] if row else 0))
+        age = (now - row['oldest']).total_seconds() if row and row['oldest'] else 0
+        age_samples.append(({'status': status}, round(age, 1)))
+
+    cache_stats = CacheService.stats()
+    cache_requests = []
+    cache_ratio = [({'name': '_all'}, cache_stats['hit_ratio'])]
+    for name, s in cache_stats['names'].items():
+        cache_requests.append(({'name': name, 'result': 'hit'}, s['hits']))
+        cache_requests.append(({'name': name, 'result': 'miss'}, s['misses']))
+        cache_ratio.append(({'name': name}, s['hit_ratio']))
+
+    gauges = [
+        ('jst_import_queue_depth', 'Imports waiting or running', depth_samples),
+        ('jst_import_queue_oldest_age_seconds', 'Age of the oldest waiting/running import', age_samples),
+        ('jst_cache_requests', 'Shared cache lookups since last stats reset', cache_requests),
+        ('jst_cache_hit_ratio', 'Shared cache hit ratio since last stats reset', cache_ratio),
+    ]
+    return HttpResponse(MetricsService.render(gauges), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -66,13 +66,21 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Per-view counters for /metrics (reads PerformanceMiddleware's numbers)
+    'inventory.middleware.MetricsMiddleware',
+    # First so its timings cover the whole middleware stack
+    'inventory.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    # Read-your-writes cookie for the replica router (inactive without a replica)
+    'inventory.middleware.ReplicaStickyMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # Needs request.user (after AuthenticationMiddleware)
+    'inventory.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'jst_system.urls'
@@ -125,6 +133,45 @@ DATABASES = {
     }
 }
 
+# Cache (shared between gunicorn workers)
+# CACHE_BACKEND=file (default) | db | redis | locmem
+# - file : works out of the box for workers on the same host
+# - db   : needs `python manage.py createcachetable`
+# - redis: any Redis-compatible server (Redis/Valkey/KeyDB), needs the `redis` package
+CACHE_BACKEND = os.getenv('CACHE_BACKEND', 'file')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_URL', 'redis://127.0.0.1:6379/1'),
+            'KEY_PREFIX': 'jst',
+        }
+    }
+elif CACHE_BACKEND == 'db':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'jst_cache',
+            'KEY_PREFIX': 'jst',
+        }
+    }
+elif CACHE_BACKEND == 'locmem':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('CACHE_DIR', str(BASE_DIR / 'cache')),
+            'KEY_PREFIX': 'jst',
+            'OPTIONS': {'MAX_ENTRIES': 5000},
+        }
+    }
+
 # Email Settings
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
@@ -175,12 +222,42 @@ USE_TZ = True
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
-# Upload Limits (10 MB)
+# Thumbnails under MEDIA_ROOT/thumbs/ (WEBP or JPEG)
+THUMBNAIL_FORMAT = os.getenv('THUMBNAIL_FORMAT', 'WEBP')
+
+# Upload Limits
+# Form fields only (files are not counted here)
 DATA_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
-FILE_UPLOAD_MAX_MEMORY_SIZE = 10 * 1024 * 1024
+# Every uploaded file is streamed to a temp file on disk and hashed on the way,
+# so worker memory stays flat regardless of file size
+FILE_UPLOAD_HANDLERS = ['utils.uploads.HashingTemporaryFileUploadHandler']
+FILE_UPLOAD_TEMP_DIR = os.getenv('FILE_UPLOAD_TEMP_DIR') or None
+# Import files: larger ones go through the resumable chunked upload (import/upload/)
+IMPORT_MAX_UPLOAD_SIZE = int(os.getenv('IMPORT_MAX_UPLOAD_SIZE', 500 * 1024 * 1024))
+IMPORT_CHUNK_SIZE = 5 * 1024 * 1024
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Performance instrumentation (inventory.middleware.PerformanceMiddleware)
+# Disabled -> removed from the middleware chain at startup, zero per-request cost
+PERF_MONITORING_ENABLED = os.getenv('PERF_MONITORING_ENABLED', 'True') == 'True'
+PERF_SLOW_REQUEST_MS = int(os.getenv('PERF_SLOW_REQUEST_MS', 1000))
+PERF_SERVER_TIMING = os.getenv('PERF_SERVER_TIMING', 'True') == 'True'
+PERF_TRACEMALLOC = os.getenv('PERF_TRACEMALLOC', 'False') == 'True'  # peak allocation, slows requests
+
+# Staff-only profiling of single requests: ?_profile=1 (cProfile) or ?_profile=sample
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'True') == 'True'
+PROFILE_DIR = os.getenv('PROFILE_DIR', str(BASE_DIR / 'profiles'))
+PROFILE_MAX_ENTRIES = 50  # ring buffer, oldest captures are deleted
+PROFILE_SAMPLE_INTERVAL = 0.005  # seconds between stack samples
+
+# Prometheus /metrics: each worker dumps its counters to METRICS_DIR/<pid>.json,
+# the endpoint merges them. Scrapable from METRICS_ALLOWED_IPS or by staff users.
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+METRICS_DIR = os.getenv('METRICS_DIR', str(BASE_DIR / 'metrics'))
+METRICS_FLUSH_INTERVAL = 5  # seconds
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1').split(',') if ip.strip()]
+
 # Logging Configuration
 LOGGING = {
     'version': 1,
@@ -194,6 +271,12 @@ LOGGING = {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        # One JSON line per slow request
+        'performance': {
+            'level': 'WARNING',
+            'class': 'logging.FileHandler',
+            'filename': BASE_DIR / 'performance.log',
+        },
     },
     'loggers': {
         'django': {
@@ -206,5 +289,58 @@ LOGGING = {
             'level': 'INFO', # Capture our image import logs
             'propagate': True,
         },
+        'inventory.performance': {
+            'handlers': ['performance'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
     },
 }
+
+# Load testing (scripts/load_test.py): POST /login/loadtest/ with this token
+# logs in LOADTEST_USERNAME without OTP. Empty token = endpoint disabled (404).
+# Never set it on a server reachable by real users.
+LOADTEST_LOGIN_TOKEN = os.getenv('LOADTEST_LOGIN_TOKEN', '')
+LOADTEST_USERNAME = os.getenv('LOADTEST_USERNAME', 'loadtest')
+
+# Outbox worker (manage.py run_outbox / deployment/jst_outbox.service):
+# login only queues the OTP e-mail, the worker sends it and retries with backoff.
+OUTBOX_POLL_INTERVAL = int(os.getenv('OUTBOX_POLL_INTERVAL', '2'))  # seconds
+OUTBOX_MAX_ATTEMPTS = 5
+# Login activity is stored in LoginActivity and appended to this sheet in batches
+# (empty = keep it in the table only)
+LOGIN_ACTIVITY_SHEET_ID = os.getenv('LOGIN_ACTIVITY_SHEET_ID', '')
+LOGIN_ACTIVITY_FLUSH_INTERVAL = 60  # seconds
+
+# Data retention (manage.py apply_retention, nightly cron). 0 disables a policy.
+# Stock snapshots: daily for 90 days, then last of each week, after a year last of each month
+RETENTION_SNAPSHOT_DAILY_DAYS = 90
+RETENTION_SNAPSHOT_WEEKLY_DAYS = 365
+# Uploaded import files (media/imports/): gzip after 7 days, delete after 180
+RETENTION_IMPORT_FILE_COMPRESS_DAYS = 7
+RETENTION_IMPORT_FILE_DELETE_DAYS = 180
+RETENTION_PARTIAL_UPLOAD_DAYS = 2
+# ImportLog.error_log older than 30 days is cut to 5000 characters
+RETENTION_ERROR_LOG_DAYS = 30
+RETENTION_ERROR_LOG_MAX_CHARS = 5000
+RETENTION_BATCH_SIZE = 1000  # rows per transaction
+
+# Read replica (optional): @read_replica views (reports, history partials)
+# read from it, everything else uses the primary. DB_REPLICA_HOST can point
+# at the primary itself to try the routing locally (a second connection).
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        # Tests: same test database, no second schema to create
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['utils.db_routing.ReplicaRouter']
+# After a save the user's reports stay on the primary this long (replication lag)
+REPLICA_STICKY_SECONDS = 10
+
+# New POs without an estimated date: median observed lead time of their
+# shipping type (LeadTimeStat, manage.py rebuild_lead_times) instead of the
+# fixed 14 (CAR) / 25 (SHIP) days. Changes PO statuses / overdue flags.
+PO_ESTIMATE_FROM_LEAD_TIMES = os.getenv('PO_ESTIMATE_FROM_LEAD_TIMES', 'False') == 'True'
@@ -0,0 +1,302 @@
+"""
+HTTP load test for a running JST server (dev server, gunicorn, nginx).
+
+Each virtual user logs in through the test-mode endpoint /login/loadtest/
+(server needs LOADTEST_LOGIN_TOKEN set), then loops over a weighted mix of
+realistic actions with random think time until --duration is over:
+
+    sales summary, stock report, PO list, PO detail, search-as-you-type on
+    /search/options/, stock/sales history partials, stock report AJAX edits
+
+Reports p50/p95/p99 latency, throughput and error rate per endpoint, so
+runs with different gunicorn worker classes/counts can be compared:
+
+    LOADTEST_LOGIN_TOKEN=secret python scripts/load_test.py \
+        --base-url http://127.0.0.1:8000 --users 20 --duration 120 \
+        --label "sync x3" --output results/sync3.json
+
+AJAX edits only touch SKUs starting with --edit-prefix (default __SCALE__-, the
+generate_scale_data SKUs); use --no-writes for read-only runs.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import requests
+
+# action -> weight (share of the traffic mix)
+MIX = {
+    'sales_summary': 15,
+    'stock_report': 15,
+    'po_list': 15,
+    'po_detail': 10,
+    'search_typing': 15,
+    'stock_history': 10,
+    'sales_history': 10,
+    'stock_edit': 10,
+}
+
+PO_LINK_RE = re.compile(r'href="/po/(\d+)/"')
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)  # endpoint -> [seconds]
+        self.errors = defaultdict(int)
+        self.error_samples = []
+
+    def record(self, endpoint, seconds, ok, detail=None):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+                if len(self.error_samples) < 20:
+                    self.error_samples.append(f"{endpoint}: {detail}")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank
+    index = max(int(round(pct / 100 * len(sorted_values) + 0.5)) - 1, 0)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class VirtualUser(threading.Thread):
+    def __init__(self, args, stats, targets, deadline, start_delay, seed):
+        super().__init__(daemon=True)
+        self.args = args
+        self.stats = stats
+        self.targets = targets
+        self.deadline = deadline
+        self.start_delay = start_delay
+        self.rng = random.Random(seed)
+        self.session = requests.Session()
+
+    def url(self, path):
+        return self.args.base_url.rstrip('/') + path
+
+    def request(self, endpoint, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, self.url(path), timeout=self.args.timeout, allow_redirects=False, **kwargs)
+            elapsed = time.perf_counter() - start
+            # A redirect here means the session was lost (login page)
+            ok = response.status_code < 300
+            detail = f"HTTP {response.status_code}"
+            if ok and endpoint == 'stock_edit':
+                ok = response.json().get('success', False)
+                detail = response.text[:200]
+            self.stats.record(endpoint, elapsed, ok, detail)
+            return response
+        except (requests.RequestException, ValueError) as e:
+            self.stats.record(endpoint, time.perf_counter() - start, False, str(e))
+            return None
+
+    def think(self):
+        if self.args.think_time > 0:
+            time.sleep(self.rng.expovariate(1 / self.args.think_time))
+
+    def run(self):
+        time.sleep(self.start_delay)
+        if not login(self.session, self.args):
+            self.stats.record('login', 0, False, 'login failed')
+            return
+
+        actions = list(MIX)
+        weights = [MIX[a] for a in actions]
+        if not self.targets['po_ids']:
+            weights[actions.index('po_detail')] = 0
+        if self.args.no_writes or not self.targets['edit_skus']:
+            weights[actions.index('stock_edit')] = 0
+
+        while time.monotonic() < self.deadline:
+            action = self.rng.choices(actions, weights)[0]
+            getattr(self, f"do_{action}")()
+            self.think()
+
+    # --- Actions ---
+
+    def do_sales_summary(self):
+        self.request('sales_summary', 'GET', '/')
+
+    def do_stock_report(self):
+        params = self.rng.choice([{}, {}, {'status': 'low'}, {'search': self.rng.choice(self.targets['skus'])[:4]}])
+        self.request('stock_report', 'GET', '/stock/', params=params)
+
+    def do_po_list(self):
+        self.request('po_list', 'GET', '/po/')
+
+    def do_po_detail(self):
+        self.request('po_detail', 'GET', f"/po/{self.rng.choice(self.targets['po_ids'])}/")
+
+    def do_search_typing(self):
+        # One request per keystroke (the page debounces, fast typists still send several)
+        sku = self.rng.choice(self.targets['skus'])
+        for length in range(2, min(len(sku), 7) + 1):
+            self.request('search_options', 'GET', '/search/options/', params={'sku_query': sku[:length], 'po_number': ''})
+            time.sleep(self.rng.uniform(0.05, 0.2))
+
+    def do_stock_history(self):
+        self.request('stock_history', 'GET', f"/stock/history/{self.rng.choice(self.targets['skus'])}/")
+
+    def do_sales_history(self):
+        self.request('sales_history', 'GET', f"/sales/history/{self.rng.choice(self.targets['skus'])}/")
+
+    def do_stock_edit(self):
+        sku = self.rng.choice(self.targets['edit_skus'])
+        if 'csrftoken' not in self.session.cookies:
+            self.session.get(self.url('/stock/'), timeout=self.args.timeout)
+        self.request('stock_edit', 'POST', '/stock/', data={
+            'action': 'update_field',
+            'sku': sku,
+            'field': 'note2',
+            'value': f"loadtest {time.strftime('%H:%M:%S')}",
+        }, headers={
+            'X-CSRFToken': self.session.cookies.get('csrftoken', ''),
+            'X-Requested-With': 'XMLHttpRequest',
+            'Referer': self.url('/stock/'),
+        })
+
+
+def login(session, args):
+    try:
+        response = session.post(
+            args.base_url.rstrip('/') + '/login/loadtest/',
+            data={'token': args.token},
+            timeout=args.timeout,
+        )
+    except requests.RequestException as e:
+        print(f"Login failed: {e}", file=sys.stderr)
+        return False
+    if response.status_code != 200:
+        print(f"Login failed: HTTP {response.status_code} (is LOADTEST_LOGIN_TOKEN set on the server?)", file=sys.stderr)
+        return False
+    return True
+
+
+def discover_targets(args):
+    """
+    SKUs and PO ids to hit, taken from the server itself.
+    """
+    session = requests.Session()
+    if not login(session, args):
+        sys.exit(1)
+    base = args.base_url.rstrip('/')
+
+    options = session.get(f"{base}/search/options/", params={'sku_query': args.sku_prefix, 'po_number': ''}, timeout=args.timeout).json()
+    skus = [s.split(' | ')[0] for s in options.get('skus', [])]
+    if not skus:
+        sys.exit(f"No SKUs found for prefix {args.sku_prefix!r} (run generate_scale_data or pass --sku-prefix)")
+
+    po_html = session.get(f"{base}/po/", timeout=args.timeout).text
+    po_ids = sorted(set(PO_LINK_RE.findall(po_html)))
+    edit_skus = [s for s in skus if s.startswith(args.edit_prefix)] if args.edit_prefix else []
+    return {'skus': skus, 'po_ids': po_ids, 'edit_skus': edit_skus}
+
+
+def summarize(stats, wall_seconds):
+    rows = []
+    all_latencies = []
+    total_errors = 0
+    for endpoint in sorted(stats.latencies):
+        values = sorted(stats.latencies[endpoint])
+        all_latencies += values
+        total_errors += stats.errors[endpoint]
+        rows.append(summary_row(endpoint, values, stats.errors[endpoint], wall_seconds))
+    rows.append(summary_row('TOTAL', sorted(all_latencies), total_errors, wall_seconds))
+    return rows
+
+
+def summary_row(endpoint, values, errors, wall_seconds):
+    count = len(values)
+    return {
+        'endpoint': endpoint,
+        'requests': count,
+        'errors': errors,
+        'error_rate': round(errors / count, 4) if count else 0,
+        'rps': round(count / wall_seconds, 2) if wall_seconds else 0,
+        'p50_ms': round(percentile(values, 50) * 1000, 1),
+        'p95_ms': round(percentile(values, 95) * 1000, 1),
+        'p99_ms': round(percentile(values, 99) * 1000, 1),
+        'max_ms': round(values[-1] * 1000, 1) if values else 0,
+    }
+
+
+def print_table(rows):
+    header = f"{'endpoint':<16}{'reqs':>8}{'err%':>8}{'req/s':>9}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}"
+    print(header)
+    print('-' * len(header))
+    for r in rows:
+        print(f"{r['endpoint']:<16}{r['requests']:>8}{r['error_rate'] * 100:>7.1f}%{r['rps']:>9}"
+              f"{r['p50_ms']:>9}{r['p95_ms']:>9}{r['p99_ms']:>9}{r['max_ms']:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the JST web app with a realistic traffic mix.')
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--token', default=os.getenv('LOADTEST_LOGIN_TOKEN', ''), help='Defaults to $LOADTEST_LOGIN_TOKEN')
+    parser.add_argument('--users', type=int, default=10, help='Concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='Seconds of traffic after ramp-up starts')
+    parser.add_argument('--ramp-up', type=float, default=10, help='Seconds over which users start')
+    parser.add_argument('--think-time', type=float, default=1.0, help='Mean pause between actions (0 = closed loop, max pressure)')
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--sku-prefix', default='__SCALE__-', help='SKUs used for history/search requests')
+    parser.add_argument('--edit-prefix', default='__SCALE__-', help='Only SKUs with this prefix are edited')
+    parser.add_argument('--no-writes', action='store_true', help='Skip the stock report AJAX edits')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--label', default='', help='Free text stored with the results (e.g. "gthread 3x4")')
+    parser.add_argument('--output', help='Write the summary as JSON here')
+    args = parser.parse_args()
+
+    if not args.token:
+        sys.exit("Missing --token / LOADTEST_LOGIN_TOKEN")
+
+    targets = discover_targets(args)
+    print(f"{len(targets['skus'])} SKUs, {len(targets['po_ids'])} POs, {len(targets['edit_skus'])} editable SKUs; "
+          f"{args.users} users for {args.duration:.0f}s")
+
+    stats = Stats()
+    start = time.monotonic()
+    deadline = start + args.duration
+    users = [
+        VirtualUser(args, stats, targets, deadline, args.ramp_up * i / max(args.users, 1), args.seed + i)
+        for i in range(args.users)
+    ]
+    for user in users:
+        user.start()
+    for user in users:
+        user.join()
+    wall_seconds = time.monotonic() - start
+
+    rows = summarize(stats, wall_seconds)
+    print_table(rows)
+    if stats.error_samples:
+        print("\nSample errors:")
+        for line in stats.error_samples:
+            print(f"  {line}")
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump({
+                'label': args.label,
+                'base_url': args.base_url,
+                'users': args.users,
+                'duration': args.duration,
+                'think_time': args.think_time,
+                'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'results': rows,
+            }, f, indent=2)
+        print(f"\nSaved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
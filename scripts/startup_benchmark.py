@@ -0,0 +1,147 @@
+"""
+Measures what a fresh gunicorn worker pays before serving its first
+request: import time (python -X importtime), wall time to a loaded
+WSGI app + URLconf, RSS and which heavy libraries got imported.
+
+    python scripts/startup_benchmark.py                  # current tree
+    python scripts/startup_benchmark.py --output before.json
+    ...change code...
+    python scripts/startup_benchmark.py --compare before.json
+
+--touch utils.importers additionally imports a module after startup, to
+see what the first import/login request costs once loading is deferred.
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ['pandas', 'numpy', 'requests', 'gspread', 'google.oauth2', 'openpyxl', 'PIL']
+
+# Runs in a fresh interpreter, like a gunicorn worker (no --preload)
+CHILD = r"""
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {base_dir!r})
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'jst_system.settings')
+from jst_system.wsgi import application
+from django.urls import get_resolver
+# Load every view module the URLconf points at
+get_resolver().url_patterns
+for name in {touch!r}:
+    __import__(name)
+wall_ms = (time.perf_counter() - start) * 1000
+
+rss_kb = None
+try:
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                rss_kb = int(line.split()[1])
+except OSError:
+    import resource
+    rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    'wall_ms': wall_ms,
+    'rss_kb': rss_kb,
+    'modules': len(sys.modules),
+    'heavy': [m for m in {heavy!r} if m in sys.modules],
+}}))
+"""
+
+IMPORTTIME_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def run_once(touch):
+    code = CHILD.format(base_dir=BASE_DIR, touch=touch, heavy=HEAVY_MODULES)
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True, cwd=BASE_DIR)
+    if proc.returncode != 0:
+        sys.exit(f"Startup failed:\n{proc.stderr[-3000:]}")
+
+    # Total = outermost imports only; per package = cumulative time of the
+    # package's own import line (includes whatever it imported first)
+    total_us = 0
+    packages = {}
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_RE.match(line)
+        if not match:
+            continue
+        cumulative_us, indent, module = int(match.group(2)), len(match.group(3)), match.group(4)
+        if indent == 1:
+            total_us += cumulative_us
+        if '.' not in module:
+            packages[module] = max(packages.get(module, 0), cumulative_us)
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['import_ms'] = total_us / 1000
+    result['packages_ms'] = {k: v / 1000 for k, v in packages.items()}
+    return result
+
+
+def measure(runs, touch):
+    samples = [run_once(touch) for _ in range(runs)]
+    packages = {}
+    for sample in samples:
+        for name, ms in sample['packages_ms'].items():
+            packages.setdefault(name, []).append(ms)
+    return {
+        'runs': runs,
+        'touch': touch,
+        'wall_ms': round(statistics.median(s['wall_ms'] for s in samples), 1),
+        'import_ms': round(statistics.median(s['import_ms'] for s in samples), 1),
+        'rss_mb': round(statistics.median(s['rss_kb'] for s in samples) / 1024, 1),
+        'modules': samples[-1]['modules'],
+        'heavy_modules': samples[-1]['heavy'],
+        'packages_ms': {k: round(statistics.median(v), 1) for k, v in sorted(packages.items(), key=lambda kv: -statistics.median(kv[1]))},
+    }
+
+
+def print_report(result, top, baseline=None):
+    def delta(key):
+        if not baseline or key not in baseline:
+            return ''
+        diff = result[key] - baseline[key]
+        return f"  ({diff:+.1f}, was {baseline[key]})"
+
+    print(f"Worker startup (median of {result['runs']} runs{', touching ' + ', '.join(result['touch']) if result['touch'] else ''})")
+    print(f"  wall time to loaded app : {result['wall_ms']} ms{delta('wall_ms')}")
+    print(f"  import time (-X importtime): {result['import_ms']} ms{delta('import_ms')}")
+    print(f"  RSS                     : {result['rss_mb']} MB{delta('rss_mb')}")
+    print(f"  modules loaded          : {result['modules']}{delta('modules')}")
+    print(f"  heavy libraries loaded  : {', '.join(result['heavy_modules']) or 'none'}")
+    if baseline:
+        print(f"                     was : {', '.join(baseline.get('heavy_modules', [])) or 'none'}")
+    print("\nSlowest packages (cumulative, includes what they import):")
+    for name, ms in list(result['packages_ms'].items())[:top]:
+        print(f"  {ms:>9.1f} ms  {name}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure per-worker import time and memory.')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='How many packages to list')
+    parser.add_argument('--touch', action='append', default=[], help='Also import this module after startup (repeatable)')
+    parser.add_argument('--output', help='Save the result as JSON')
+    parser.add_argument('--compare', help='Previous --output file to diff against')
+    args = parser.parse_args()
+
+    result = measure(args.runs, args.touch)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(result, args.top, baseline)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"\nSaved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -4,11 +4,9 @@ import string
 import smtplib # keeping raw smtplib or use django.core.mail? Django is better.
 from datetime import date, datetime
 import os
-from django.core.mail import send_mail
-from django.conf import settings
 import json
-from google.oauth2 import service_account
-import gspread
+# google.oauth2 / gspread are imported where used: they add ~250 ms and
+# several MB to every worker start and only the Sheets logging needs them
 
 # Load allowed users from env or define here
 # In .env: allowed_users = ["..."]
@@ -16,6 +14,7 @@ import gspread
 
 def get_credentials():
     # Helper to get Google Sheet credentials if needed (as per original file)
+    from google.oauth2 import service_account
     scope = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
     
     # Try to load from env var
@@ -45,38 +44,33 @@ def generate_otp():
     return ''.join(random.choices(string.digits, k=6))
 
 def send_otp_email(receiver_email, otp_code):
+    """
+    Queues the OTP mail in the outbox; the run_outbox worker delivers it
+    (normally within OUTBOX_POLL_INTERVAL seconds). Returns False only if
+    the message could not be stored.
+    """
+    from utils.outbox import OutboxService
+
     subject = "รหัสยืนยันตัวตน (OTP) - JST Hybrid System"
     body = f"รหัสเข้าใช้งานของคุณคือ: {otp_code}\n\n(รหัสนี้ใช้สำหรับการเข้าสู่ระบบครั้งนี้เท่านั้น)"
     
     try:
-        send_mail(
-            subject,
-            body,
-            settings.EMAIL_HOST_USER,
-            [receiver_email],
-            fail_silently=False,
-        )
+        OutboxService.enqueue_email(receiver_email, subject, body)
         return True
     except Exception as e:
         print(f"❌ ส่งอีเมลไม่สำเร็จ: {e}")
         return False
 
-MASTER_SHEET_ID = os.getenv("MASTER_SHEET_ID", "YOUR_SHEET_ID_HERE") # Need to confirm if this is needed
-
-def log_login_activity(email):
-    try:
-        creds = get_credentials()
-        if not creds:
-             print("No GCP credentials found for logging.")
-             return
+def append_login_activity(sheet_id, rows):
+    """
+    Appends login activity rows [time, email, event, ip, user agent] to the
+    first worksheet in one API call. Called in batches by the outbox worker,
+    never during a request. Raises on any API/credential error.
+    """
+    creds = get_credentials()
+    if not creds:
+        raise RuntimeError("No GCP credentials found for login activity logging")
 
-        gc = gspread.authorize(creds)
-        # Assuming MASTER_SHEET_ID is known or handled. 
-        # If not provided, this will fail.
-        # But we catch exception.
-        
-        # sh = gc.open_by_key(MASTER_SHEET_ID) 
-        # Keeping logic commented or safe until MASTER_SHEET_ID is confirmed
-        pass 
-    except Exception as e:
-        print(f"Login Log Error: {e}")
+    import gspread
+    gc = gspread.authorize(creds)
+    gc.open_by_key(sheet_id).sheet1.append_rows(rows, value_input_option='RAW')
@@ -0,0 +1,327 @@
+from contextlib import ExitStack
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.db.models import F, Max
+from django.test import Client, override_settings
+from django.urls import reverse
+from inventory.models import MasterItem, POHeader, POItem, ReceivedPOItem, Sale
+from utils.forecasting import ForecastService
+from utils.leadtimes import LeadTimeService
+from utils.importers import ImportService
+from utils.query_tracking import QueryTracker
+from utils.scale_data import ScaleDataGenerator
+from utils.stock_calculator import StockService
+from utils.whatif import WhatIfService
+import django
+import json
+import logging
+import os
+import platform
+import statistics
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# Metrics compared against the baseline: name -> noise floor (absolute
+# difference below which a change never counts as a regression)
+COMPARED_METRICS = {
+    'wall_ms': 5.0,
+    'queries': 0,
+    'peak_kb': 256.0,
+}
+
+IMPORT_ROWS = (10_000, 100_000)
+
+# Private cache per run: views start cold, signals don't bump the shared counters
+BENCHMARK_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}}
+
+
+class Rollback(Exception):
+    pass
+
+
+class BenchmarkCase:
+    """
+    One measured operation. `func(ctx)` runs inside a transaction that is
+    rolled back, so cases never change the database and can repeat.
+    `setup(ctx)` runs before each repetition and is not measured.
+    Heavy cases (imports) run once regardless of --repeat.
+    """
+
+    def __init__(self, name, group, func, setup=None, heavy=False):
+        self.name = name
+        self.group = group
+        self.func = func
+        self.setup = setup
+        self.heavy = heavy
+
+
+class BenchmarkRunner:
+    """
+    Runs BenchmarkCases at one or more data scales and records wall time
+    (median of --repeat runs), query count and peak Python allocation.
+
+    Scale 'current' uses whatever is in the database. Numeric scales load a
+    ScaleDataGenerator dataset inside a transaction that is rolled back
+    after that scale's cases, so the local database is left as it was.
+    """
+
+    def __init__(self, repeat=3, memory=True, work_dir=None, log=None):
+        self.repeat = max(repeat, 1)
+        self.memory = memory
+        self.work_dir = str(work_dir or os.path.join(settings.BASE_DIR, 'benchmarks'))
+        self.log = log or logger.info
+        self.cases = self.build_cases()
+
+    # --- Cases ---
+
+    def build_cases(self):
+        cases = []
+        for rows in IMPORT_ROWS:
+            label = f"{rows // 1000}k"
+            cases.append(BenchmarkCase(f"import_sales_{label}", 'import', self.importer('shopee_sales', ImportService.import_sales_data, rows), heavy=True))
+        cases += [
+            BenchmarkCase('import_master_items', 'import', self.importer('master_items', ImportService.import_master_items, IMPORT_ROWS[0]), heavy=True),
+            BenchmarkCase('import_stock_jst', 'import', self.importer('jst_stock', ImportService.import_stock_jst, IMPORT_ROWS[0]), heavy=True),
+            BenchmarkCase('stock_service_200', 'service', self.bench_stock_service),
+            BenchmarkCase('po_prorate_costs_50', 'service', self.bench_prorate_costs),
+            BenchmarkCase('po_update_status_200', 'service', self.bench_update_status),
+            BenchmarkCase('receive_items_50', 'service', self.bench_receiving),
+            BenchmarkCase('whatif_36_scenarios', 'service', self.bench_whatif),
+            BenchmarkCase('forecast_all_skus', 'service', self.bench_forecast),
+            BenchmarkCase('rebuild_lead_times', 'service', self.bench_lead_times),
+        ]
+        for name, url_name, params in (
+            ('po_list', 'po_list', {}),
+            ('daily_sales_30d', 'sales_summary', 'last_30_days'),
+            ('stock_report', 'stock_report', {}),
+        ):
+            cases.append(BenchmarkCase(f"view_{name}_cold", 'view', self.view_request(url_name, params), setup=self.clear_cache))
+            cases.append(BenchmarkCase(f"view_{name}_warm", 'view', self.view_request(url_name, params), setup=self.view_request(url_name, params)))
+        return cases
+
+    def select_cases(self, names=None):
+        """
+        `names`: case names or groups (import, service, view); None = all.
+        """
+        if not names:
+            return list(self.cases)
+        selected = [c for c in self.cases if c.name in names or c.group in names]
+        unknown = set(names) - {c.name for c in self.cases} - {c.group for c in self.cases}
+        if unknown:
+            raise ValueError(f"Unknown benchmark cases: {', '.join(sorted(unknown))}")
+        return selected
+
+    def importer(self, file_name, import_func, rows):
+        def run(ctx):
+            path = self.import_file(ctx['scale'], file_name, rows)
+            with open(path, 'rb') as f:
+                result = import_func(f)
+            if result.get('errors'):
+                logger.warning(f"Benchmark import {file_name}: {result['errors'][:3]}")
+        return run
+
+    def import_file(self, scale, file_name, rows):
+        """
+        Importer input files are generated once per (scale, rows) and reused.
+        """
+        directory = os.path.join(self.work_dir, 'files', f"scale-{scale or 'current'}-rows-{rows}")
+        path = os.path.join(directory, f"{file_name}.xlsx")
+        if not os.path.exists(path):
+            self.log(f"Writing importer files to {directory}...")
+            ScaleDataGenerator(scale=scale or 1.0, log=self.log).export_files(directory, rows=rows)
+        return path
+
+    @staticmethod
+    def bench_stock_service(ctx):
+        for sku in MasterItem.objects.order_by('product_code').values_list('product_code', flat=True)[:200]:
+            StockService.calculate_stock(sku)
+
+    @staticmethod
+    def bench_prorate_costs(ctx):
+        headers = POHeader.objects.filter(yuan_mode='top-down', total_yuan__gt=0).order_by('-id')[:50]
+        for header in headers:
+            header.prorate_costs()
+
+    @staticmethod
+    def bench_update_status(ctx):
+        for header in POHeader.objects.order_by('-id')[:200]:
+            # Force the write path as well
+            header.status = ''
+            header.update_status()
+
+    @staticmethod
+    def bench_receiving(ctx):
+        items = POItem.objects.filter(total_received_qty__lt=F('qty_ordered')).order_by('-id')[:50]
+        today = datetime.now().date()
+        for item in items:
+            ReceivedPOItem.objects.create(po_item=item, received_qty=1, received_date=today)
+
+    @staticmethod
+    def bench_whatif(ctx):
+        # 6 exchange x 6 freight rates over all open PO lines
+        WhatIfService.simulate(WhatIfService.scenarios(
+            [4.6 + 0.1 * i for i in range(6)], [3000 + 500 * i for i in range(6)], 'SHIP'))
+
+    @staticmethod
+    def bench_forecast(ctx):
+        # Load + compute for the whole catalogue, single process (nothing saved)
+        ForecastService.compute(ForecastService.load())
+
+    @staticmethod
+    def bench_lead_times(ctx):
+        # Every LeadTimeStat row from all received PO lines
+        LeadTimeService.rebuild()
+
+    @staticmethod
+    def clear_cache(ctx):
+        cache.clear()
+
+    @staticmethod
+    def view_request(url_name, params):
+        def run(ctx):
+            query = params
+            if query == 'last_30_days':
+                end = ctx['last_sale_date']
+                query = {'start_date': f"{end - timedelta(days=29):%Y-%m-%d}", 'end_date': f"{end:%Y-%m-%d}"}
+            response = ctx['client'].get(reverse(url_name), query)
+            if response.status_code != 200:
+                raise RuntimeError(f"{url_name} returned {response.status_code}")
+        return run
+
+    # --- Measuring ---
+
+    @staticmethod
+    def _in_rollback(func, ctx):
+        try:
+            with transaction.atomic():
+                func(ctx)
+                raise Rollback()
+        except Rollback:
+            pass
+
+    def measure(self, case, ctx):
+        def run(ctx):
+            if case.setup:
+                case.setup(ctx)
+            tracker = QueryTracker()
+            with ExitStack() as stack:
+                for conn in connections.all():
+                    stack.enter_context(conn.execute_wrapper(tracker))
+                start = time.perf_counter()
+                case.func(ctx)
+                timings.append((time.perf_counter() - start) * 1000)
+            query_counts.append(tracker.count)
+
+        timings = []
+        query_counts = []
+        for _ in range(1 if case.heavy else self.repeat):
+            self._in_rollback(run, ctx)
+
+        result = {
+            'scale': ctx['scale'] or 'current',
+            'case': case.name,
+            'group': case.group,
+            'runs': len(timings),
+            'wall_ms': round(statistics.median(timings), 2),
+            'wall_ms_min': round(min(timings), 2),
+            'queries': max(query_counts),
+        }
+
+        if self.memory:
+            # Separate pass: tracemalloc would distort the timings above
+            def traced(ctx):
+                if case.setup:
+                    case.setup(ctx)
+                tracemalloc.start()
+                try:
+                    case.func(ctx)
+                    peak = tracemalloc.get_traced_memory()[1]
+                finally:
+                    tracemalloc.stop()
+                result['peak_kb'] = round(peak / 1024, 1)
+            self._in_rollback(traced, ctx)
+        return result
+
+    def run_scale(self, scale, cases):
+        results = []
+        with override_settings(CACHES=BENCHMARK_CACHES, ALLOWED_HOSTS=['*']):
+            try:
+                with transaction.atomic():
+                    if scale is not None:
+                        self.log(f"Loading scale {scale} dataset (rolled back afterwards)...")
+                        ScaleDataGenerator.clear()
+                        ScaleDataGenerator(scale=scale, log=lambda msg: None).generate()
+
+                    user = User.objects.create_user(username=f"benchmark-{os.getpid()}", is_staff=True)
+                    client = Client()
+                    client.force_login(user)
+                    ctx = {
+                        'scale': scale,
+                        'client': client,
+                        'last_sale_date': Sale.objects.aggregate(d=Max('date'))['d'] or datetime.now().date(),
+                    }
+                    for case in cases:
+                        result = self.measure(case, ctx)
+                        self.log(f"[scale {result['scale']}] {case.name}: {result['wall_ms']} ms, "
+                                 f"{result['queries']} queries, peak {result.get('peak_kb', '-')} KB")
+                        results.append(result)
+                    raise Rollback()
+            except Rollback:
+                pass
+        return results
+
+    def run(self, scales, case_names=None):
+        cases = self.select_cases(case_names)
+        results = []
+        for scale in scales:
+            results += self.run_scale(scale, cases)
+        return {
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'host': platform.node(),
+                'repeat': self.repeat,
+            },
+            'results': {f"{r['scale']}/{r['case']}": r for r in results},
+        }
+
+
+def save_results(data, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+
+def load_results(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare_results(current, baseline, max_regression=0.2):
+    """
+    Returns a list of regressions: a metric more than `max_regression`
+    (0.2 = 20%) above the baseline and beyond its noise floor. Cases
+    missing from either side are ignored.
+    """
+    regressions = []
+    for key, result in current['results'].items():
+        base = baseline.get('results', {}).get(key)
+        if not base:
+            continue
+        for metric, noise_floor in COMPARED_METRICS.items():
+            if metric not in result or metric not in base:
+                continue
+            new, old = result[metric], base[metric]
+            if new - old <= noise_floor:
+                continue
+            if new > old * (1 + max_regression):
+                change = f"+{(new / old - 1) * 100:.0f}%" if old else "new"
+                regressions.append(f"{key} {metric}: {old} -> {new} ({change})")
+    return regressions
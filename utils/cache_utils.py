@@ -0,0 +1,252 @@
+from django.core.cache import cache
+from django.conf import settings
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+from datetime import date
+from urllib.parse import urlencode
+from utils.db_routing import replica_enabled, use_replica
+import hashlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CacheService:
+    """
+    Shared cache for reference data and report fragments.
+
+    Every cached value is keyed on the version counters of the models it
+    depends on. Signals bump a model's counter on write, so all gunicorn
+    workers see the new key at the same time and the old entries simply
+    expire. Nothing is ever deleted explicitly.
+    """
+
+    VERSION_PREFIX = "ver"
+    STATS_PREFIX = "stats"
+    STATS_NAMES_KEY = "stats:names"
+
+    # Models whose writes invalidate cached data
+    TRACKED_MODELS = ('MasterItem', 'POHeader', 'POItem', 'ReceivedPOItem', 'Sale', 'SaleDailyRollup', 'SkuForecast', 'LeadTimeStat')
+
+    DEFAULT_TIMEOUT = 60 * 60 * 6  # 6 hours, versions take care of freshness
+
+    @staticmethod
+    def _version_key(model_name):
+        return f"{CacheService.VERSION_PREFIX}:{model_name}"
+
+    @staticmethod
+    def get_versions(*model_names):
+        """
+        Returns a tuple of version numbers, one per model (in order).
+        Missing counters are initialised from the clock.
+        """
+        keys = [CacheService._version_key(m) for m in model_names]
+        try:
+            found = cache.get_many(keys)
+        except Exception as e:
+            logger.error(f"Cache read failed for versions {model_names}: {e}")
+            return tuple(0 for _ in model_names)
+
+        versions = []
+        for key in keys:
+            v = found.get(key)
+            if v is None:
+                # add() keeps a counter another worker may have just created
+                cache.add(key, CacheService._initial_version(), timeout=None)
+                v = cache.get(key, 0)
+            versions.append(v)
+        return tuple(versions)
+
+    @staticmethod
+    def _initial_version():
+        # Start from a timestamp, not 1: if a counter is evicted or the cache
+        # is cleared, the new counter can't collide with old (stale) keys.
+        return int(time.time() * 1000)
+
+    @staticmethod
+    def bump_version(*model_names):
+        """
+        Invalidates everything that depends on the given models.
+        """
+        for model_name in model_names:
+            key = CacheService._version_key(model_name)
+            try:
+                cache.incr(key)
+            except ValueError:
+                # Counter not created yet (or evicted)
+                cache.add(key, CacheService._initial_version(), timeout=None)
+            except Exception as e:
+                logger.error(f"Cache version bump failed for {model_name}: {e}")
+
+    @staticmethod
+    def make_key(name, depends_on, *parts):
+        """
+        Builds a cache key from a logical name, the versions of the models
+        it depends on and any extra parts (filters etc.).
+        """
+        versions = CacheService.get_versions(*depends_on)
+        raw = "|".join(str(p) for p in parts)
+        digest = hashlib.md5(raw.encode()).hexdigest() if raw else "all"
+        version_str = ".".join(str(v) for v in versions)
+        return f"data:{name}:{version_str}:{digest}"
+
+    @staticmethod
+    def get_or_set(name, depends_on, compute, *parts, timeout=None):
+        """
+        Returns the cached value for (name, parts) or computes and stores it.
+        `compute` is only called on a miss.
+        """
+        key = CacheService.make_key(name, depends_on, *parts)
+        sentinel = object()
+        try:
+            value = cache.get(key, sentinel)
+        except Exception as e:
+            logger.error(f"Cache read failed for {name}: {e}")
+            return compute()
+
+        if value is not sentinel:
+            CacheService._record(name, hit=True)
+            return value
+
+        CacheService._record(name, hit=False)
+        # The key carries versions the primary already bumped; a lagging
+        # replica would store pre-write data under it for every user
+        with use_replica(False):
+            value = compute()
+        try:
+            cache.set(key, value, timeout or CacheService.DEFAULT_TIMEOUT)
+        except Exception as e:
+            logger.error(f"Cache write failed for {name}: {e}")
+        return value
+
+    @staticmethod
+    def _record(name, hit):
+        """
+        Hit/miss counters live in the cache itself so they are shared by all workers.
+        """
+        kind = "hit" if hit else "miss"
+        key = f"{CacheService.STATS_PREFIX}:{kind}:{name}"
+        try:
+            try:
+                cache.incr(key)
+            except ValueError:
+                if not cache.add(key, 1, timeout=None):
+                    cache.incr(key)
+                names = cache.get(CacheService.STATS_NAMES_KEY) or []
+                if name not in names:
+                    cache.set(CacheService.STATS_NAMES_KEY, names + [name], timeout=None)
+        except Exception:
+            # Stats must never break a request
+            pass
+
+    @staticmethod
+    def stats():
+        """
+        Returns hit/miss counters per cached name plus totals.
+        """
+        names = cache.get(CacheService.STATS_NAMES_KEY) or []
+        keys = []
+        for name in names:
+            keys.append(f"{CacheService.STATS_PREFIX}:hit:{name}")
+            keys.append(f"{CacheService.STATS_PREFIX}:miss:{name}")
+        values = cache.get_many(keys) if keys else {}
+
+        per_name = {}
+        total_hits = 0
+        total_misses = 0
+        for name in sorted(names):
+            hits = values.get(f"{CacheService.STATS_PREFIX}:hit:{name}", 0)
+            misses = values.get(f"{CacheService.STATS_PREFIX}:miss:{name}", 0)
+            total = hits + misses
+            per_name[name] = {
+                'hits': hits,
+                'misses': misses,
+                'hit_ratio': round(hits / total, 4) if total else 0,
+            }
+            total_hits += hits
+            total_misses += misses
+
+        grand_total = total_hits + total_misses
+        return {
+            'hits': total_hits,
+            'misses': total_misses,
+            'hit_ratio': round(total_hits / grand_total, 4) if grand_total else 0,
+            'names': per_name,
+            'versions': dict(zip(CacheService.TRACKED_MODELS, CacheService.get_versions(*CacheService.TRACKED_MODELS))),
+        }
+
+    @staticmethod
+    def reset_stats():
+        names = cache.get(CacheService.STATS_NAMES_KEY) or []
+        keys = [f"{CacheService.STATS_PREFIX}:{kind}:{name}" for name in names for kind in ('hit', 'miss')]
+        cache.delete_many(keys + [CacheService.STATS_NAMES_KEY])
+
+    @staticmethod
+    def request_etag(request, depends_on, *parts):
+        """
+        Cheap data version for a page: model versions + filters + viewer.
+        Returns None (no conditional handling) when a 304 would be wrong,
+        e.g. a flash message is waiting to be shown.
+        """
+        if request.method not in ('GET', 'HEAD'):
+            return None
+
+        from django.contrib.messages import get_messages
+        if len(get_messages(request)):
+            return None
+
+        versions = CacheService.get_versions(*depends_on)
+        raw = "|".join([
+            request.path,
+            urlencode(sorted(request.GET.lists()), doseq=True),
+            str(request.user.pk),
+            # Pages embed the CSRF token, a rotated cookie must re-render
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''),
+            # Statuses and default date ranges depend on today
+            date.today().isoformat(),
+            ".".join(str(v) for v in versions),
+        ] + [str(p) for p in parts])
+        return hashlib.md5(raw.encode()).hexdigest()
+
+    # --- Shared reference data ---
+
+    @staticmethod
+    def get_categories():
+        """
+        Distinct product categories for the filter dropdowns.
+        """
+        from inventory.models import MasterItem
+
+        def compute():
+            return list(MasterItem.objects.values_list('category', flat=True).distinct().order_by('category'))
+
+        return CacheService.get_or_set('categories', ('MasterItem',), compute)
+
+
+def versioned_etag(*depends_on, extra=None):
+    """
+    View decorator: answer 304 Not Modified when none of `depends_on`
+    changed since the client's last load. `extra(request)` can add state
+    that is not in the URL (e.g. filters persisted in the session).
+    Put it below @login_required so anonymous users are redirected first.
+    """
+    def decorator(view_func):
+        reads_replica = getattr(view_func, 'reads_replica', False)
+
+        def etag_func(request, *args, **kwargs):
+            # A page read from a lagging replica can predate the versions
+            # in the tag: no ETag, so no 304 can keep serving it
+            if reads_replica and replica_enabled(request):
+                return None
+            parts = [args, sorted(kwargs.items())]
+            if extra:
+                parts.append(extra(request))
+            return CacheService.request_etag(request, depends_on, *parts)
+
+        view_func = condition(etag_func=etag_func)(view_func)
+        # Browsers must revalidate, shared proxies must not store per-user pages
+        return cache_control(private=True, no_cache=True)(view_func)
+
+    return decorator
+
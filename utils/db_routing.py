@@ -0,0 +1,92 @@
+from contextlib import contextmanager
+from functools import wraps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+import threading
+import time
+
+REPLICA_ALIAS = 'replica'
+# Set by ReplicaStickyMiddleware after a write: unix time until which this
+# browser reads from the primary
+STICKY_COOKIE = 'jst_primary_until'
+
+_local = threading.local()
+
+
+def replica_configured():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+
+
+def is_sticky(request):
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def replica_enabled(request):
+    """
+    Whether a @read_replica view reads this request from the replica.
+    """
+    return request.method in ('GET', 'HEAD') and replica_configured() and not is_sticky(request)
+
+
+@contextmanager
+def use_replica(enabled=True):
+    previous = getattr(_local, 'use_replica', False), getattr(_local, 'atomic_depth', 0)
+    _local.use_replica = enabled
+    # Transactions opened from here on pin reads to the primary
+    _local.atomic_depth = len(connections[DEFAULT_DB_ALIAS].atomic_blocks)
+    try:
+        yield
+    finally:
+        _local.use_replica, _local.atomic_depth = previous
+
+
+def read_replica(view_func):
+    """
+    View decorator for read-heavy pages: GET/HEAD queries go to the replica,
+    unless this browser saved something in the last REPLICA_STICKY_SECONDS.
+    No-op when no 'replica' database is configured. Put it right above the
+    view function (below @login_required / @versioned_etag).
+    """
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        with use_replica(replica_enabled(request)):
+            return view_func(request, *args, **kwargs)
+    # Seen by @versioned_etag above it: no ETag on pages rendered from the replica
+    wrapper.reads_replica = True
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Everything stays on the primary except reads inside @read_replica views.
+    Even there a read goes to the primary when it runs inside a transaction
+    (select_for_update, atomic blocks) or after the request wrote anything,
+    so a view always sees its own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if not getattr(_local, 'use_replica', False):
+            return None
+        if len(connections[DEFAULT_DB_ALIAS].atomic_blocks) > getattr(_local, 'atomic_depth', 0):
+            return None
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        # e.g. po_list refreshing PO statuses: later reads must see the result
+        _local.use_replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Same data on both aliases
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication
+        return db != REPLICA_ALIAS
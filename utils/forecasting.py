@@ -0,0 +1,203 @@
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+from inventory.models import MasterItem, SaleDailyRollup, SkuForecast
+from utils.cache_utils import CacheService
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DAYS = 730
+HORIZON_DAYS = 30
+SEASON = 7  # weekday pattern
+ALPHA = 0.2  # level smoothing
+GAMMA = 0.1  # weekday pattern smoothing
+CROSTON_ALPHA = 0.1
+# Average days between sales above which demand counts as intermittent (Syntetos-Boylan)
+INTERMITTENT_ADI = 1.32
+WARMUP_DAYS = 7  # a SKU's first days are not scored in the variance
+POOL_MIN_SKUS = 20000  # below this a process pool costs more than it saves
+BATCH_SIZE = 1000
+
+METHODS = (SkuForecast.METHOD_NONE, SkuForecast.METHOD_SEASONAL, SkuForecast.METHOD_CROSTON)
+
+
+def forecast_matrix(sales, first, first_weekday):
+    """
+    Forecasts every row of `sales` (SKUs x days) at once; numpy in and out
+    only, so it can run in a worker process. A row's history starts at its
+    first sale, column `first` (the number of days when it never sold).
+    first_weekday is the weekday of column 0.
+
+    Smooth demand: exponential smoothing of the level plus an additive
+    weekday pattern. Intermittent demand: Croston with the SBA correction.
+    Both run over all rows; each row keeps the one its sales call for.
+    Variance is the mean squared one-day-ahead error of that model.
+    """
+    import numpy as np
+
+    n, days = sales.shape
+    rows = np.arange(n)
+    history = days - first
+    sale_days = (sales > 0).sum(axis=1)
+    adi = history / np.maximum(sale_days, 1)
+    intermittent = adi > INTERMITTENT_ADI
+
+    # Starting level: mean of the first four weeks after the first sale
+    level = np.zeros(n)
+    for offset in range(4 * SEASON):
+        col = first + offset
+        inside = col < days
+        level[inside] += sales[rows[inside], col[inside]]
+    level /= np.maximum(np.minimum(history, 4 * SEASON), 1)
+    season = np.zeros((n, SEASON))
+    # Croston: smoothed sale size and days between sales
+    size = sales.sum(axis=1) / np.maximum(sale_days, 1)
+    interval = np.maximum(adi, 1.0)
+    since_sale = np.zeros(n)
+    sba = 1 - CROSTON_ALPHA / 2
+
+    sse_seasonal = np.zeros(n)
+    sse_croston = np.zeros(n)
+    scored_days = np.zeros(n)
+    for t in range(int(first.min()) if n else days, days):
+        y = sales[:, t]
+        active = first <= t
+        d = (first_weekday + t) % SEASON
+
+        scored = active & (first + WARMUP_DAYS <= t)
+        sse_seasonal += np.where(scored, (y - np.maximum(level + season[:, d], 0)) ** 2, 0)
+        sse_croston += np.where(scored, (y - sba * size / interval) ** 2, 0)
+        scored_days += scored
+
+        new_level = ALPHA * (y - season[:, d]) + (1 - ALPHA) * level
+        season[:, d] = np.where(active, GAMMA * (y - new_level) + (1 - GAMMA) * season[:, d], season[:, d])
+        level = np.where(active, new_level, level)
+
+        since_sale += active
+        sold = active & (y > 0)
+        size = np.where(sold, size + CROSTON_ALPHA * (y - size), size)
+        interval = np.where(sold, interval + CROSTON_ALPHA * (since_sale - interval), interval)
+        since_sale[sold] = 0
+
+    weekdays = (first_weekday + days + np.arange(HORIZON_DAYS)) % SEASON
+    seasonal_horizon = np.maximum(level[:, None] + season[:, weekdays], 0).sum(axis=1)
+    croston_daily = sba * size / interval
+    sold_ever = sale_days > 0
+    daily = np.where(sold_ever, np.where(intermittent, croston_daily, seasonal_horizon / HORIZON_DAYS), 0.0)
+    variance = np.where(intermittent, sse_croston, sse_seasonal) / np.maximum(scored_days, 1)
+    return {
+        'method': np.where(sold_ever, np.where(intermittent, 2, 1), 0),
+        'daily': daily,
+        'horizon': np.where(intermittent, croston_daily * HORIZON_DAYS, seasonal_horizon) * sold_ever,
+        'variance': variance * sold_ever,
+        'history_days': history,
+        'sale_days': sale_days,
+    }
+
+
+class ForecastService:
+    """
+    Nightly demand forecast of every SKU (manage.py update_forecasts).
+    Daily sales come from SaleDailyRollup as one dense SKU x day matrix
+    (one query); forecast_matrix() runs over all SKUs at once, split over
+    a process pool for big catalogues. Results replace SkuForecast.
+    """
+
+    @staticmethod
+    def load(end_date=None, history_days=HISTORY_DAYS):
+        """
+        Sales matrix of the `history_days` days up to end_date (yesterday
+        by default: today is not over yet), one row per SKU. Two queries.
+        """
+        import numpy as np
+
+        end_date = end_date or date.today() - timedelta(days=1)
+        start_date = end_date - timedelta(days=history_days - 1)
+        skus = list(MasterItem.objects.order_by('product_code').values_list('product_code', 'current_stock'))
+        index = {sku: i for i, (sku, _) in enumerate(skus)}
+
+        sales = np.zeros((len(skus), history_days))
+        daily = (
+            SaleDailyRollup.objects.filter(date__range=(start_date, end_date)).order_by()
+            .values('sku_id', 'date').annotate(total=Sum('qty')).values_list('sku_id', 'date', 'total')
+        )
+        cells = [(index[sku], (day - start_date).days, qty) for sku, day, qty in daily.iterator() if sku in index]
+        if cells:
+            row, col, qty = zip(*cells)
+            sales[list(row), list(col)] = qty
+        # Returns count as no demand
+        np.maximum(sales, 0, out=sales)
+        sold = sales > 0
+        first = np.where(sold.any(axis=1), sold.argmax(axis=1), history_days)
+
+        return {
+            'skus': [sku for sku, _ in skus],
+            'stock': np.array([stock or 0 for _, stock in skus], dtype=np.float64),
+            'sales': sales,
+            'first': first,
+            'first_weekday': start_date.weekday(),
+        }
+
+    @staticmethod
+    def compute(data, workers=1):
+        """
+        forecast_matrix() over all SKUs; chunks of rows in a process pool
+        when workers > 1 and the catalogue is big enough to pay for it.
+        """
+        import numpy as np
+
+        sales, first = data['sales'], data['first']
+        if workers <= 1 or len(sales) < POOL_MIN_SKUS:
+            return forecast_matrix(sales, first, data['first_weekday'])
+
+        bounds = np.linspace(0, len(sales), workers + 1, dtype=int)
+        chunks = [(sales[a:b], first[a:b], data['first_weekday']) for a, b in zip(bounds, bounds[1:]) if b > a]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parts = list(pool.map(forecast_matrix, *zip(*chunks)))
+        return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+    @staticmethod
+    def save(data, result):
+        """
+        Replaces all SkuForecast rows in one transaction. Days of cover is
+        stock on hand over the daily forecast (None without demand).
+        """
+        now = timezone.now()
+        forecasts = []
+        for i, sku in enumerate(data['skus']):
+            daily = float(result['daily'][i])
+            forecasts.append(SkuForecast(
+                sku_id=sku,
+                method=METHODS[result['method'][i]],
+                daily_demand=round(daily, 4),
+                horizon_demand=round(float(result['horizon'][i]), 2),
+                variance=round(float(result['variance'][i]), 4),
+                days_of_cover=round(float(max(data['stock'][i], 0)) / daily, 1) if daily > 0 else None,
+                history_days=int(result['history_days'][i]),
+                sale_days=int(result['sale_days'][i]),
+                computed_at=now,
+            ))
+        with transaction.atomic():
+            SkuForecast.objects.all().delete()
+            SkuForecast.objects.bulk_create(forecasts, batch_size=BATCH_SIZE)
+        # bulk_create skips signals
+        CacheService.bump_version('SkuForecast')
+        return len(forecasts)
+
+    @staticmethod
+    def run(workers=1, end_date=None, history_days=HISTORY_DAYS):
+        started = time.perf_counter()
+        data = ForecastService.load(end_date, history_days)
+        loaded = time.perf_counter()
+        result = ForecastService.compute(data, workers)
+        computed = time.perf_counter()
+        saved = ForecastService.save(data, result)
+        logger.info(
+            f"Forecasts: {saved} SKUs x {history_days} days - load {loaded - started:.2f}s, "
+            f"compute {computed - loaded:.2f}s, save {time.perf_counter() - computed:.2f}s"
+        )
+        return saved
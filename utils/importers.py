@@ -3,8 +3,12 @@ import requests
 import os
 from django.core.files.base import ContentFile
 from django.conf import settings
-from inventory.models import MasterItem, Sale, POHeader, POItem, JSTStockSnapshot, ReceivedPOItem
+from inventory.models import MasterItem, Sale, POHeader, POItem, JSTStockSnapshot, ReceivedPOItem, SkuValuation, deferred_sale_signals
 from datetime import datetime
+from utils.cache_utils import CacheService
+from utils.metrics import ImportPhaseTimer
+from utils.partitions import SalePartitionService
+from utils.valuation import ValuationService
 import logging
 
 logger = logging.getLogger(__name__)
@@ -30,8 +34,10 @@ class ImportService:
 
     @staticmethod
     def import_master_items(file):
+        phases = ImportPhaseTimer('master')
         df = pd.read_excel(file)
         df = ImportService.clean_header(df)
+        phases.mark('read')
         logger.info(f"Starting import_master_items. Rows found: {len(df)}")
         
         # Mapping: 'รหัสสินค้า': product_code, 'ชื่อสินค้า': name, 'รูปภาพ': image
@@ -83,13 +89,16 @@ class ImportService:
                 logger.error(f"Error processing row {index}: {e}", exc_info=True)
                 results["errors"].append(f"Row {index}: {e}")
         
+        phases.mark('write')
         logger.info(f"Import finished. Results: {results}")
         return results
 
     @staticmethod
     def import_sales_data(file):
+        phases = ImportPhaseTimer('sales')
         df = pd.read_excel(file)
         df = ImportService.clean_header(df)
+        phases.mark('read')
         
         results = {"success": 0, "failed": 0, "errors": []}
 
@@ -175,68 +184,90 @@ class ImportService:
         }
         
         df_grouped = df_clean.groupby(['order_id', 'sku_code'], as_index=False).agg(agg_rules)
+        # Sale is partitioned by month on Postgres: months in this file must exist first
+        SalePartitionService.ensure_for_dates(pd.to_datetime(df_grouped['date'], errors='coerce').dropna().dt.date)
+        phases.mark('parse')
 
-        # Import Phase
-        for index, row in df_grouped.iterrows():
-            try:
-                order_id = row['order_id']
-                sku_code = row['sku_code']
+        # Import Phase. The per-row Sale signals would UPDATE the SKU's
+        # valuation and bump the 'Sale' cache version for every row: each
+        # SKU is marked once from its earliest date instead, after the loop
+        dirty_from = {}
+        try:
+            with deferred_sale_signals():
+                for index, row in df_grouped.iterrows():
+                    try:
+                        order_id = row['order_id']
+                        sku_code = row['sku_code']
                 
-                if not order_id or not sku_code: continue
+                        if not order_id or not sku_code: continue
 
-                # Get/Create Master Item
-                try:
-                    master_item = MasterItem.objects.get(product_code=sku_code)
-                except MasterItem.DoesNotExist:
-                    results["failed"] += 1
-                    # Auto-create unknown
-                    master_item = MasterItem.objects.create(product_code=sku_code, name=f"Unknown {sku_code}")
+                        # Get/Create Master Item
+                        try:
+                            master_item = MasterItem.objects.get(product_code=sku_code)
+                        except MasterItem.DoesNotExist:
+                            results["failed"] += 1
+                            # Auto-create unknown
+                            master_item = MasterItem.objects.create(product_code=sku_code, name=f"Unknown {sku_code}")
 
-                qty = row['qty']
-                total_price = row['total_price']
+                        qty = row['qty']
+                        total_price = row['total_price']
                 
-                # Recalculate Unit Price from aggregated totals to be safe
-                if qty > 0:
-                    unit_price = total_price / qty
-                else:
-                    unit_price = row['unit_price']
+                        # Recalculate Unit Price from aggregated totals to be safe
+                        if qty > 0:
+                            unit_price = total_price / qty
+                        else:
+                            unit_price = row['unit_price']
 
-                sale, created = Sale.objects.get_or_create(
-                    order_id=order_id,
-                    sku=master_item,
-                    defaults={
-                        'qty': qty,
-                        'price': unit_price,
-                        'total_price': total_price,
-                        'net_price': total_price,
-                        'status': row['status'],
-                        'platform': row['platform'],
-                        'date': row['date'],
-                        'shop_name': row['shop_name'],
-                    }
-                )
+                        sale, created = Sale.objects.get_or_create(
+                            order_id=order_id,
+                            sku=master_item,
+                            defaults={
+                                'qty': qty,
+                                'price': unit_price,
+                                'total_price': total_price,
+                                'net_price': total_price,
+                                'status': row['status'],
+                                'platform': row['platform'],
+                                'date': row['date'],
+                                'shop_name': row['shop_name'],
+                            }
+                        )
 
-                if not created:
-                    # Update existing record with aggregated values
-                    sale.qty = qty
-                    sale.total_price = total_price
-                    sale.price = unit_price
-                    sale.net_price = total_price
-                    sale.status = row['status']
-                    sale.save()
+                        if not created:
+                            # Update existing record with aggregated values
+                            sale.qty = qty
+                            sale.total_price = total_price
+                            sale.price = unit_price
+                            sale.net_price = total_price
+                            sale.status = row['status']
+                            sale.save()
                 
-                results["success"] += 1
+                        # Earliest date this import touched, per SKU
+                        sale_date = pd.Timestamp(sale.date).date()
+                        dirty_from[master_item.pk] = min(sale_date, dirty_from.get(master_item.pk, sale_date))
 
-            except Exception as e:
-                results["failed"] += 1
-                results["errors"].append(f"Grouped Item {row.get('order_id')}: {e}")
+                        results["success"] += 1
+
+                    except Exception as e:
+                        results["failed"] += 1
+                        results["errors"].append(f"Grouped Item {row.get('order_id')}: {e}")
+        finally:
+            for sku_id, on_date in dirty_from.items():
+                SkuValuation.mark_dirty(sku_id, on_date)
+            CacheService.bump_version('Sale')
 
+        phases.mark('write')
+        # Saved/cancelled sales marked their SKUs dirty: cost them now, forward from the oldest date touched
+        ValuationService.process_dirty()
+        phases.mark('valuation')
         return results
 
     @staticmethod
     def import_stock_jst(file):
+        phases = ImportPhaseTimer('stock')
         df = pd.read_excel(file)
         df = ImportService.clean_header(df)
+        phases.mark('read')
         
         # Columns: 'รหัสสินค้า', 'คงเหลือ', 'Min_Limit'
         results = {"success": 0, "failed": 0, "errors": []}
@@ -282,4 +313,5 @@ class ImportService:
                 results["failed"] += 1
                 results["errors"].append(f"Row {index}: {e}")
                 
+        phases.mark('write')
         return results
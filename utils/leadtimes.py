@@ -0,0 +1,143 @@
+from datetime import date, timedelta
+from django.db import transaction
+from django.db.models import Max, Min, Q
+from inventory.models import LeadTimeStat, POHeader, POItem, SupplierInfo
+from utils.cache_utils import CacheService
+import logging
+
+logger = logging.getLogger(__name__)
+
+HISTORY_DAYS = 730
+BATCH_SIZE = 1000
+
+
+class LeadTimeService:
+    """
+    Maintains LeadTimeStat: count, mean, p50, p90 and latest of the days
+    from order to first receipt and to full receipt, per SKU, per supplier
+    and per shipping type (CAR / SHIP), each also over all shipping types.
+
+    A saved or deleted receipt refreshes its SKU's rows and its supplier's
+    (refresh(), a handful of queries). The shipping-wide rows cover every
+    PO line, so only rebuild() (manage.py rebuild_lead_times, nightly)
+    rewrites them, together with everything else.
+    """
+
+    @staticmethod
+    def observations(lines, today=None):
+        """
+        (sku, shipping type, days to first receipt, days to full receipt or
+        None) of the received lines of this POItem queryset ordered in the
+        last HISTORY_DAYS, oldest order first. Drafts are skipped. One query.
+        """
+        since = (today or date.today()) - timedelta(days=HISTORY_DAYS)
+        rows = (
+            lines.exclude(header__status=POHeader.STATUS_DRAFT).filter(header__order_date__gte=since)
+            .annotate(first_receipt=Min('receipts__received_date'), last_receipt=Max('receipts__received_date'))
+            .filter(first_receipt__isnull=False).order_by('header__order_date', 'id')
+            .values_list('sku_id', 'header__shipping_type', 'header__order_date', 'qty_ordered',
+                         'total_received_qty', 'first_receipt', 'last_receipt')
+        )
+        return [
+            (
+                sku_id, shipping_type or '', max((first - ordered).days, 0),
+                # The last receipt completed the line once it is all in
+                max((last - ordered).days, 0) if qty and received >= qty else None,
+            )
+            for sku_id, shipping_type, ordered, qty, received, first, last in rows
+        ]
+
+    @staticmethod
+    def stores(sku_ids=None):
+        """SKU -> store name of its most recently updated SupplierInfo."""
+        infos = SupplierInfo.objects.filter(sku__isnull=False)
+        if sku_ids is not None:
+            infos = infos.filter(sku_id__in=sku_ids)
+        stores = {}
+        for sku_id, store in infos.order_by('sku_id', '-updated_at').values_list('sku_id', 'store_name'):
+            stores.setdefault(sku_id, store)
+        return stores
+
+    @staticmethod
+    def build(scope, observations, key_of):
+        """
+        Unsaved LeadTimeStat rows of one scope. key_of maps a SKU to its
+        key in the scope (None leaves the observation out).
+        """
+        import numpy as np
+
+        groups = {}
+        for sku_id, shipping_type, first_days, full_days in observations:
+            key = key_of(sku_id)
+            if key is None:
+                continue
+            groups.setdefault((key, ''), []).append((first_days, full_days))
+            if shipping_type:
+                groups.setdefault((key, shipping_type), []).append((first_days, full_days))
+
+        stats = []
+        for (key, shipping_type), values in groups.items():
+            first = np.array([v[0] for v in values], dtype=np.float64)
+            full = np.array([v[1] for v in values if v[1] is not None], dtype=np.float64)
+            stat = LeadTimeStat(
+                scope=scope, key=key, shipping_type=shipping_type,
+                first_count=len(first), first_mean=round(float(first.mean()), 2),
+                first_std=round(float(first.std()), 2),
+                first_p50=float(np.percentile(first, 50)), first_p90=float(np.percentile(first, 90)),
+                first_last=int(first[-1]), full_count=len(full),
+            )
+            if len(full):
+                stat.full_mean = round(float(full.mean()), 2)
+                stat.full_p50 = float(np.percentile(full, 50))
+                stat.full_p90 = float(np.percentile(full, 90))
+                stat.full_last = int(full[-1])
+            stats.append(stat)
+        return stats
+
+    @staticmethod
+    def refresh(sku_ids, today=None):
+        """
+        Recomputes the SKU rows of sku_ids and the supplier rows of their
+        stores, from those SKUs' and their stores' lines only.
+        """
+        sku_ids = {sku_id for sku_id in sku_ids if sku_id}
+        if not sku_ids:
+            return
+        # These SKUs and every SKU sharing a store with them, one query
+        stores = LeadTimeService.stores(SupplierInfo.objects.filter(
+            store_name__in=SupplierInfo.objects.filter(sku_id__in=sku_ids).values('store_name'),
+        ).values('sku_id'))
+        names = {stores[sku_id] for sku_id in sku_ids if sku_id in stores}
+        members = {sku_id: store for sku_id, store in stores.items() if store in names}
+
+        observations = LeadTimeService.observations(POItem.objects.filter(sku_id__in=sku_ids | set(members)), today)
+        stats = (
+            LeadTimeService.build(LeadTimeStat.SCOPE_SKU, observations, lambda sku_id: sku_id if sku_id in sku_ids else None)
+            + LeadTimeService.build(LeadTimeStat.SCOPE_SUPPLIER, observations, members.get)
+        )
+        # Rides the receipt's transaction when there is one (no savepoint)
+        with transaction.atomic(savepoint=False):
+            LeadTimeStat.objects.filter(
+                Q(scope=LeadTimeStat.SCOPE_SKU, key__in=sku_ids) | Q(scope=LeadTimeStat.SCOPE_SUPPLIER, key__in=names)
+            ).delete()
+            # A concurrent refresh of the same SKU wrote the same figures
+            LeadTimeStat.objects.bulk_create(stats, ignore_conflicts=True)
+        # Queryset delete / bulk_create skip signals
+        CacheService.bump_version('LeadTimeStat')
+
+    @staticmethod
+    def rebuild(today=None):
+        """Rewrites every LeadTimeStat row in one transaction. Returns the row count."""
+        observations = LeadTimeService.observations(POItem.objects.all(), today)
+        stores = LeadTimeService.stores()
+        stats = (
+            LeadTimeService.build(LeadTimeStat.SCOPE_SKU, observations, lambda sku_id: sku_id)
+            + LeadTimeService.build(LeadTimeStat.SCOPE_SUPPLIER, observations, stores.get)
+            + LeadTimeService.build(LeadTimeStat.SCOPE_SHIPPING, observations, lambda sku_id: '')
+        )
+        with transaction.atomic():
+            LeadTimeStat.objects.all().delete()
+            LeadTimeStat.objects.bulk_create(stats, batch_size=BATCH_SIZE)
+        CacheService.bump_version('LeadTimeStat')
+        logger.info(f"Lead times: {len(observations)} received PO line(s) -> {len(stats)} row(s)")
+        return len(stats)
@@ -0,0 +1,213 @@
+from django.conf import settings
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets (seconds) shared by request and import phase histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'jst_http_requests_total': ('counter', 'HTTP requests by view, method and status', None),
+    'jst_http_request_duration_seconds': ('histogram', 'Request latency by view', LATENCY_BUCKETS),
+    'jst_http_db_queries': ('histogram', 'DB queries per request by view', QUERY_BUCKETS),
+    'jst_import_jobs_total': ('counter', 'Finished background imports by type and final status', None),
+    'jst_import_rows_total': ('counter', 'Imported rows by type and result (rate() = rows/second)', None),
+    'jst_import_phase_seconds': ('histogram', 'Time spent per import phase (read/parse/write/snapshots/total)', LATENCY_BUCKETS),
+}
+
+
+class MetricsService:
+    """
+    Small Prometheus-style registry that works across gunicorn workers
+    without extra dependencies.
+
+    Each process keeps its counters/histograms in memory and periodically
+    dumps them to METRICS_DIR/<pid>.json. /metrics merges all files, so the
+    numbers are totals over every worker (files of restarted workers are
+    kept so counters never go backwards; the systemd unit clears the
+    directory on service start).
+    """
+
+    _lock = threading.Lock()
+    _counters = {}    # (name, labels) -> value
+    _histograms = {}  # (name, labels) -> [bucket counts..., +Inf count, sum]
+    _last_flush = 0.0
+    _atexit_registered = False
+
+    @staticmethod
+    def enabled():
+        return getattr(settings, 'METRICS_ENABLED', False)
+
+    @staticmethod
+    def get_dir():
+        path = str(getattr(settings, 'METRICS_DIR', os.path.join(settings.BASE_DIR, 'metrics')))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _labels_key(labels):
+        return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+    @staticmethod
+    def inc(name, value=1, **labels):
+        if not MetricsService.enabled():
+            return
+        key = (name, MetricsService._labels_key(labels))
+        with MetricsService._lock:
+            MetricsService._counters[key] = MetricsService._counters.get(key, 0) + value
+        MetricsService._maybe_flush()
+
+    @staticmethod
+    def observe(name, value, **labels):
+        if not MetricsService.enabled():
+            return
+        buckets = METRICS[name][2]
+        key = (name, MetricsService._labels_key(labels))
+        with MetricsService._lock:
+            hist = MetricsService._histograms.get(key)
+            if hist is None:
+                hist = MetricsService._histograms[key] = [0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    hist[i] += 1
+            hist[len(buckets)] += 1   # +Inf (= count)
+            hist[len(buckets) + 1] += value  # sum
+        MetricsService._maybe_flush()
+
+    @staticmethod
+    def reset():
+        """
+        Drops this process' in-memory values (tests).
+        """
+        with MetricsService._lock:
+            MetricsService._counters.clear()
+            MetricsService._histograms.clear()
+
+    @staticmethod
+    def _maybe_flush():
+        if time.monotonic() - MetricsService._last_flush >= getattr(settings, 'METRICS_FLUSH_INTERVAL', 5):
+            MetricsService.flush()
+
+    @staticmethod
+    def flush():
+        """
+        Writes this process' totals to <pid>.json (atomic replace).
+        """
+        with MetricsService._lock:
+            MetricsService._last_flush = time.monotonic()
+            data = {
+                'counters': [[n, list(map(list, l)), v] for (n, l), v in MetricsService._counters.items()],
+                'histograms': [[n, list(map(list, l)), h] for (n, l), h in MetricsService._histograms.items()],
+            }
+            if not MetricsService._atexit_registered:
+                atexit.register(MetricsService.flush)
+                MetricsService._atexit_registered = True
+        try:
+            path = os.path.join(MetricsService.get_dir(), f"{os.getpid()}.json")
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Metrics flush failed: {e}")
+
+    @staticmethod
+    def collect():
+        """
+        Merges the files of all workers: (counters, histograms) dicts keyed by (name, labels).
+        """
+        MetricsService.flush()
+        counters = {}
+        histograms = {}
+        directory = MetricsService.get_dir()
+        for filename in os.listdir(directory):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(directory, filename)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, labels, value in data.get('counters', []):
+                key = (name, tuple(map(tuple, labels)))
+                counters[key] = counters.get(key, 0) + value
+            for name, labels, hist in data.get('histograms', []):
+                key = (name, tuple(map(tuple, labels)))
+                if key in histograms:
+                    histograms[key] = [a + b for a, b in zip(histograms[key], hist)]
+                else:
+                    histograms[key] = list(hist)
+        return counters, histograms
+
+    @staticmethod
+    def _format_labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+            return ''
+        escaped = []
+        for k, v in pairs:
+            v = str(v).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+            escaped.append(f'{k}="{v}"')
+        return '{' + ','.join(escaped) + '}'
+
+    @staticmethod
+    def render(gauges=None):
+        """
+        Prometheus text exposition format (0.0.4).
+        `gauges`: list of (name, help, [(labels dict, value)]) computed at scrape time.
+        """
+        counters, histograms = MetricsService.collect()
+        fmt = MetricsService._format_labels
+        lines = []
+
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (n, labels), value in sorted(counters.items()):
+                    if n == name:
+                        lines.append(f"{name}{fmt(labels)} {value}")
+            else:
+                for (n, labels), hist in sorted(histograms.items()):
+                    if n != name:
+                        continue
+                    for i, bound in enumerate(buckets):
+                        lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {hist[i]}")
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {hist[len(buckets)]}")
+                    lines.append(f"{name}_count{fmt(labels)} {hist[len(buckets)]}")
+                    lines.append(f"{name}_sum{fmt(labels)} {round(hist[len(buckets) + 1], 6)}")
+
+        for name, help_text, samples in gauges or []:
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{fmt(sorted(labels.items()))} {value}")
+
+        return "\n".join(lines) + "\n"
+
+
+class ImportPhaseTimer:
+    """
+    Times consecutive phases of one import:
+        phases = ImportPhaseTimer('sales')
+        ...read file...
+        phases.mark('read')
+        ...
+        phases.mark('write')
+    """
+
+    def __init__(self, import_type):
+        self.import_type = import_type
+        self.last = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        MetricsService.observe('jst_import_phase_seconds', now - self.last, import_type=self.import_type, phase=phase)
+        self.last = now
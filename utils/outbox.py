@@ -0,0 +1,144 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import connection, transaction
+from django.utils import timezone
+from inventory.models import OutboxMessage, LoginActivity
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class OutboxService:
+    """
+    Persistent e-mail queue. Requests only INSERT a row (enqueue_email);
+    the worker (manage.py run_outbox) sends due messages over one SMTP
+    connection and retries failures with exponential backoff.
+    """
+
+    @staticmethod
+    def enqueue_email(recipient, subject, body):
+        return OutboxMessage.objects.create(recipient=recipient, subject=subject, body=body)
+
+    @staticmethod
+    def _claim(limit):
+        """
+        Due messages, locked so a second worker skips them (Postgres).
+        Must run inside a transaction.
+        """
+        qs = OutboxMessage.objects.filter(
+            status=OutboxMessage.STATUS_PENDING,
+            next_attempt_at__lte=timezone.now(),
+        ).order_by('next_attempt_at', 'id')
+        if connection.features.has_select_for_update_skip_locked:
+            qs = qs.select_for_update(skip_locked=True)
+        return list(qs[:limit])
+
+    @staticmethod
+    def send_pending(limit=50):
+        """
+        Sends due messages. Returns (sent, failed) counts for this pass.
+        """
+        max_attempts = getattr(settings, 'OUTBOX_MAX_ATTEMPTS', 5)
+        sent = failed = 0
+        with transaction.atomic():
+            messages = OutboxService._claim(limit)
+            if not messages:
+                return 0, 0
+
+            smtp = None
+            connect_error = None
+            try:
+                smtp = get_connection(fail_silently=False)
+                smtp.open()
+            except Exception as e:
+                # SMTP down: every claimed message counts as one failed attempt
+                logger.error(f"Outbox: cannot connect to mail server: {e}")
+                smtp = None
+                connect_error = str(e)
+
+            now = timezone.now()
+            for message in messages:
+                message.attempts += 1
+                try:
+                    if smtp is None:
+                        raise ConnectionError(connect_error)
+                    EmailMessage(
+                        message.subject, message.body, settings.DEFAULT_FROM_EMAIL,
+                        [message.recipient], connection=smtp,
+                    ).send()
+                    message.status = OutboxMessage.STATUS_SENT
+                    message.sent_at = now
+                    message.last_error = ''
+                    sent += 1
+                except Exception as e:
+                    message.last_error = str(e)[:1000]
+                    if message.attempts >= max_attempts:
+                        message.status = OutboxMessage.STATUS_FAILED
+                        logger.error(f"Outbox: giving up on message {message.id} to {message.recipient}: {e}")
+                    else:
+                        # 30s, 60s, 120s, ...
+                        message.next_attempt_at = now + timedelta(seconds=30 * 2 ** (message.attempts - 1))
+                    failed += 1
+
+            if smtp is not None:
+                try:
+                    smtp.close()
+                except Exception:
+                    pass
+
+            OutboxMessage.objects.bulk_update(
+                messages, ['status', 'attempts', 'next_attempt_at', 'last_error', 'sent_at']
+            )
+        return sent, failed
+
+    @staticmethod
+    def purge_sent(days=30):
+        cutoff = timezone.now() - timedelta(days=days)
+        deleted, _ = OutboxMessage.objects.filter(status=OutboxMessage.STATUS_SENT, sent_at__lt=cutoff).delete()
+        return deleted
+
+
+class LoginActivityService:
+    """
+    Login audit: one cheap INSERT per event during the request, flushed
+    to the Google Sheet (LOGIN_ACTIVITY_SHEET_ID) in batches by the worker.
+    Without a sheet configured the table itself is the log.
+    """
+
+    @staticmethod
+    def record(request, email, event):
+        try:
+            LoginActivity.objects.create(
+                email=email[:255],
+                event=event,
+                ip_address=(request.META.get('HTTP_X_REAL_IP') or request.META.get('REMOTE_ADDR') or '')[:45],
+                user_agent=request.META.get('HTTP_USER_AGENT', '')[:255],
+            )
+        except Exception as e:
+            # Never block a login because of the audit log
+            logger.error(f"Login activity not recorded: {e}")
+
+    @staticmethod
+    def flush(batch_size=500):
+        """
+        Appends unsynced rows to the sheet with one API call per batch.
+        Returns the number of rows flushed.
+        """
+        sheet_id = getattr(settings, 'LOGIN_ACTIVITY_SHEET_ID', '')
+        if not sheet_id:
+            return 0
+
+        from utils.auth_utils import append_login_activity
+
+        rows = list(LoginActivity.objects.filter(synced_at__isnull=True).order_by('id')[:batch_size])
+        if not rows:
+            return 0
+        values = [
+            [timezone.localtime(r.created_at).strftime('%Y-%m-%d %H:%M:%S'), r.email, r.event, r.ip_address, r.user_agent]
+            for r in rows
+        ]
+        # Raises on API errors: rows stay unsynced and go out with the next flush
+        append_login_activity(sheet_id, values)
+        LoginActivity.objects.filter(id__in=[r.id for r in rows]).update(synced_at=timezone.now())
+        return len(rows)
@@ -0,0 +1,105 @@
+from datetime import date
+from django.db import connection
+import logging
+
+logger = logging.getLogger(__name__)
+
+SALE_TABLE = 'inventory_sale'
+
+
+def month_start(value):
+    return date(value.year, value.month, 1)
+
+
+def next_month(value):
+    return date(value.year + value.month // 12, value.month % 12 + 1, 1)
+
+
+class SalePartitionService:
+    """
+    On Postgres, Sale is range-partitioned by month (migration 0019), one
+    child table per month: inventory_sale_y2026m10 holds October 2026.
+    There is no default partition, so a month must exist before its rows
+    are inserted: the importer calls ensure_for_dates(), cron runs
+    `manage.py sale_partitions` to stay a few months ahead.
+    On SQLite (dev/tests) the table is a plain table and this is a no-op.
+    """
+
+    @staticmethod
+    def is_partitioned():
+        if connection.vendor != 'postgresql':
+            return False
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [SALE_TABLE]
+            )
+            return cursor.fetchone() is not None
+
+    @staticmethod
+    def partition_name(month):
+        return f"{SALE_TABLE}_y{month.year}m{month.month:02d}"
+
+    @staticmethod
+    def existing_partitions():
+        """
+        Partition table name -> estimated row count (pg_class.reltuples).
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("""
+                SELECT c.relname, c.reltuples::bigint
+                FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = %s::regclass
+                ORDER BY c.relname
+            """, [SALE_TABLE])
+            return {name: max(rows, 0) for name, rows in cursor.fetchall()}
+
+    @staticmethod
+    def _create(month):
+        name = SalePartitionService.partition_name(month)
+        # Dates come from date objects, safe to inline (DDL takes no parameters)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {SALE_TABLE} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+            )
+        logger.info(f"Created sale partition {name}")
+        return name
+
+    @staticmethod
+    def ensure_for_dates(dates):
+        """
+        Creates the month partitions needed for `dates` (date/datetime
+        values). Returns the names of the partitions created.
+        """
+        months = {month_start(d) for d in dates if d is not None}
+        if not months or not SalePartitionService.is_partitioned():
+            return []
+        existing = SalePartitionService.existing_partitions()
+        return [
+            SalePartitionService._create(month)
+            for month in sorted(months)
+            if SalePartitionService.partition_name(month) not in existing
+        ]
+
+    @staticmethod
+    def ensure_partitions(start, end):
+        """
+        Every month from start to end (inclusive).
+        """
+        months = []
+        month = month_start(start)
+        while month <= end:
+            months.append(month)
+            month = next_month(month)
+        return SalePartitionService.ensure_for_dates(months)
+
+    @staticmethod
+    def ensure_ahead(months=3):
+        """
+        This month plus the next `months`, so inserts never hit a missing
+        partition (creating one briefly locks the parent table).
+        """
+        end = month_start(date.today())
+        for _ in range(months):
+            end = next_month(end)
+        return SalePartitionService.ensure_partitions(date.today(), end)
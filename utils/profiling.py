@@ -0,0 +1,230 @@
+from collections import Counter
+from datetime import datetime
+from django.conf import settings
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+
+class StackSampler:
+    """
+    Low-overhead sampling profiler for one thread: every `interval` seconds
+    it records the target thread's current stack. Output is in "collapsed
+    stacks" format (root;...;leaf count), which flamegraph.pl / speedscope
+    read directly.
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        self.interval = interval
+        self.thread_id = thread_id or threading.get_ident()
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    @staticmethod
+    def _frame_label(frame):
+        code = frame.f_code
+        module = frame.f_globals.get('__name__', os.path.basename(code.co_filename))
+        # No line numbers: samples in the same function merge into one flame graph box
+        return f"{module}:{code.co_name}"
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def collapsed(self):
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common())
+
+
+class ProfileStore:
+    """
+    Captured profiles on disk (PROFILE_DIR), kept as a ring buffer of the
+    last PROFILE_MAX_ENTRIES requests. Each capture is:
+      <id>.json       metadata + full SQL list
+      <id>.pstats     cProfile data (mode=cprofile)
+      <id>.collapsed  collapsed stacks (both modes)
+    """
+
+    ID_RE = re.compile(r'^\d{8}-\d{6}-[0-9a-f]{8}$')
+    FORMATS = {
+        'pstats': 'application/octet-stream',
+        'collapsed': 'text/plain; charset=utf-8',
+        'txt': 'text/plain; charset=utf-8',
+        'sql': 'text/plain; charset=utf-8',
+        'json': 'application/json',
+    }
+
+    @staticmethod
+    def get_dir():
+        path = getattr(settings, 'PROFILE_DIR', os.path.join(settings.BASE_DIR, 'profiles'))
+        os.makedirs(path, exist_ok=True)
+        return str(path)
+
+    @staticmethod
+    def new_id():
+        return f"{datetime.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+    @staticmethod
+    def path_for(profile_id, ext):
+        if not ProfileStore.ID_RE.match(profile_id or ''):
+            raise ValueError("Invalid profile id")
+        return os.path.join(ProfileStore.get_dir(), f"{profile_id}.{ext}")
+
+    @staticmethod
+    def save(meta, queries, profiler=None, sampler=None):
+        profile_id = ProfileStore.new_id()
+        meta = dict(meta, id=profile_id, query_count=len(queries))
+
+        if profiler is not None:
+            profiler.dump_stats(ProfileStore.path_for(profile_id, 'pstats'))
+            with open(ProfileStore.path_for(profile_id, 'collapsed'), 'w') as f:
+                f.write(ProfileStore.pstats_to_collapsed(profiler))
+        if sampler is not None:
+            meta['samples'] = sampler.samples
+            with open(ProfileStore.path_for(profile_id, 'collapsed'), 'w') as f:
+                f.write(sampler.collapsed())
+
+        with open(ProfileStore.path_for(profile_id, 'json'), 'w') as f:
+            json.dump({'meta': meta, 'queries': queries}, f, ensure_ascii=False, default=str)
+
+        ProfileStore.prune()
+        return profile_id
+
+    @staticmethod
+    def pstats_to_collapsed(profiler):
+        """
+        cProfile only keeps caller -> callee edges, not full stacks, so this
+        emits 2-level stacks (caller;callee self-time in µs). Good enough to
+        spot hot functions in a flame graph; use mode=sample for real stacks.
+        """
+        stats = pstats.Stats(profiler).stats
+        lines = []
+        for func, (cc, nc, tt, ct, callers) in stats.items():
+            callee = f"{func[0]}:{func[2]}:{func[1]}"
+            if not callers:
+                lines.append(f"{callee} {int(tt * 1e6)}")
+                continue
+            total_calls = sum(c[0] for c in callers.values()) or 1
+            for caller, caller_stats in callers.items():
+                # Split self time between callers by call count
+                share = tt * caller_stats[0] / total_calls
+                if share > 0:
+                    lines.append(f"{caller[0]}:{caller[2]}:{caller[1]};{callee} {int(share * 1e6)}")
+        return "\n".join(lines)
+
+    @staticmethod
+    def prune():
+        max_entries = getattr(settings, 'PROFILE_MAX_ENTRIES', 50)
+        ids = ProfileStore.list_ids()
+        for profile_id in ids[max_entries:]:
+            ProfileStore.delete(profile_id)
+
+    @staticmethod
+    def list_ids():
+        """
+        Newest first (ids start with a timestamp).
+        """
+        names = [n[:-5] for n in os.listdir(ProfileStore.get_dir()) if n.endswith('.json')]
+        return sorted((n for n in names if ProfileStore.ID_RE.match(n)), reverse=True)
+
+    @staticmethod
+    def list_profiles():
+        profiles = []
+        for profile_id in ProfileStore.list_ids():
+            try:
+                profiles.append(ProfileStore.load(profile_id)['meta'])
+            except (OSError, ValueError):
+                continue
+        return profiles
+
+    @staticmethod
+    def load(profile_id):
+        with open(ProfileStore.path_for(profile_id, 'json')) as f:
+            return json.load(f)
+
+    @staticmethod
+    def delete(profile_id):
+        for ext in ('json', 'pstats', 'collapsed'):
+            try:
+                os.remove(ProfileStore.path_for(profile_id, ext))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def render(profile_id, fmt):
+        """
+        Returns (bytes, content type) of one capture in the requested format.
+        """
+        if fmt not in ProfileStore.FORMATS:
+            raise ValueError(f"Unknown format {fmt}")
+
+        if fmt in ('pstats', 'collapsed'):
+            with open(ProfileStore.path_for(profile_id, fmt), 'rb') as f:
+                return f.read(), ProfileStore.FORMATS[fmt]
+
+        data = ProfileStore.load(profile_id)
+        if fmt == 'json':
+            content = json.dumps(data, ensure_ascii=False, indent=2)
+        elif fmt == 'sql':
+            content = "\n\n".join(
+                f"-- #{i} {q['duration'] * 1000:.2f} ms ({q['alias']})\n{q['sql']};"
+                for i, q in enumerate(data['queries'], 1)
+            )
+        else:
+            # Top functions by cumulative time
+            out = io.StringIO()
+            pstats.Stats(ProfileStore.path_for(profile_id, 'pstats'), stream=out).sort_stats('cumulative').print_stats(60)
+            content = out.getvalue()
+        return content.encode(), ProfileStore.FORMATS[fmt]
+
+
+def start_profiler(mode):
+    """
+    Returns (profiler, sampler); exactly one of them is set.
+    """
+    if mode == 'sample':
+        sampler = StackSampler(interval=getattr(settings, 'PROFILE_SAMPLE_INTERVAL', 0.005))
+        sampler.start()
+        return None, sampler
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler, None
+
+
+def stop_profiler(profiler, sampler):
+    if profiler is not None:
+        profiler.disable()
+    if sampler is not None:
+        sampler.stop()
+
+
+def elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 2)
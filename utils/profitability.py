@@ -0,0 +1,223 @@
+from django.core.paginator import Paginator
+from django.db import connection
+from django.db.models import Count, DecimalField, F, Q, Sum, Value
+from django.db.models.functions import Coalesce, NullIf, TruncMonth, TruncWeek
+from inventory.models import Sale, SaleDailyRollup
+from utils.cache_utils import CacheService
+from datetime import date
+from decimal import Decimal
+import logging
+
+logger = logging.getLogger(__name__)
+
+PAGE_SIZE = 50
+
+# ?group= -> rollup columns the rows are grouped by
+GROUPINGS = {
+    'sku': ('sku_id', 'sku__name'),
+    'platform': ('platform',),
+    'shop': ('shop_name',),
+}
+
+# ?period= -> expression on the rollup date ('' = whole range)
+PERIODS = {
+    'day': F('date'),
+    'week': TruncWeek('date'),
+    'month': TruncMonth('date'),
+}
+
+PROFIT_SORTS = {
+    'profit_desc': (F('profit').desc(),),
+    'profit_asc': (F('profit').asc(),),
+    'revenue_desc': (F('revenue').desc(),),
+    'qty_desc': (F('total_qty').desc(),),
+    'margin_desc': (F('margin').desc(nulls_last=True),),
+    'margin_asc': (F('margin').asc(nulls_last=True),),
+}
+
+CSV_COLUMNS = [
+    ('period', 'Period'), ('sku_id', 'SKU'), ('sku__name', 'Name'), ('platform', 'Platform'),
+    ('shop_name', 'Shop'), ('total_orders', 'Orders'), ('total_qty', 'Qty'), ('revenue', 'Revenue'),
+    ('total_fees', 'Fees'), ('net', 'Net'), ('cogs', 'COGS'), ('profit', 'Gross Profit'),
+    ('margin', 'Margin %'), ('uncosted', 'Uncosted Sales'),
+]
+
+ZERO = Value(Decimal('0'), output_field=DecimalField())
+
+
+def csv_value(value):
+    if isinstance(value, (Decimal, float)):
+        return f"{value:.2f}"
+    return '' if value is None else value
+
+
+class SaleRollupService:
+    """
+    Keeps SaleDailyRollup in step with Sale. ValuationService calls
+    refresh() for every SKU it revalues (a Sale change always marks its
+    SKU dirty), inside the same transaction as the cost of goods sold.
+    """
+
+    COLUMNS = ('date', 'sku_id', 'platform', 'shop_name', 'orders', 'qty', 'total_price',
+               'net_price', 'fees', 'cogs_fifo', 'cogs_avg', 'uncosted')
+
+    @staticmethod
+    def _aggregate(sales):
+        # Select order must match COLUMNS
+        return (
+            sales.order_by()
+            .annotate(shop=Coalesce('shop_name', Value('')))
+            .values('date', 'sku_id', 'platform', 'shop')
+            .annotate(
+                n_orders=Count('id'),
+                sum_qty=Coalesce(Sum('qty'), 0),
+                sum_total=Coalesce(Sum('total_price'), ZERO),
+                sum_net=Coalesce(Sum('net_price'), ZERO),
+                sum_fees=Coalesce(Sum(F('payment_fee') + F('commission_fee') + F('service_fee')
+                                      + F('shipping_fee') + F('voucher_amount')), ZERO),
+                sum_fifo=Coalesce(Sum('cogs_fifo'), ZERO),
+                sum_avg=Coalesce(Sum('cogs_avg'), ZERO),
+                n_uncosted=Count('id', filter=Q(cogs_fifo__isnull=True)),
+            )
+        )
+
+    @staticmethod
+    def refresh(sku_ids, start_date=None):
+        """
+        Rewrites the rollups of these SKUs (ids or a pk subquery; from
+        start_date on, all when None) with one DELETE and one
+        INSERT .. SELECT .. GROUP BY.
+        """
+        rollups = SaleDailyRollup.objects.filter(sku_id__in=sku_ids)
+        sales = Sale.objects.filter(sku_id__in=sku_ids)
+        if start_date:
+            rollups = rollups.filter(date__gte=start_date)
+            sales = sales.filter(date__gte=start_date)
+        rollups.delete()
+        select_sql, params = SaleRollupService._aggregate(sales).query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {SaleDailyRollup._meta.db_table} ({', '.join(SaleRollupService.COLUMNS)}) {select_sql}",
+                params,
+            )
+
+
+class ProfitabilityService:
+    """
+    Profit per SKU / platform / shop / period, summed by the database from
+    SaleDailyRollup (one row per SKU, day, platform and shop instead of one
+    per order line), so a page costs the same however long the history.
+    Profit = net_price (after platform fees) - cost of goods sold.
+    """
+
+    DEPENDS_ON = ('MasterItem', 'SaleDailyRollup')
+
+    @staticmethod
+    def default_filters(today=None):
+        today = today or date.today()
+        return {
+            'start_date': today.replace(day=1),
+            'end_date': today,
+            'group': ['sku'],
+            'period': '',
+            'cost': 'fifo',
+            'platform': '',
+            'shop': '',
+            'search': '',
+            'category': '',
+            'sort': 'profit_desc',
+            'page': 1,
+        }
+
+    @staticmethod
+    def _filtered(filters):
+        qs = SaleDailyRollup.objects.filter(date__range=(filters['start_date'], filters['end_date']))
+        if filters['search']:
+            qs = qs.filter(Q(sku__product_code__icontains=filters['search']) | Q(sku__name__icontains=filters['search']))
+        if filters['category']:
+            qs = qs.filter(sku__category=filters['category'])
+        if filters['platform']:
+            qs = qs.filter(platform=filters['platform'])
+        if filters['shop']:
+            qs = qs.filter(shop_name=filters['shop'])
+        return qs
+
+    @staticmethod
+    def _sums(filters):
+        cogs = 'cogs_avg' if filters['cost'] == 'avg' else 'cogs_fifo'
+        return {
+            'total_orders': Coalesce(Sum('orders'), 0),
+            'total_qty': Coalesce(Sum('qty'), 0),
+            'revenue': Coalesce(Sum('total_price'), ZERO),
+            'total_fees': Coalesce(Sum('fees'), ZERO),
+            'net': Coalesce(Sum('net_price'), ZERO),
+            'cogs': Coalesce(Sum(cogs), ZERO),
+            'uncosted': Coalesce(Sum('uncosted'), 0),
+        }
+
+    @staticmethod
+    def grouped(filters):
+        """
+        Values queryset: one row per group with the sums, profit and margin
+        (% of net), sorted in SQL.
+        """
+        keys = []
+        qs = ProfitabilityService._filtered(filters)
+        if filters['period'] in PERIODS:
+            qs = qs.annotate(period=PERIODS[filters['period']])
+            keys.append('period')
+        for group in filters['group']:
+            keys += GROUPINGS.get(group, ())
+        if not keys:
+            keys = list(GROUPINGS['sku'])
+        return (
+            qs.values(*keys)
+            .annotate(**ProfitabilityService._sums(filters))
+            .annotate(profit=F('net') - F('cogs'))
+            .annotate(margin=F('profit') * 100 / NullIf(F('net'), ZERO))
+            .order_by(*PROFIT_SORTS.get(filters['sort'], PROFIT_SORTS['profit_desc']), *keys)
+        )
+
+    @staticmethod
+    def totals(filters):
+        totals = ProfitabilityService._filtered(filters).aggregate(**ProfitabilityService._sums(filters))
+        totals['profit'] = totals['net'] - totals['cogs']
+        totals['margin'] = totals['profit'] * 100 / totals['net'] if totals['net'] else None
+        return totals
+
+    @staticmethod
+    def build_report(filters):
+        """
+        One page of rows plus the totals of the whole selection.
+        Plain dicts, so the default view can be cached.
+        """
+        page = Paginator(ProfitabilityService.grouped(filters), PAGE_SIZE).get_page(filters['page'])
+        return {
+            'rows': list(page.object_list),
+            'page': page.number,
+            'num_pages': page.paginator.num_pages,
+            'count': page.paginator.count,
+            'totals': ProfitabilityService.totals(filters),
+        }
+
+    @staticmethod
+    def cached_report(filters):
+        """
+        build_report(), from the shared cache for the default view (the page
+        everyone opens first); other filters are computed per request.
+        """
+        if filters != ProfitabilityService.default_filters():
+            return ProfitabilityService.build_report(filters)
+        return CacheService.get_or_set(
+            'profitability', ProfitabilityService.DEPENDS_ON,
+            lambda: ProfitabilityService.build_report(filters), sorted(filters.items()),
+        )
+
+    @staticmethod
+    def csv_rows(filters):
+        """
+        Header + every row of the selection (no pagination) for the export.
+        """
+        yield [label for _, label in CSV_COLUMNS]
+        for row in ProfitabilityService.grouped(filters).iterator():
+            yield [csv_value(row.get(key, '')) for key, _ in CSV_COLUMNS]
@@ -0,0 +1,71 @@
+from collections import Counter, defaultdict
+import re
+import time
+
+# Literals are replaced so "same query, different id" collapses into one shape
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM_RE = re.compile(r"%s|\?|\$\d+")
+_IN_LIST_RE = re.compile(r"\bIN\s*\((?:\s*\?\s*,?)+\)", re.IGNORECASE)
+_VALUES_RE = re.compile(r"\bVALUES\s*(?:\((?:[^()]*)\)\s*,?\s*)+", re.IGNORECASE)
+_SPACE_RE = re.compile(r"\s+")
+
+
+def normalize_sql(sql):
+    """
+    SQL "shape": literals/params -> ?, IN (...) and multi-row VALUES collapsed.
+    """
+    shape = _STRING_RE.sub("?", sql)
+    shape = _PARAM_RE.sub("?", shape)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("IN (...)", shape)
+    shape = _VALUES_RE.sub("VALUES (...) ", shape)
+    return _SPACE_RE.sub(" ", shape).strip()
+
+
+class QueryTracker:
+    """
+    connection.execute_wrapper() callable that counts queries, sums their
+    time and groups them by shape. Repeated shapes = N+1 candidates.
+
+        tracker = QueryTracker()
+        with connection.execute_wrapper(tracker):
+            ...
+        tracker.count, tracker.duration, tracker.top_repeated()
+    """
+
+    def __init__(self, keep_queries=False):
+        self.count = 0
+        self.duration = 0.0
+        self.shape_counts = Counter()
+        self.shape_durations = defaultdict(float)
+        self.keep_queries = keep_queries
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            shape = normalize_sql(sql)
+            self.shape_counts[shape] += 1
+            self.shape_durations[shape] += elapsed
+            if self.keep_queries:
+                self.queries.append({'sql': sql, 'duration': elapsed, 'alias': context['connection'].alias})
+
+    def top_repeated(self, limit=5, min_count=2):
+        """
+        Most repeated shapes: [{'sql', 'count', 'total_ms'}].
+        """
+        return [
+            {
+                'sql': shape,
+                'count': count,
+                'total_ms': round(self.shape_durations[shape] * 1000, 2),
+            }
+            for shape, count in self.shape_counts.most_common(limit)
+            if count >= min_count
+        ]
@@ -0,0 +1,224 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from inventory.models import CurrencyRate, LeadTimeStat, MasterItem, POHeader, POItem, SupplierInfo
+from utils.cache_utils import CacheService
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+SERVICE_Z = 1.65  # safety factor: ~95% of replenishment cycles without a stockout
+REVIEW_DAYS = 7  # suggestions are reviewed weekly: order up to lead time + this
+DEFAULT_LEAD_DAYS = 25  # SKUs never received (POHeader.save()'s SHIP estimate)
+
+
+class ReplenishmentService:
+    """
+    Reorder suggestions for the whole catalogue in one pass, and draft POs
+    built from them.
+
+    Per SKU with forecast demand d/day (SkuForecast, variance v) and lead
+    time L days (mean / std dev sL of order -> first receipt, LeadTimeStat):
+      safety stock   = z * sqrt(L * v + d^2 * sL^2)
+      reorder point  = max(d * L + safety stock, min_limit)
+      order-up-to    = d * (L + review days) + safety stock
+    Stock + open supply (non-Complete PO lines, drafts included) at or
+    below the reorder point gets order-up-to - that, rounded up to whole
+    cartons of the SKU's last PO line.
+    """
+
+    @staticmethod
+    def lead_times():
+        """
+        SKU -> (mean, std dev, count) of days from order to first receipt,
+        from its LeadTimeStat row (utils/leadtimes.py). One query.
+        """
+        return {
+            sku_id: (mean, std, count)
+            for sku_id, mean, std, count in LeadTimeStat.objects.filter(
+                scope=LeadTimeStat.SCOPE_SKU, shipping_type='', first_count__gt=0,
+            ).values_list('key', 'first_mean', 'first_std', 'first_count')
+        }
+
+    @staticmethod
+    def last_lines():
+        """
+        SKU -> its latest ordered PO line with a carton count or a price
+        (carton size, price, order type). One query.
+        """
+        latest = Subquery(
+            POItem.objects.filter(sku=OuterRef('pk')).exclude(header__status=POHeader.STATUS_DRAFT)
+            .filter(Q(carton_qty__gt=0) | Q(price_yuan__gt=0) | Q(unit_price__isnull=False))
+            .order_by('-header__order_date', '-id').values('id')[:1]
+        )
+        lines = POItem.objects.filter(id__in=MasterItem.objects.annotate(line=latest).values('line')).values_list(
+            'sku_id', 'qty_ordered', 'carton_qty', 'price_yuan', 'unit_price', 'header__order_type', 'header__shipping_type',
+        )
+        return {
+            sku_id: {
+                'per_carton': max(round(qty / cartons), 1) if cartons else 1,
+                'unit_yuan': Decimal(price_yuan) / qty if qty else Decimal(0),
+                'unit_price': unit_price,
+                'order_type': order_type,
+                'shipping_type': shipping_type,
+            }
+            for sku_id, qty, cartons, price_yuan, unit_price, order_type, shipping_type in lines
+        }
+
+    @staticmethod
+    def suppliers():
+        """SKU -> its most recently updated SupplierInfo (store, link, WeChat)."""
+        suppliers = {}
+        for sku_id, store, link, wechat in (
+            SupplierInfo.objects.filter(sku__isnull=False).order_by('sku_id', '-updated_at')
+            .values_list('sku_id', 'store_name', 'store_link', 'wechat_id')
+        ):
+            suppliers.setdefault(sku_id, {'store': store, 'link': link or '', 'wechat': wechat or ''})
+        return suppliers
+
+    @staticmethod
+    def open_supply():
+        """SKU -> (qty still to arrive on ordered POs, qty on drafts)."""
+        rows = (
+            POItem.objects.exclude(header__status=POHeader.STATUS_COMPLETE).order_by().values('sku_id')
+            .annotate(
+                ordered=Sum(F('qty_ordered') - F('total_received_qty'), filter=~Q(header__status=POHeader.STATUS_DRAFT)),
+                drafted=Sum('qty_ordered', filter=Q(header__status=POHeader.STATUS_DRAFT)),
+            )
+        )
+        return {row['sku_id']: (max(row['ordered'] or 0, 0), row['drafted'] or 0) for row in rows}
+
+    @staticmethod
+    def suggestions():
+        """
+        One row per SKU to reorder, most urgent (fewest days of cover)
+        first. Plain dicts, no writes.
+        """
+        import numpy as np
+
+        rows = list(
+            MasterItem.objects.exclude(status=MasterItem.STATUS_DISCONTINUED).filter(forecast__daily_demand__gt=0)
+            .order_by('product_code')
+            .values_list('product_code', 'name', 'current_stock', 'min_limit', 'forecast__daily_demand', 'forecast__variance')
+        )
+        if not rows:
+            return []
+        lead_times = ReplenishmentService.lead_times()
+        supply = ReplenishmentService.open_supply()
+        last_lines = ReplenishmentService.last_lines()
+        suppliers = ReplenishmentService.suppliers()
+
+        skus = [row[0] for row in rows]
+        stock = np.array([row[2] or 0 for row in rows], dtype=np.float64)
+        min_limit = np.array([row[3] or 0 for row in rows], dtype=np.float64)
+        demand = np.array([row[4] for row in rows], dtype=np.float64)
+        variance = np.array([row[5] for row in rows], dtype=np.float64)
+        lead = np.array([lead_times.get(sku, (DEFAULT_LEAD_DAYS, 0, 0))[0] for sku in skus], dtype=np.float64)
+        lead_std = np.array([lead_times.get(sku, (DEFAULT_LEAD_DAYS, 0, 0))[1] for sku in skus], dtype=np.float64)
+        incoming = np.array([supply.get(sku, (0, 0))[0] for sku in skus], dtype=np.float64)
+        drafted = np.array([supply.get(sku, (0, 0))[1] for sku in skus], dtype=np.float64)
+        per_carton = np.array([last_lines.get(sku, {}).get('per_carton', 1) for sku in skus], dtype=np.float64)
+
+        safety = SERVICE_Z * np.sqrt(lead * variance + demand ** 2 * lead_std ** 2)
+        reorder_point = np.maximum(demand * lead + safety, min_limit)
+        order_up_to = np.maximum(demand * (lead + REVIEW_DAYS) + safety, reorder_point)
+        position = stock + incoming + drafted
+        need = (position <= reorder_point) & (order_up_to > position)
+        cartons = np.ceil(np.maximum(order_up_to - position, 0) / per_carton)
+        qty = cartons * per_carton
+
+        suggestions = []
+        for i in np.flatnonzero(need):
+            sku = skus[i]
+            line = last_lines.get(sku, {})
+            supplier = suppliers.get(sku, {})
+            suggestions.append({
+                'sku': sku,
+                'name': rows[i][1],
+                'current_stock': int(stock[i]),
+                'incoming': int(incoming[i]),
+                'drafted': int(drafted[i]),
+                'daily_demand': round(float(demand[i]), 2),
+                'days_of_cover': round(float(max(stock[i], 0) / demand[i]), 1),
+                'lead_days': round(float(lead[i]), 1),
+                'lead_observed': sku in lead_times,
+                'safety_stock': int(math.ceil(safety[i])),
+                'reorder_point': int(math.ceil(reorder_point[i])),
+                'order_up_to': int(math.ceil(order_up_to[i])),
+                'qty': int(qty[i]),
+                'cartons': int(cartons[i]) if line.get('per_carton', 1) > 1 else None,
+                'per_carton': int(per_carton[i]),
+                'supplier': supplier.get('store', ''),
+                'order_type': line.get('order_type') or 'IMPORTED',
+                'shipping_type': line.get('shipping_type') or '',
+            })
+        suggestions.sort(key=lambda s: (s['days_of_cover'], s['sku']))
+        return suggestions
+
+    @staticmethod
+    def create_drafts(suggestions, today=None):
+        """
+        Draft POs (status Draft, bottom-up prices from each SKU's last line)
+        for these suggestions, one per supplier / order type / shipping
+        type. All headers, then all lines, in bulk in one transaction.
+        Returns the headers created.
+        """
+        today = today or date.today()
+        if not suggestions:
+            return []
+        last_lines = ReplenishmentService.last_lines()
+        suppliers = ReplenishmentService.suppliers()
+        current_rate = CurrencyRate.rate_on(today)
+        rate = current_rate.rate if current_rate else Decimal('1.0')
+
+        groups = {}
+        for suggestion in suggestions:
+            key = (suggestion['supplier'], suggestion['order_type'], suggestion['shipping_type'])
+            groups.setdefault(key, []).append(suggestion)
+
+        prefix = f"DRAFT-{today:%Y%m%d}-"
+        with transaction.atomic():
+            sequence = POHeader.objects.filter(po_number__startswith=prefix).count()
+            headers, lines = [], []
+            for (store, order_type, shipping_type), rows in sorted(groups.items()):
+                sequence += 1
+                supplier = next((suppliers[row['sku']] for row in rows if row['sku'] in suppliers), {})
+                imported = order_type == 'IMPORTED'
+                header = POHeader(
+                    po_number=f"{prefix}{sequence:03d}",
+                    order_type=order_type,
+                    shipping_type=shipping_type or None,
+                    order_date=today,
+                    estimated_date=today + timedelta(days=math.ceil(max(row['lead_days'] for row in rows))),
+                    exchange_rate=rate if imported else Decimal('1.0'),
+                    yuan_mode='bottom-up',
+                    status=POHeader.STATUS_DRAFT,
+                    link_shop=supplier.get('link') or None,
+                    wechat_contact=supplier.get('wechat') or None,
+                    note=f"แนะนำสั่งซื้ออัตโนมัติ: {len(rows)} รายการ ({store or 'ไม่ระบุร้านค้า'})",
+                )
+                headers.append(header)
+                for row in rows:
+                    last = last_lines.get(row['sku'], {})
+                    line = POItem(header=header, sku_id=row['sku'], qty_ordered=row['qty'], carton_qty=row['cartons'])
+                    if imported:
+                        line.price_yuan = (last.get('unit_yuan', Decimal(0)) * row['qty']).quantize(Decimal('0.0001'))
+                        line.price_baht = (line.price_yuan * header.exchange_rate).quantize(Decimal('0.01'))
+                    elif last.get('unit_price') is not None:
+                        line.unit_price = last['unit_price']
+                        line.price_baht = (last['unit_price'] * row['qty']).quantize(Decimal('0.01'))
+                    lines.append(line)
+
+            POHeader.objects.bulk_create(headers)
+            # Lines pick up their header's new pk in bulk_create
+            for line in lines:
+                line.compute_landed_costs(line.header)
+            POItem.objects.bulk_create(lines)
+
+        # bulk_create skips signals
+        CacheService.bump_version('POHeader')
+        CacheService.bump_version('POItem')
+        logger.info(f"Drafted {len(headers)} PO(s) / {len(lines)} line(s) from reorder suggestions")
+        return headers
@@ -0,0 +1,108 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, DecimalField, F, Sum, Value, When
+from django.db.models.functions import Round
+from inventory.models import POHeader, POItem, RepricingLog, SkuValuation
+from utils.cache_utils import CacheService
+import logging
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+
+class RepricingService:
+    """
+    Moves the open imported POs to a new exchange rate in bulk, instead of
+    editing each PO (one save + signals per line).
+
+    Total Baht is rewritten with one UPDATE per Yuan mode:
+      top-down   price_baht = Header.total_yuan * qty / total qty * rate
+      bottom-up  price_baht = price_yuan * rate
+    the same values POHeader.prorate_costs() and the PO forms would store.
+    The stored landed costs follow (POItem.compute_landed_costs, one bulk
+    UPDATE), received lines are revalued and a RepricingLog row records
+    what changed. Completed POs are skipped unless include_complete.
+    """
+
+    @staticmethod
+    def _baht_per_po(header_ids):
+        return {
+            header_id: Decimal(baht).quantize(Decimal('0.01'))
+            for header_id, baht in POItem.objects.filter(header_id__in=header_ids).order_by()
+            .values('header_id').annotate(baht=Sum('price_baht')).values_list('header_id', 'baht')
+        }
+
+    @staticmethod
+    def reprice(rate, include_complete=False, currency_rate=None, triggered_by=''):
+        """
+        Reprices every open imported PO not at this rate yet. Returns the
+        RepricingLog row (po_count 0 when there was nothing to do).
+        """
+        rate = Decimal(rate).quantize(Decimal('0.0001'))
+        headers = POHeader.objects.filter(order_type='IMPORTED').exclude(exchange_rate=rate)
+        if not include_complete:
+            headers = headers.exclude(status=POHeader.STATUS_COMPLETE)
+
+        with transaction.atomic():
+            old_rates = dict(headers.select_for_update().order_by('id').values_list('id', 'exchange_rate'))
+            ids = list(old_rates)
+            log = RepricingLog(rate=rate, currency_rate=currency_rate, include_complete=include_complete,
+                               triggered_by=triggered_by, po_count=len(ids))
+            if not ids:
+                log.save()
+                return log
+            before = RepricingService._baht_per_po(ids)
+
+            POHeader.objects.filter(id__in=ids).update(exchange_rate=rate)
+            items = POItem.objects.filter(header_id__in=ids)
+
+            # Top-down: Baht per unit ordered of each PO, so one UPDATE covers them all.
+            # Lines of POs without qty or Total Yuan keep their price (as in prorate_costs).
+            top_down = POHeader.objects.filter(id__in=ids).exclude(yuan_mode='bottom-up').filter(total_yuan__gt=0)
+            per_unit = {
+                header_id: total_yuan * rate / total_qty
+                for header_id, total_yuan, total_qty in top_down.order_by()
+                .annotate(total_qty=Sum('items__qty_ordered')).values_list('id', 'total_yuan', 'total_qty')
+                if total_qty
+            }
+            item_count = 0
+            if per_unit:
+                item_count += items.filter(header_id__in=per_unit).update(price_baht=Round(
+                    F('qty_ordered') * Case(
+                        *[When(header_id=header_id, then=Value(value)) for header_id, value in per_unit.items()],
+                        output_field=DecimalField(),
+                    ), 2,
+                ))
+            item_count += items.filter(header__yuan_mode='bottom-up').update(
+                price_baht=Round(F('price_yuan') * Value(rate, output_field=DecimalField()), 2)
+            )
+
+            lines = list(items.order_by('id'))
+            header_by_id = POHeader.objects.in_bulk(ids)
+            changed = [line for line in lines if line.compute_landed_costs(header_by_id[line.header_id])]
+            POItem.objects.bulk_update(changed, POItem.LANDED_COST_FIELDS, batch_size=BATCH_SIZE)
+            # Receipts are valued at unit_cost_thb
+            SkuValuation.mark_receipts_dirty(items.filter(total_received_qty__gt=0))
+
+            after = RepricingService._baht_per_po(ids)
+            log.item_count = item_count
+            log.baht_before = sum(before.values(), Decimal(0))
+            log.baht_after = sum(after.values(), Decimal(0))
+            log.changes = [
+                {
+                    'po_number': header_by_id[header_id].po_number,
+                    'old_rate': str(old_rates[header_id]),
+                    'baht_before': str(before.get(header_id) or Decimal(0)),
+                    'baht_after': str(after.get(header_id) or Decimal(0)),
+                }
+                for header_id in ids
+            ]
+            log.save()
+
+        # Queryset updates skip signals, so bump by hand
+        CacheService.bump_version('POHeader')
+        CacheService.bump_version('POItem')
+        logger.info(f"Repriced {log.po_count} PO(s) / {log.item_count} line(s) at {rate}: "
+                    f"{log.baht_before} -> {log.baht_after} THB")
+        return log
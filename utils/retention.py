@@ -0,0 +1,202 @@
+from datetime import date, timedelta
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Concat, Length, Substr
+from django.utils import timezone
+from inventory.models import JSTStockSnapshot, ImportLog
+from utils.cache_utils import CacheService
+import gzip
+import logging
+import os
+import shutil
+import time
+
+logger = logging.getLogger(__name__)
+
+# Settings name -> default (0 = policy disabled)
+DEFAULTS = {
+    'RETENTION_SNAPSHOT_DAILY_DAYS': 90,
+    'RETENTION_SNAPSHOT_WEEKLY_DAYS': 365,
+    'RETENTION_IMPORT_FILE_COMPRESS_DAYS': 7,
+    'RETENTION_IMPORT_FILE_DELETE_DAYS': 180,
+    'RETENTION_PARTIAL_UPLOAD_DAYS': 2,
+    'RETENTION_ERROR_LOG_DAYS': 30,
+    'RETENTION_ERROR_LOG_MAX_CHARS': 5000,
+    'RETENTION_BATCH_SIZE': 1000,
+}
+
+IMPORTS_DIR = 'imports'
+TRUNCATED_MARK = '\n... [truncated by retention]'
+
+
+def policy(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+class RetentionService:
+    """
+    Keeps the tables and media/imports/ from growing forever
+    (manage.py apply_retention, from cron). Every step works in batches of
+    RETENTION_BATCH_SIZE rows, each in its own short transaction, so imports
+    and page loads never wait long on a lock.
+    Each method returns a count and changes nothing with dry_run=True.
+    """
+
+    @staticmethod
+    def _batches(ids, batch_size):
+        for i in range(0, len(ids), batch_size):
+            yield ids[i:i + batch_size]
+
+    @staticmethod
+    def downsample_snapshots(dry_run=False, today=None):
+        """
+        Daily JSTStockSnapshot rows older than RETENTION_SNAPSHOT_DAILY_DAYS
+        are thinned to the last snapshot of each week per SKU, older than
+        RETENTION_SNAPSHOT_WEEKLY_DAYS to the last of each month.
+        Returns the number of rows deleted.
+        """
+        daily_days = policy('RETENTION_SNAPSHOT_DAILY_DAYS')
+        if not daily_days:
+            return 0
+        weekly_days = max(policy('RETENTION_SNAPSHOT_WEEKLY_DAYS'), daily_days)
+        batch_size = policy('RETENTION_BATCH_SIZE')
+        today = today or date.today()
+        daily_cutoff = today - timedelta(days=daily_days)
+        weekly_cutoff = today - timedelta(days=weekly_days)
+
+        def bucket(snapshot_date):
+            if snapshot_date < weekly_cutoff:
+                return ('month', snapshot_date.year, snapshot_date.month)
+            return ('week',) + tuple(snapshot_date.isocalendar()[:2])
+
+        old = JSTStockSnapshot.objects.filter(snapshot_date__lt=daily_cutoff)
+        sku_ids = list(old.values_list('sku_id', flat=True).distinct().order_by('sku_id'))
+        deleted = 0
+        # A few hundred SKUs at a time keeps the rows held in memory bounded
+        for sku_chunk in RetentionService._batches(sku_ids, 200):
+            rows = old.filter(sku_id__in=sku_chunk).order_by('sku_id', '-snapshot_date', '-id').values_list('id', 'sku_id', 'snapshot_date')
+            seen = set()
+            to_delete = []
+            for snapshot_id, sku_id, snapshot_date in rows:
+                key = (sku_id,) + bucket(snapshot_date)
+                if key in seen:
+                    to_delete.append(snapshot_id)
+                else:
+                    # Newest row of the period stays (closing stock)
+                    seen.add(key)
+            deleted += len(to_delete)
+            if dry_run:
+                continue
+            for ids in RetentionService._batches(to_delete, batch_size):
+                with transaction.atomic():
+                    JSTStockSnapshot.objects.filter(id__in=ids).delete()
+
+        if deleted and not dry_run:
+            CacheService.bump_version('JSTStockSnapshot')
+            logger.info(f"Retention: {deleted} stock snapshots downsampled")
+        return deleted
+
+    @staticmethod
+    def _compress(path):
+        with open(path, 'rb') as src, gzip.open(f"{path}.gz", 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        shutil.copystat(path, f"{path}.gz")
+        os.remove(path)
+        return f"{path}.gz"
+
+    @staticmethod
+    def clean_import_files(dry_run=False):
+        """
+        Uploads in media/imports/: gzip after RETENTION_IMPORT_FILE_COMPRESS_DAYS,
+        delete after RETENTION_IMPORT_FILE_DELETE_DAYS (by file age), abandoned
+        partial uploads after RETENTION_PARTIAL_UPLOAD_DAYS. Files of imports
+        still Pending/Processing are never touched; ImportLog.file_path follows
+        the file. Returns {'compressed': n, 'deleted': n, 'partial_deleted': n}.
+        """
+        result = {'compressed': 0, 'deleted': 0, 'partial_deleted': 0}
+        root = default_storage.path(IMPORTS_DIR)
+        if not os.path.isdir(root):
+            return result
+
+        now = time.time()
+        compress_days = policy('RETENTION_IMPORT_FILE_COMPRESS_DAYS')
+        delete_days = policy('RETENTION_IMPORT_FILE_DELETE_DAYS')
+        busy = set(
+            ImportLog.objects.filter(status__in=['Pending', 'Processing']).exclude(file_path='')
+            .values_list('file_path', flat=True)
+        )
+
+        for entry in os.scandir(root):
+            if not entry.is_file():
+                continue
+            name = f"{IMPORTS_DIR}/{entry.name}"
+            original = name[:-3] if name.endswith('.gz') else name
+            if original in busy:
+                continue
+            age_days = (now - entry.stat().st_mtime) / 86400
+
+            if delete_days and age_days >= delete_days:
+                result['deleted'] += 1
+                if not dry_run:
+                    os.remove(entry.path)
+                    ImportLog.objects.filter(file_path__in=[original, name]).update(file_path='')
+            elif compress_days and age_days >= compress_days and not name.endswith('.gz'):
+                result['compressed'] += 1
+                if not dry_run:
+                    RetentionService._compress(entry.path)
+                    ImportLog.objects.filter(file_path=name).update(file_path=f"{name}.gz")
+
+        partial_days = policy('RETENTION_PARTIAL_UPLOAD_DAYS')
+        partial_root = os.path.join(root, 'partial')
+        if partial_days and os.path.isdir(partial_root):
+            for entry in os.scandir(partial_root):
+                # Resumed uploads touch the .part, so its mtime is the last activity
+                if entry.is_file() and (now - entry.stat().st_mtime) / 86400 >= partial_days:
+                    result['partial_deleted'] += 1
+                    if not dry_run:
+                        os.remove(entry.path)
+
+        if not dry_run and any(result.values()):
+            logger.info(f"Retention: import files {result}")
+        return result
+
+    @staticmethod
+    def truncate_error_logs(dry_run=False):
+        """
+        ImportLog.error_log of imports older than RETENTION_ERROR_LOG_DAYS is
+        cut to its first RETENTION_ERROR_LOG_MAX_CHARS characters (in SQL, the
+        logs are never loaded here). Returns the number of logs truncated.
+        """
+        days = policy('RETENTION_ERROR_LOG_DAYS')
+        if not days:
+            return 0
+        max_chars = policy('RETENTION_ERROR_LOG_MAX_CHARS')
+        batch_size = policy('RETENTION_BATCH_SIZE')
+        cutoff = timezone.now() - timedelta(days=days)
+
+        ids = list(
+            ImportLog.objects.filter(started_at__lt=cutoff)
+            .annotate(log_length=Length('error_log'))
+            .filter(log_length__gt=max_chars + len(TRUNCATED_MARK))
+            .values_list('id', flat=True)
+        )
+        if dry_run:
+            return len(ids)
+        for batch in RetentionService._batches(ids, batch_size):
+            with transaction.atomic():
+                ImportLog.objects.filter(id__in=batch).update(
+                    error_log=Concat(Substr('error_log', 1, max_chars), Value(TRUNCATED_MARK))
+                )
+        if ids:
+            logger.info(f"Retention: {len(ids)} import error logs truncated")
+        return len(ids)
+
+    @staticmethod
+    def run_all(dry_run=False):
+        return {
+            'snapshots_deleted': RetentionService.downsample_snapshots(dry_run=dry_run),
+            'import_files': RetentionService.clean_import_files(dry_run=dry_run),
+            'error_logs_truncated': RetentionService.truncate_error_logs(dry_run=dry_run),
+        }
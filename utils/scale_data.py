@@ -0,0 +1,464 @@
+from django.db import transaction
+from django.db.models import Max, Q
+from inventory.models import (
+    CostLayer, JSTStockSnapshot, LeadTimeStat, MasterItem, POHeader, POItem, POReceiptBatch, ReceivedPOItem,
+    Sale, SaleDailyRollup, SkuForecast, SkuValuation, deferred_sale_signals,
+)
+from utils.cache_utils import CacheService
+from utils.partitions import SalePartitionService
+from utils.profitability import SaleRollupService
+from datetime import date, timedelta
+from decimal import Decimal
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# Everything generated uses these prefixes so it can be cleared again;
+# reserved, so clear() never matches a real SKU, PO or order
+SKU_PREFIX = '__SCALE__-'
+PO_PREFIX = '__SCALE__-PO-'
+ORDER_PREFIX = '__SCALE__-'
+
+CATEGORIES = ['ของเล่น', 'เครื่องครัว', 'อุปกรณ์ไฟฟ้า', 'เครื่องเขียน', 'กีฬา', 'ความงาม', 'สัตว์เลี้ยง', 'รถยนต์', 'บ้านและสวน', 'แฟชั่น']
+FORMATS = ['ชิ้น', 'แพ็ค', 'กล่อง', 'ชุด']
+PLATFORMS = ['Shopee', 'Lazada', 'TikTok']
+PLATFORM_WEIGHTS = [0.5, 0.3, 0.2]
+SHOPS = ['JST Official', 'JST Outlet', 'JST Mall']
+
+# Rows per scale factor 1.0
+ITEMS_PER_SCALE = 1000
+POS_PER_SCALE = 400
+SALES_PER_SCALE = 100_000
+
+BATCH_SIZE = 5000
+
+
+def money(value):
+    return Decimal(f"{value:.2f}")
+
+
+class ScaleDataGenerator:
+    """
+    Reproducible synthetic dataset for scale testing.
+
+    The same (scale, seed, end_date) always produces the same rows. Inserts
+    use bulk_create in batches, so signals don't fire: cache versions are
+    bumped once at the end instead.
+    """
+
+    def __init__(self, scale=1.0, seed=42, years=3, snapshot_days=90, end_date=None, log=None):
+        self.scale = scale
+        self.seed = seed
+        self.years = years
+        self.snapshot_days = snapshot_days
+        self.end_date = end_date or date.today()
+        self.start_date = self.end_date - timedelta(days=365 * years)
+        self.rng = np.random.default_rng(seed)
+        self.log = log or logger.info
+
+        self.n_items = max(int(ITEMS_PER_SCALE * scale), 5)
+        self.n_pos = max(int(POS_PER_SCALE * scale), 2)
+        self.n_sales = max(int(SALES_PER_SCALE * scale), 10)
+
+        self.skus = []
+        self.base_prices = None
+        self.popularity = None
+
+    # --- Cleanup ---
+
+    @staticmethod
+    def clear():
+        """
+        Deletes previously generated rows (matched by prefix).
+
+        Children first, in dependency order, so the cascades find little
+        left to collect. Sales go in batches with their per-row signals
+        deferred (no valuation UPDATE or cache bump per sale), PO lines
+        with their POs. The derived rows of the generated SKUs go too, so
+        nothing is left to revalue; caches are bumped once at the end.
+        """
+        skus = MasterItem.objects.filter(product_code__startswith=SKU_PREFIX)
+        sales = Sale.objects.filter(Q(order_id__startswith=ORDER_PREFIX) | Q(sku__in=skus))
+        with transaction.atomic(), deferred_sale_signals():
+            # delete() loads the rows it deletes; a batch at a time
+            while True:
+                pks = list(sales.values_list('pk', flat=True)[:BATCH_SIZE])
+                if not pks:
+                    break
+                Sale.objects.filter(pk__in=pks).delete()
+            POHeader.objects.filter(po_number__startswith=PO_PREFIX).delete()
+            for model in (CostLayer, SaleDailyRollup, SkuValuation, SkuForecast, JSTStockSnapshot):
+                model.objects.filter(sku__in=skus).delete()
+            LeadTimeStat.objects.filter(scope=LeadTimeStat.SCOPE_SKU, key__startswith=SKU_PREFIX).delete()
+            skus.delete()
+        CacheService.bump_version(*CacheService.TRACKED_MODELS)
+
+    # --- Generation ---
+
+    def generate(self):
+        counts = {}
+        with transaction.atomic():
+            counts['items'] = self.create_items()
+            counts['pos'], counts['po_items'], counts['batches'], counts['receipts'] = self.create_purchase_orders()
+            counts['sales'] = self.create_sales()
+            # Profitability report rows; costs follow with the first update_valuation
+            SaleRollupService.refresh(MasterItem.objects.filter(product_code__startswith=SKU_PREFIX).values('pk'))
+            counts['snapshots'] = self.create_snapshots()
+        # bulk_create skips the signals that normally do this
+        CacheService.bump_version(*CacheService.TRACKED_MODELS)
+        return counts
+
+    def _prepare_items(self):
+        rng = self.rng
+        self.skus = [f"{SKU_PREFIX}{i:06d}" for i in range(1, self.n_items + 1)]
+        self.base_prices = np.round(rng.lognormal(mean=5.0, sigma=0.8, size=self.n_items), 2)
+        # Long tail: a few SKUs sell most of the volume
+        weights = 1.0 / np.arange(1, self.n_items + 1) ** 1.1
+        self.popularity = rng.permutation(weights / weights.sum())
+
+    def create_items(self):
+        self._prepare_items()
+        rng = self.rng
+        categories = rng.choice(CATEGORIES, size=self.n_items)
+        formats = rng.choice(FORMATS, size=self.n_items)
+        min_limits = rng.integers(0, 50, size=self.n_items)
+        stock = rng.integers(0, 500, size=self.n_items)
+        # ~10% sold out, ~15% below min limit
+        stock[rng.random(self.n_items) < 0.10] = 0
+        low = rng.random(self.n_items) < 0.15
+        stock[low] = (min_limits[low] * rng.random(low.sum())).astype(int)
+        favourites = rng.random(self.n_items) < 0.05
+
+        items = []
+        for i, sku in enumerate(self.skus):
+            price = self.base_prices[i]
+            items.append(MasterItem(
+                product_code=sku,
+                name=f"สินค้าทดสอบ {categories[i]} #{i + 1}",
+                product_format=formats[i],
+                category=categories[i],
+                current_stock=int(stock[i]),
+                min_limit=int(min_limits[i]),
+                is_favourite=bool(favourites[i]),
+                shopee_price=money(price),
+                lazada_price=money(price * 1.03),
+                tiktok_price=money(price * 0.97),
+            ))
+        MasterItem.objects.bulk_create(items, batch_size=BATCH_SIZE)
+        # bulk_create skips the signals: queue every SKU for a full valuation
+        # (never valued = whole history, on the next `manage.py update_valuation`)
+        SkuValuation.objects.bulk_create(
+            [SkuValuation(sku_id=sku, dirty_from=self.start_date) for sku in self.skus], batch_size=BATCH_SIZE
+        )
+        self.log(f"MasterItem: {len(items)}")
+        return len(items)
+
+    def create_purchase_orders(self):
+        rng = self.rng
+        today = self.end_date
+        span_days = (self.end_date - self.start_date).days
+
+        headers = []
+        plans = []  # per header: list of (sku index, qty, yuan), receipt plan
+        for n in range(1, self.n_pos + 1):
+            imported = rng.random() < 0.7
+            shipping_type = str(rng.choice(['CAR', 'SHIP'])) if imported else None
+            order_date = self.start_date + timedelta(days=int(rng.integers(0, span_days)))
+            if shipping_type == 'CAR':
+                lead = 14
+            elif shipping_type == 'SHIP':
+                lead = 25
+            else:
+                lead = int(rng.integers(3, 8))
+            estimated_date = order_date + timedelta(days=lead)
+            exchange_rate = round(float(rng.uniform(4.7, 5.3)), 4) if imported else 1.0
+
+            n_lines = int(rng.integers(1, 8))
+            sku_idx = rng.choice(self.n_items, size=min(n_lines, self.n_items), replace=False, p=self.popularity)
+            qtys = rng.integers(10, 500, size=len(sku_idx))
+            unit_yuan = self.base_prices[sku_idx] / 5 * rng.uniform(0.3, 0.6, size=len(sku_idx))
+            total_yuan = float((qtys * unit_yuan).sum())
+
+            # Receipt plan: older POs are mostly received, recent ones mostly not
+            age = (today - estimated_date).days
+            roll = rng.random()
+            if age < 0:
+                received_fraction = 0.0
+            elif roll < 0.8:
+                received_fraction = 1.0
+            elif roll < 0.9:
+                received_fraction = float(rng.uniform(0.3, 0.9))
+            else:
+                received_fraction = 0.0
+            n_batches = 2 if received_fraction > 0 and rng.random() < 0.25 else 1
+
+            headers.append(POHeader(
+                po_number=f"{PO_PREFIX}{n:06d}",
+                order_type='IMPORTED' if imported else 'DOMESTIC',
+                shipping_type=shipping_type,
+                order_date=order_date,
+                estimated_date=estimated_date,
+                exchange_rate=Decimal(str(exchange_rate)),
+                total_yuan=money(total_yuan) if imported else Decimal('0'),
+                shipping_rate_thb_cbm=money(rng.uniform(3500, 6500)) if imported else Decimal('0'),
+                bill_date=order_date,
+                status=POHeader.STATUS_PENDING,
+            ))
+            plans.append((sku_idx, qtys, unit_yuan, exchange_rate, received_fraction, n_batches, estimated_date))
+
+        POHeader.objects.bulk_create(headers, batch_size=BATCH_SIZE)
+        headers = list(POHeader.objects.filter(po_number__startswith=PO_PREFIX).order_by('po_number'))
+
+        # Items (received totals filled in from the plan)
+        po_items = []
+        item_receipts = []  # parallel to po_items: list of (qty, cbm, weight) per batch
+        for header, (sku_idx, qtys, unit_yuan, rate, fraction, n_batches, _) in zip(headers, plans):
+            total_ordered = 0
+            total_received = 0
+            for j, idx in enumerate(sku_idx):
+                qty = int(qtys[j])
+                received = int(qty * fraction)
+                split = [received] if n_batches == 1 else [received // 2, received - received // 2]
+                per_batch = [(q, round(q * 0.002, 4), round(q * 0.35, 2)) for q in split]
+                price_yuan = float(unit_yuan[j] * qty)
+                po_item = POItem(
+                    header=header,
+                    sku_id=self.skus[idx],
+                    qty_ordered=qty,
+                    price_yuan=Decimal(f"{price_yuan:.4f}"),
+                    price_baht=money(price_yuan * rate),
+                    total_received_qty=received,
+                    total_received_cbm=Decimal(f"{sum(b[1] for b in per_batch):.4f}"),
+                    total_received_weight=money(sum(b[2] for b in per_batch)),
+                )
+                # bulk_create skips save(): fill the stored landed costs here
+                po_item.compute_landed_costs(header)
+                po_items.append(po_item)
+                item_receipts.append(per_batch)
+                total_ordered += qty
+                total_received += received
+            header.status = self._status_for(total_ordered, total_received, header.estimated_date)
+
+        POItem.objects.bulk_create(po_items, batch_size=BATCH_SIZE)
+        POHeader.objects.bulk_update(headers, ['status'], batch_size=BATCH_SIZE)
+        po_items = list(POItem.objects.filter(header__po_number__startswith=PO_PREFIX).order_by('header__po_number', 'id'))
+
+        # Batches + receipts
+        batches = []
+        for header, plan in zip(headers, plans):
+            fraction, n_batches, estimated_date = plan[4], plan[5], plan[6]
+            if fraction <= 0:
+                continue
+            for b in range(n_batches):
+                received_date = estimated_date + timedelta(days=int(self.rng.integers(-3, 10)) + b * 7)
+                batches.append(POReceiptBatch(
+                    header=header, batch_no=b + 1,
+                    bill_date=received_date, received_date=received_date,
+                ))
+        POReceiptBatch.objects.bulk_create(batches, batch_size=BATCH_SIZE)
+        batch_map = {
+            (batch.header_id, batch.batch_no - 1): batch
+            for batch in POReceiptBatch.objects.filter(header__po_number__startswith=PO_PREFIX)
+        }
+
+        receipts = []
+        batch_totals = {}
+        for po_item, per_batch in zip(po_items, item_receipts):
+            for b, (qty, cbm, weight) in enumerate(per_batch):
+                if qty <= 0:
+                    continue
+                batch = batch_map[(po_item.header_id, b)]
+                receipts.append(ReceivedPOItem(
+                    po_item=po_item, batch=batch,
+                    bill_date=batch.bill_date, received_date=batch.received_date,
+                    received_qty=qty,
+                    received_cbm=Decimal(f"{cbm:.4f}"),
+                    received_weight=money(weight),
+                ))
+                totals = batch_totals.setdefault(batch.pk, [0.0, 0.0])
+                totals[0] += cbm
+                totals[1] += weight
+        ReceivedPOItem.objects.bulk_create(receipts, batch_size=BATCH_SIZE)
+
+        for batch in batch_map.values():
+            cbm, weight = batch_totals.get(batch.pk, (0, 0))
+            batch.total_cbm = Decimal(f"{cbm:.4f}")
+            batch.total_weight = money(weight)
+        POReceiptBatch.objects.bulk_update(list(batch_map.values()), ['total_cbm', 'total_weight'], batch_size=BATCH_SIZE)
+
+        self.log(f"POHeader: {len(headers)}, POItem: {len(po_items)}, batches: {len(batch_map)}, receipts: {len(receipts)}")
+        return len(headers), len(po_items), len(batch_map), len(receipts)
+
+    def _status_for(self, total_ordered, total_received, estimated_date):
+        # Same rules as POHeader.update_status, relative to end_date
+        return POHeader.compute_status(1, total_ordered, total_received, estimated_date, self.end_date)
+
+    def sale_columns(self, n, start_date, end_date, order_offset=0):
+        """
+        Vectorised sale rows (numpy arrays). Volume grows over time and
+        peaks on weekends / double-day campaigns (11.11, 12.12 ...).
+        """
+        rng = self.rng
+        span = (end_date - start_date).days + 1
+        days = np.arange(span)
+        day_dates = pd.date_range(start_date, periods=span, freq='D')
+        weight = 1.0 + days / span  # growth
+        weight *= np.where(day_dates.dayofweek >= 5, 1.3, 1.0)
+        weight *= np.where(day_dates.month == day_dates.day, 3.0, 1.0)
+        weight /= weight.sum()
+
+        # Sorted so consecutive lines of one order fall on the same day
+        day_idx = np.sort(rng.choice(span, size=n, p=weight))
+        sku_idx = rng.choice(self.n_items, size=n, p=self.popularity)
+        platform_idx = rng.choice(len(PLATFORMS), size=n, p=PLATFORM_WEIGHTS)
+        qty = rng.choice([1, 1, 1, 1, 2, 2, 3, 5], size=n)
+        price = self.base_prices[sku_idx] * rng.uniform(0.9, 1.05, size=n)
+        total = price * qty
+        # Several lines share an order id (multi-item orders)
+        order_no = order_offset + np.cumsum(rng.random(n) < 0.7)
+        return {
+            'date': np.array([start_date + timedelta(days=int(d)) for d in range(span)])[day_idx],
+            'sku_idx': sku_idx,
+            'platform_idx': platform_idx,
+            'qty': qty,
+            'price': price,
+            'total': total,
+            'order_no': order_no,
+            'shop_idx': rng.integers(0, len(SHOPS), size=n),
+            'cancelled': rng.random(n) < 0.02,
+        }
+
+    def create_sales(self):
+        SalePartitionService.ensure_partitions(self.start_date, self.end_date)
+        chunk = 50_000
+        created = 0
+        order_offset = 0
+        remaining = self.n_sales
+        while remaining > 0:
+            n = min(chunk, remaining)
+            cols = self.sale_columns(n, self.start_date, self.end_date, order_offset)
+            order_offset = int(cols['order_no'].max()) + 1
+            seen = set()
+            sales = []
+            for i in range(n):
+                order_id = f"{ORDER_PREFIX}{PLATFORMS[cols['platform_idx'][i]][:2].upper()}{cols['order_no'][i]:010d}"
+                sku = self.skus[cols['sku_idx'][i]]
+                # The importer aggregates (order_id, sku) to a single row
+                if (order_id, sku) in seen:
+                    continue
+                seen.add((order_id, sku))
+                total = float(cols['total'][i])
+                commission = total * 0.05
+                service = total * 0.02
+                sales.append(Sale(
+                    order_id=order_id,
+                    sku_id=sku,
+                    qty=int(cols['qty'][i]),
+                    price=money(cols['price'][i]),
+                    total_price=money(total),
+                    net_price=money(total - commission - service),
+                    commission_fee=money(commission),
+                    service_fee=money(service),
+                    status='ยกเลิก' if cols['cancelled'][i] else 'Completed',
+                    platform=PLATFORMS[cols['platform_idx'][i]],
+                    date=cols['date'][i],
+                    shop_name=SHOPS[cols['shop_idx'][i]],
+                ))
+            Sale.objects.bulk_create(sales, batch_size=BATCH_SIZE)
+            created += len(sales)
+            remaining -= n
+            self.log(f"Sale: {created}")
+        return created
+
+    def create_snapshots(self):
+        """
+        Daily JST snapshots for the last `snapshot_days` days.
+        snapshot_date is auto_now_add (bulk_create stamps today), so each
+        day is inserted separately and its date fixed with one UPDATE.
+        """
+        rng = self.rng
+        created = 0
+        stock = rng.integers(0, 500, size=self.n_items)
+        for offset in range(self.snapshot_days - 1, -1, -1):
+            snapshot_date = self.end_date - timedelta(days=offset)
+            stock = np.maximum(stock - rng.poisson(3, size=self.n_items) + (rng.random(self.n_items) < 0.05) * 200, 0)
+            last_pk = JSTStockSnapshot.objects.aggregate(m=Max('pk'))['m'] or 0
+            JSTStockSnapshot.objects.bulk_create([
+                JSTStockSnapshot(sku_id=sku, quantity=int(stock[i]), jst_min_limit=10)
+                for i, sku in enumerate(self.skus)
+            ], batch_size=BATCH_SIZE)
+            JSTStockSnapshot.objects.filter(pk__gt=last_pk).update(snapshot_date=snapshot_date)
+            created += self.n_items
+        self.log(f"JSTStockSnapshot: {created}")
+        return created
+
+    # --- Export files for importer benchmarks ---
+
+    def export_files(self, directory, rows=50_000, fmt='xlsx'):
+        """
+        Writes importer-compatible files using this dataset's SKUs:
+          master_items   -> ImportService.import_master_items
+          jst_stock      -> ImportService.import_stock_jst
+          shopee_sales   -> import_sales_data (Thai JST export headers)
+          lazada_sales   -> import_sales_data (English headers)
+        Sales are new orders dated after end_date so an import inserts rows.
+        """
+        if not self.skus:
+            self._prepare_items()
+        os.makedirs(directory, exist_ok=True)
+        rng = self.rng
+        paths = []
+
+        def write(df, name):
+            path = os.path.join(directory, f"{name}.{fmt}")
+            if fmt == 'csv':
+                df.to_csv(path, index=False, encoding='utf-8-sig')
+            else:
+                df.to_excel(path, index=False)
+            paths.append(path)
+            self.log(f"Wrote {path} ({len(df)} rows)")
+
+        write(pd.DataFrame({
+            'รหัสสินค้า': self.skus,
+            'ชื่อสินค้า': [f"สินค้าทดสอบ #{i + 1}" for i in range(self.n_items)],
+            'รูปแบบสินค้า': rng.choice(FORMATS, size=self.n_items),
+            'Type': rng.choice(CATEGORIES, size=self.n_items),
+            'สินค้าคงเหลือ': rng.integers(0, 500, size=self.n_items),
+            'Min_Limit': rng.integers(0, 50, size=self.n_items),
+            'Note': '',
+        }), 'master_items')
+
+        write(pd.DataFrame({
+            'รหัสSKU': self.skus,
+            'ชื่อสินค้า': [f"สินค้าทดสอบ #{i + 1}" for i in range(self.n_items)],
+            'จํานวนที่ใช้ได้': rng.integers(0, 500, size=self.n_items),
+            'จำนวนน้อยสุดในการเติมสินค้า (MIN)': rng.integers(0, 50, size=self.n_items),
+            'หมายเหตุสินค้า': '',
+        }), 'jst_stock')
+
+        export_start = self.end_date + timedelta(days=1)
+        for platform, name, headers in (
+            ('Shopee', 'shopee_sales', ['หมายเลขคำสั่งซื้อออนไลน์', 'รหัสสินค้า', 'จำนวน', 'รายละเอียดยอดที่ชำระแล้ว',
+                                         'ราคาต่อชิ้น', 'สถานะคำสั่งซื้อ', 'แพลตฟอร์ม', 'เวลาสั่งซื้อ', 'ร้านค้า']),
+            ('Lazada', 'lazada_sales', ['Order ID', 'SKU', 'Quantity', 'Total Price',
+                                         'Unit Price', 'Status', 'Platform', 'Date', 'Shop Name']),
+        ):
+            cols = self.sale_columns(rows, export_start, export_start + timedelta(days=30))
+            prefix = f"{ORDER_PREFIX}X{platform[:2].upper()}"
+            write(pd.DataFrame({
+                headers[0]: [f"{prefix}{n:010d}" for n in cols['order_no']],
+                headers[1]: [self.skus[i] for i in cols['sku_idx']],
+                headers[2]: cols['qty'],
+                headers[3]: np.round(cols['total'], 2),
+                headers[4]: np.round(cols['price'], 2),
+                headers[5]: np.where(cols['cancelled'], 'ยกเลิก', 'Completed'),
+                headers[6]: platform,
+                headers[7]: pd.to_datetime(cols['date']),
+                headers[8]: [SHOPS[i] for i in cols['shop_idx']],
+            }), name)
+
+        return paths
@@ -0,0 +1,189 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import uuid
+
+logger = logging.getLogger(__name__)
+
+HASH_CHUNK_SIZE = 1024 * 1024  # 1 MB
+
+
+class HashingTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams every uploaded file to a temp file on disk (never into worker
+    memory) and computes its SHA-256 on the way, so duplicate imports can be
+    detected without reading the file a second time.
+    The digest is available as `uploaded_file.sha256`.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        uploaded_file = super().file_complete(file_size)
+        uploaded_file.sha256 = self.hasher.hexdigest()
+        return uploaded_file
+
+
+def hash_file(path):
+    """
+    SHA-256 of a file on disk, read in fixed-size chunks.
+    """
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+
+def uploaded_file_hash(uploaded_file):
+    """
+    Digest from the upload handler, or a streaming hash if the file came
+    through another handler (e.g. tests using the in-memory one).
+    """
+    digest = getattr(uploaded_file, 'sha256', None)
+    if digest:
+        return digest
+    hasher = hashlib.sha256()
+    for block in uploaded_file.chunks(HASH_CHUNK_SIZE):
+        hasher.update(block)
+    uploaded_file.seek(0)
+    return hasher.hexdigest()
+
+
+class ChunkedUploadService:
+    """
+    Resumable uploads for very large exports over slow links.
+
+    The browser sends the file in slices; each slice is appended to
+    MEDIA_ROOT/imports/partial/<upload_id>.part. If the connection drops the
+    client asks for the current offset and continues from there. Metadata
+    sits in a small JSON file next to the part so any gunicorn worker can
+    handle any slice.
+    """
+
+    PARTIAL_DIR = 'imports/partial'
+    UPLOAD_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+    @staticmethod
+    def get_max_size():
+        return getattr(settings, 'IMPORT_MAX_UPLOAD_SIZE', 500 * 1024 * 1024)
+
+    @staticmethod
+    def _paths(upload_id):
+        if not ChunkedUploadService.UPLOAD_ID_RE.match(upload_id or ''):
+            raise ValueError("Invalid upload id")
+        base = default_storage.path(f"{ChunkedUploadService.PARTIAL_DIR}/{upload_id}")
+        return f"{base}.part", f"{base}.json"
+
+    @staticmethod
+    def start(filename, total_size, import_type):
+        """
+        Registers a new upload and returns its id.
+        """
+        if total_size <= 0 or total_size > ChunkedUploadService.get_max_size():
+            raise ValueError(f"File size {total_size} is not allowed")
+
+        upload_id = uuid.uuid4().hex
+        part_path, meta_path = ChunkedUploadService._paths(upload_id)
+        os.makedirs(os.path.dirname(part_path), exist_ok=True)
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'filename': os.path.basename(filename),
+                'size': total_size,
+                'import_type': import_type,
+            }, f)
+        return upload_id
+
+    @staticmethod
+    def get_meta(upload_id):
+        _, meta_path = ChunkedUploadService._paths(upload_id)
+        with open(meta_path) as f:
+            return json.load(f)
+
+    @staticmethod
+    def get_offset(upload_id):
+        """
+        Bytes received so far = where the client should resume.
+        """
+        part_path, _ = ChunkedUploadService._paths(upload_id)
+        return os.path.getsize(part_path)
+
+    @staticmethod
+    def append(upload_id, offset, chunk):
+        """
+        Appends an UploadedFile slice at `offset`. A slice for the wrong
+        offset (duplicate retry, lost slice) is rejected so the client can
+        re-sync. Returns the new offset.
+
+        The offset check and the write hold an exclusive lock on the .part
+        file, so a retry arriving while the first attempt is still writing
+        waits for it and is then rejected instead of appended twice.
+        """
+        meta = ChunkedUploadService.get_meta(upload_id)
+        part_path, _ = ChunkedUploadService._paths(upload_id)
+        with open(part_path, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            current = os.fstat(f.fileno()).st_size
+            if offset != current:
+                raise ValueError(f"Offset mismatch: expected {current}, got {offset}")
+            if current + chunk.size > meta['size']:
+                raise ValueError("Chunk exceeds declared file size")
+            for block in chunk.chunks(HASH_CHUNK_SIZE):
+                f.write(block)
+            f.flush()
+        # Closing the file releases the lock
+        return current + chunk.size
+
+    @staticmethod
+    def get_hash(upload_id):
+        """
+        SHA-256 of a complete upload. Slices may land on different workers,
+        so the hash is taken once here (streamed) and kept in the metadata.
+        """
+        meta = ChunkedUploadService.get_meta(upload_id)
+        part_path, meta_path = ChunkedUploadService._paths(upload_id)
+        size = os.path.getsize(part_path)
+        if size != meta['size']:
+            raise ValueError(f"Upload incomplete: {size} of {meta['size']} bytes")
+
+        if not meta.get('sha256'):
+            meta['sha256'] = hash_file(part_path)
+            with open(meta_path, 'w') as f:
+                json.dump(meta, f)
+        return meta['sha256']
+
+    @staticmethod
+    def finish(upload_id):
+        """
+        Moves a complete upload into imports/ and returns
+        (storage name, original filename, import_type, sha256, size).
+        """
+        file_hash = ChunkedUploadService.get_hash(upload_id)
+        meta = ChunkedUploadService.get_meta(upload_id)
+        part_path, meta_path = ChunkedUploadService._paths(upload_id)
+
+        name = default_storage.get_available_name(f"imports/{meta['filename']}")
+        os.replace(part_path, default_storage.path(name))
+        os.remove(meta_path)
+        return name, meta['filename'], meta['import_type'], file_hash, meta['size']
+
+    @staticmethod
+    def discard(upload_id):
+        for path in ChunkedUploadService._paths(upload_id):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
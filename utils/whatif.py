@@ -0,0 +1,187 @@
+from django.db.models import Sum
+from inventory.models import POHeader, POItem, ReceivedPOItem
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+MAX_SCENARIOS = 200
+
+
+class WhatIfService:
+    """
+    Read-only what-if costing of the open POs (status neither Complete nor
+    Draft): what their lines would land at under other exchange / freight
+    rates.
+    Nothing is saved; the same formulas as POHeader.prorate_costs and
+    POItem.compute_landed_costs run over numpy arrays, all lines times all
+    scenarios at once.
+
+    Shipping is projected over the whole order: lines not (fully) received
+    have no CBM yet, so a freight scenario would change nothing. CBM per
+    unit comes from the line's own receipts, else from the SKU's receipt
+    history; lines with neither are counted in 'no_cbm_lines'.
+    Costs at each PO's current rates are the baseline the deltas refer to.
+    """
+
+    @staticmethod
+    def scenarios(exchange_rates=(), shipping_rates=(), shipping_type=''):
+        """
+        Every combination of the given rates. A missing axis keeps each PO's
+        own rate. shipping_type ('SHIP'/'CAR') limits the freight rate to
+        POs shipped that way.
+        """
+        exchange_rates = list(exchange_rates) or [None]
+        shipping_rates = list(shipping_rates) or [None]
+        return [
+            {'exchange_rate': rate, 'shipping_rate_thb_cbm': freight, 'shipping_type': shipping_type or None}
+            for rate in exchange_rates for freight in shipping_rates
+            if rate is not None or freight is not None
+        ]
+
+    @staticmethod
+    def load():
+        """
+        Open PO lines as numpy arrays (two queries). Drafts are not ordered
+        yet and are left out.
+        """
+        import numpy as np
+
+        open_items = POItem.objects.exclude(header__status__in=[POHeader.STATUS_COMPLETE, POHeader.STATUS_DRAFT])
+        rows = list(open_items.order_by('header_id', 'id').values_list(
+            'header_id', 'header__po_number', 'header__order_type', 'header__shipping_type', 'header__yuan_mode',
+            'header__total_yuan', 'header__exchange_rate', 'header__shipping_rate_thb_cbm',
+            'sku_id', 'qty_ordered', 'price_baht', 'total_received_qty', 'total_received_cbm',
+        ))
+        # CBM per unit of each SKU over all its receipts, for lines not received yet
+        history = {
+            row['po_item__sku_id']: float(row['cbm']) / row['qty']
+            for row in ReceivedPOItem.objects.filter(po_item__sku_id__in=open_items.values('sku_id'), received_qty__gt=0)
+            .values('po_item__sku_id').annotate(cbm=Sum('received_cbm'), qty=Sum('received_qty'))
+            if row['qty']
+        }
+
+        po_ids, po_numbers, header_rows, line_header = [], [], [], []
+        for row in rows:
+            if not po_ids or po_ids[-1] != row[0]:
+                po_ids.append(row[0])
+                po_numbers.append(row[1])
+                header_rows.append(row[2:8])
+            line_header.append(len(po_ids) - 1)
+
+        skus = sorted({row[8] for row in rows})
+        sku_index = {sku: i for i, sku in enumerate(skus)}
+        qty = np.array([row[9] for row in rows], dtype=np.float64)
+        received_qty = np.array([row[11] for row in rows], dtype=np.float64)
+        received_cbm = np.array([float(row[12] or 0) for row in rows], dtype=np.float64)
+        sku_cbm = np.array([history.get(row[8], np.nan) for row in rows], dtype=np.float64)
+        cbm_per_unit = np.where(received_qty > 0, received_cbm / np.maximum(received_qty, 1), sku_cbm)
+
+        return {
+            'po_ids': po_ids,
+            'po_numbers': po_numbers,
+            'skus': skus,
+            # per PO
+            'imported': np.array([h[0] == 'IMPORTED' for h in header_rows], dtype=bool),
+            'shipping_type': np.array([h[1] or '' for h in header_rows], dtype=object),
+            'top_down': np.array([h[2] != 'bottom-up' for h in header_rows], dtype=bool),
+            'total_yuan': np.array([float(h[3] or 0) for h in header_rows], dtype=np.float64),
+            'exchange_rate': np.array([float(h[4] or 0) for h in header_rows], dtype=np.float64),
+            'shipping_rate': np.array([float(h[5] or 0) for h in header_rows], dtype=np.float64),
+            # per line
+            'header': np.array(line_header, dtype=np.int64),
+            'sku': np.array([sku_index[row[8]] for row in rows], dtype=np.int64),
+            'qty': qty,
+            'price_baht': np.array([float(row[10] or 0) for row in rows], dtype=np.float64),
+            'cbm': np.maximum(received_cbm, np.nan_to_num(cbm_per_unit) * qty),
+            'no_cbm': np.isnan(cbm_per_unit),
+        }
+
+    @staticmethod
+    def compute(data, scenarios):
+        """
+        Landed cost of every line under the baseline (row 0) and each
+        scenario (rows 1..n), no queries. Returns per-PO and per-SKU
+        (S+1, n) arrays.
+        """
+        import numpy as np
+
+        header = data['header']
+        n_headers = len(data['po_ids'])
+        rates = np.tile(data['exchange_rate'], (len(scenarios) + 1, 1))
+        freights = np.tile(data['shipping_rate'], (len(scenarios) + 1, 1))
+        for s, scenario in enumerate(scenarios, start=1):
+            # Domestic POs are priced in baht already
+            if scenario.get('exchange_rate') is not None:
+                rates[s, data['imported']] = scenario['exchange_rate']
+            if scenario.get('shipping_rate_thb_cbm') is not None:
+                mask = data['shipping_type'] == scenario['shipping_type'] if scenario.get('shipping_type') else slice(None)
+                freights[s, mask] = scenario['shipping_rate_thb_cbm']
+
+        qty = data['qty']
+        line_rate = rates[:, header]
+        old_rate = data['exchange_rate'][header]
+        # Top-down: Total Yuan prorated by qty, then * rate (prorate_costs)
+        total_qty = np.bincount(header, weights=qty, minlength=n_headers)[header]
+        total_yuan = data['total_yuan'][header]
+        prorated = data['top_down'][header] & (total_qty > 0) & (total_yuan > 0)
+        yuan = np.where(prorated, total_yuan * qty / np.maximum(total_qty, 1), 0.0)
+        # Bottom-up (manual baht): the same yuan at the new rate
+        rescaled = np.where(old_rate > 0, data['price_baht'] * line_rate / np.where(old_rate > 0, old_rate, 1), data['price_baht'])
+        baht = np.where(prorated, np.round(yuan * line_rate, 2), np.round(rescaled, 2))
+        shipping = np.round(data['cbm'] * freights[:, header], 2)
+        landed = baht + shipping
+
+        per_po = np.stack([np.bincount(header, weights=row, minlength=n_headers) for row in landed])
+        sku = data['sku']
+        n_skus = len(data['skus'])
+        per_sku = np.stack([np.bincount(sku, weights=row, minlength=n_skus) for row in landed])
+        sku_qty = np.bincount(sku, weights=qty, minlength=n_skus)
+        unit_cost = np.round(per_sku / np.where(sku_qty > 0, sku_qty, 1), 4)
+        return {'per_po': per_po, 'per_sku': per_sku, 'sku_qty': sku_qty, 'unit_cost': unit_cost}
+
+    @staticmethod
+    def simulate(scenarios):
+        """
+        Runs the scenarios against the open POs. Returns plain dicts:
+        totals per scenario, and per PO / per SKU the baseline, the cost
+        under each scenario and the delta (scenario - baseline).
+        """
+        started = time.perf_counter()
+        scenarios = list(scenarios)[:MAX_SCENARIOS]
+        data = WhatIfService.load()
+        result = WhatIfService.compute(data, scenarios)
+        per_po, per_sku, unit_cost = result['per_po'], result['per_sku'], result['unit_cost']
+
+        def series(column):
+            base = float(column[0])
+            return {
+                'baseline': round(base, 2),
+                'costs': [round(float(v), 2) for v in column[1:]],
+                'deltas': [round(float(v) - base, 2) for v in column[1:]],
+            }
+
+        totals = per_po.sum(axis=1)
+        report = {
+            'scenarios': scenarios,
+            'lines': len(data['qty']),
+            'no_cbm_lines': int(data['no_cbm'].sum()),
+            'totals': series(totals),
+            'per_po': [
+                {'po_id': po_id, 'po_number': number, **series(per_po[:, i])}
+                for i, (po_id, number) in enumerate(zip(data['po_ids'], data['po_numbers']))
+            ],
+            'per_sku': [
+                {
+                    'sku': sku,
+                    'qty': int(result['sku_qty'][i]),
+                    **series(per_sku[:, i]),
+                    'unit_cost_baseline': float(unit_cost[0, i]),
+                    'unit_costs': [float(v) for v in unit_cost[1:, i]],
+                }
+                for i, sku in enumerate(data['skus'])
+            ],
+        }
+        report['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"What-if: {report['lines']} lines x {len(scenarios)} scenarios in {report['elapsed_ms']} ms")
+        return report